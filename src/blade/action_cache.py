@@ -0,0 +1,178 @@
+# Copyright (c) 2026 Tencent Inc.
+# All rights reserved.
+#
+# Date:   October 17, 2026
+
+
+"""
+ The action cache, which reuses the outputs of build actions across branches, checkouts
+ and machines.
+
+ An action is keyed by the digest of its rule command and build statement, and the
+ contents of its inputs. The paths in the key are relative to the workspace and most of
+ them are in the build dir, so the outputs are only reused in build dirs of the same name,
+ such as the `build64_release` of another workspace, but not between `build64_release` and
+ `build64_debug`. When the action cache is enabled, the command of a cacheable rule is
+ wrapped as:
+
+    python -m blade.action_cache fetch CACHE_DIR KEY OUTPUTS... -- INPUTS... ||
+    { (COMMAND) && python -m blade.action_cache store CACHE_DIR KEY OUTPUTS... -- INPUTS...; }
+
+ On a cache hit, the outputs are copied from the cache instead of running the command.
+ Files in the cache are read-only and never share inodes with the outputs, so neither
+ touching nor modifying an output in one workspace affects the cache or other workspaces.
+"""
+
+from __future__ import absolute_import
+from __future__ import print_function
+
+import errno
+import os
+import shutil
+import stat
+import sys
+
+from blade.blade_util import md5sum_bytes, md5sum_file
+
+
+# Rules whose outputs can be cached, outputs of them are all explicit outputs.
+CACHEABLE_RULES = frozenset([
+    'ar', 'link', 'solink',
+    'javac',
+    'proto', 'protojava', 'protopython', 'protodescriptors',
+    'thrift',
+])
+
+
+def _md5sum(text):
+    # The text may be unicode in python 2, such as the cc version loaded from json
+    if not isinstance(text, bytes):
+        text = text.encode('utf-8')
+    return md5sum_bytes(text)
+
+
+def wrap_command(command, cache_dir, blade_path, salt=''):
+    """Wrap the command of a rule to fetch its outputs from the cache or store them.
+
+    Args:
+        cache_dir: str, the dir of the action cache.
+        salt: str, other factors which affect the outputs, such as the compiler version.
+    """
+    tool = 'PYTHONPATH=%s:$$PYTHONPATH %s -m blade.action_cache' % (blade_path, sys.executable)
+    # The action_key of build statements is empty if they are not cacheable
+    key = '%s-${action_key}' % _md5sum(command + salt)
+    args = '%s %s ${out} -- ${in} ${action_inputs}' % (cache_dir, key)
+    return '%s fetch %s || { (%s) && %s store %s; }' % (tool, args, command, tool, args)
+
+
+def action_key(outputs, inputs, variables):
+    """The digest of a build statement, used as a part of the key of the action. """
+    entropy = [' '.join(outputs), ' '.join(inputs)]
+    for name in sorted(variables):
+        entropy.append('%s=%s' % (name, variables[name]))
+    return _md5sum('\n'.join(entropy))
+
+
+def _action_digest(key, inputs):
+    """The digest of the action, None if it is not cacheable. """
+    if key.endswith('-'):
+        return None
+    entropy = [key]
+    for path in inputs:
+        if not os.path.isfile(path):
+            return None
+        entropy.append('%s %s' % (path, md5sum_file(path)))
+    return _md5sum('\n'.join(entropy))
+
+
+def _entry_dir(cache_dir, digest):
+    return os.path.join(cache_dir, digest[:2], digest)
+
+
+def _copy_file(src, dst, writable):
+    """Copy the file with its mode, the write permissions are removed or added. """
+    shutil.copyfile(src, dst)
+    mode = stat.S_IMODE(os.stat(src).st_mode)
+    if writable:
+        mode |= stat.S_IWUSR
+    else:
+        mode &= ~(stat.S_IWUSR | stat.S_IWGRP | stat.S_IWOTH)
+    os.chmod(dst, mode)
+
+
+def _remove_file(path):
+    try:
+        os.remove(path)
+    except OSError as e:
+        if e.errno != errno.ENOENT:
+            raise
+
+
+def fetch(cache_dir, key, outputs, inputs):
+    """Copy the outputs from the cache, return whether the action is hit.
+
+    The outputs are always removed on a miss, so the stale outputs are never left.
+    """
+    try:
+        digest = _action_digest(key, inputs)
+        entry = digest and _entry_dir(cache_dir, digest)
+        for i, output in enumerate(outputs):
+            _remove_file(output)
+            if entry:
+                # The copy is newer than inputs for ninja
+                _copy_file(os.path.join(entry, str(i)), output, writable=True)
+        if entry:
+            # Record the last used time, which is used to clean the cache, see build_cache.md
+            os.utime(entry, None)
+        return entry is not None
+    except (IOError, OSError):
+        for output in outputs:
+            try:
+                _remove_file(output)
+            except OSError:
+                pass
+        return False
+
+
+def store(cache_dir, key, outputs, inputs):
+    """Store the outputs into the cache.
+
+    The outputs are put into a temporary dir which is renamed to the entry at last,
+    so a partial entry is never seen by others sharing the cache.
+    """
+    if not all(os.path.isfile(output) for output in outputs):
+        return
+    temp_dir = None
+    try:
+        digest = _action_digest(key, inputs)
+        if not digest:
+            return
+        entry = _entry_dir(cache_dir, digest)
+        if os.path.isdir(entry):
+            return
+        temp_dir = '%s.%s.tmp' % (entry, os.getpid())
+        os.makedirs(temp_dir)
+        for i, output in enumerate(outputs):
+            _copy_file(output, os.path.join(temp_dir, str(i)), writable=False)
+        os.rename(temp_dir, entry)
+    except (IOError, OSError) as e:
+        # Another process may have stored the same entry
+        if temp_dir is None or not os.path.isdir(entry):
+            print('Blade(warning): Failed to store the action cache: %s' % e, file=sys.stderr)
+        if temp_dir:
+            shutil.rmtree(temp_dir, ignore_errors=True)
+
+
+def main(argv):
+    command, cache_dir, key = argv[:3]
+    args = argv[3:]
+    separator = args.index('--')
+    outputs, inputs = args[:separator], args[separator + 1:]
+    if command == 'fetch':
+        return 0 if fetch(cache_dir, key, outputs, inputs) else 1
+    store(cache_dir, key, outputs, inputs)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -19,6 +19,7 @@ import os
 import sys
 import textwrap
 
+from blade import action_cache
 from blade import blade_util
 from blade import config
 from blade import console
@@ -50,6 +51,7 @@ class _NinjaFileHeaderGenerator(object):
         self.build_toolchain = build_toolchain
         self.build_accelerator = blade.build_accelerator
         self.blade = blade
+        self.action_cache_dir = blade.get_action_cache_dir()
 
         self.rules_buf = []
         self.__all_rule_names = set()
@@ -61,6 +63,27 @@ class _NinjaFileHeaderGenerator(object):
     def get_all_rule_names(self):
         return list(self.__all_rule_names)
 
+    def _cacheable_command(self, command, tools, salt=''):
+        """Wrap the command with the action cache if it is enabled.
+
+        Args:
+            tools: list of the executables run by the command, their resolved paths and
+                digests are a part of the key. The command is not cached if any of them is
+                not found, or is built in the build dir, which may be changed by the build.
+            salt: str, other factors which affect the outputs, such as the compiler version.
+        """
+        if not self.action_cache_dir:
+            return command
+        for tool in tools:
+            digest = None
+            if not tool.startswith(self.build_dir + '/'):
+                digest = self.build_toolchain.get_tool_digest(tool)
+            if not digest:
+                console.debug('Not cached, "%s" is not found or is in the build dir' % tool)
+                return command
+            salt += '\n' + digest
+        return action_cache.wrap_command(command, self.action_cache_dir, self.blade_path, salt=salt)
+
     def generate_rule(self, name, command, description=None,
                       depfile=None, generator=False, pool=None,
                       restat=False, rspfile=None,
@@ -102,6 +125,9 @@ class _NinjaFileHeaderGenerator(object):
         self.generate_rule(name='copy',
                            command='cp -f ${in} ${out}',
                            description='COPY ${in} ${out}')
+        self.generate_rule(name='testready',
+                           command='touch ${out}',
+                           description='TEST READY ${out}')
 
     def _get_cc_flags(self):
         """Get the common c/c++ flags."""
@@ -188,19 +214,18 @@ class _NinjaFileHeaderGenerator(object):
         includes = ' '.join(['-I%s' % inc for inc in includes])
 
         self.generate_cc_vars()
+        compile = '%s -o ${out} -MMD -MF ${out}.d -c -fPIC %s %s ${optimize} %s ${cppflags} %s ${includes} ${in}'
+        if cc_config['hdrs_inclusion_in_compile']:
+            compile = self._compile_with_hdrs_inclusion(compile)
         self.generate_rule(name='cc',
-                           command='%s -o ${out} -MMD -MF ${out}.d '
-                                   '-c -fPIC %s %s ${optimize} ${c_warnings} ${cppflags} '
-                                   '%s ${includes} ${in}' % (
-                                       cc, ' '.join(cflags), ' '.join(cppflags), includes),
+                           command=compile % (cc, ' '.join(cflags), ' '.join(cppflags),
+                                              '${c_warnings}', includes),
                            description='CC ${in}',
                            depfile='${out}.d',
                            deps='gcc')
         self.generate_rule(name='cxx',
-                           command='%s -o ${out} -MMD -MF ${out}.d '
-                                   '-c -fPIC %s %s ${optimize} ${cxx_warnings} ${cppflags} '
-                                   '%s ${includes} ${in}' % (
-                                       cxx, ' '.join(cxxflags), ' '.join(cppflags), includes),
+                           command=compile % (cxx, ' '.join(cxxflags), ' '.join(cppflags),
+                                              '${cxx_warnings}', includes),
                            description='CXX ${in}',
                            depfile='${out}.d',
                            deps='gcc')
@@ -227,7 +252,8 @@ class _NinjaFileHeaderGenerator(object):
                            restat=True)
 
         self.generate_rule(name='ar',
-                           command='rm -f $out; ar %s $out $in' % arflags,
+                           command=self._cacheable_command(
+                               'rm -f $out; ar %s $out $in' % arflags, ['ar']),
                            description='AR ${out}')
         link_jobs = config.get_item('link_config', 'link_jobs')
         if link_jobs:
@@ -240,13 +266,17 @@ class _NinjaFileHeaderGenerator(object):
         else:
             pool = None
         self.generate_rule(name='link',
-                           command='%s -o ${out} %s ${ldflags} ${in} ${extra_ldflags}' % (
-                               ld, ' '.join(ldflags)),
+                           command=self._cacheable_command(
+                               '%s -o ${out} %s ${ldflags} ${in} ${extra_ldflags}' % (
+                                   ld, ' '.join(ldflags)),
+                               [ld], salt=self.build_toolchain.get_cc_version()),
                            description='LINK ${out}',
                            pool=pool)
         self.generate_rule(name='solink',
-                           command='%s -o ${out} -shared %s ${ldflags} ${in} ${extra_ldflags}' % (
-                               ld, ' '.join(ldflags)),
+                           command=self._cacheable_command(
+                               '%s -o ${out} -shared %s ${ldflags} ${in} ${extra_ldflags}' % (
+                                   ld, ' '.join(ldflags)),
+                               [ld], salt=self.build_toolchain.get_cc_version()),
                            description='SHAREDLINK ${out}',
                            pool=pool)
         self.generate_rule(name='strip',
@@ -270,25 +300,29 @@ class _NinjaFileHeaderGenerator(object):
                 protocpythonpluginflags =
                 '''))
         self.generate_rule(name='proto',
-                           command='%s --proto_path=. %s -I=`dirname ${in}` '
-                                   '--cpp_out=%s ${protocflags} ${protoccpppluginflags} ${in}' % (
-                                       protoc, protobuf_incs, self.build_dir),
+                           command=self._cacheable_command(
+                               '%s --proto_path=. %s -I=`dirname ${in}` '
+                               '--cpp_out=%s ${protocflags} ${protoccpppluginflags} ${in}' % (
+                                   protoc, protobuf_incs, self.build_dir), [protoc]),
                            description='PROTOC ${in}')
         self.generate_rule(name='protojava',
-                           command='%s --proto_path=. %s --java_out=%s/`dirname ${in}` '
-                                   '${protocjavapluginflags} ${in}' % (
-                                       protoc_java, protobuf_java_incs, self.build_dir),
+                           command=self._cacheable_command(
+                               '%s --proto_path=. %s --java_out=%s/`dirname ${in}` '
+                               '${protocjavapluginflags} ${in}' % (
+                                   protoc_java, protobuf_java_incs, self.build_dir), [protoc_java]),
                            description='PROTOCJAVA ${in}')
         self.generate_rule(name='protopython',
-                           command='%s --proto_path=. %s -I=`dirname ${in}` '
-                                   '--python_out=%s ${protocpythonpluginflags} ${in}' % (
-                                       protoc, protobuf_incs, self.build_dir),
+                           command=self._cacheable_command(
+                               '%s --proto_path=. %s -I=`dirname ${in}` '
+                               '--python_out=%s ${protocpythonpluginflags} ${in}' % (
+                                   protoc, protobuf_incs, self.build_dir), [protoc]),
                            description='PROTOCPYTHON ${in}')
         self.generate_rule(name='protodescriptors',
-                           command='%s --proto_path=. %s -I=`dirname ${first}` '
-                                   '--descriptor_set_out=${out} --include_imports '
-                                   '--include_source_info ${in}' % (
-                                       protoc, protobuf_incs),
+                           command=self._cacheable_command(
+                               '%s --proto_path=. %s -I=`dirname ${first}` '
+                               '--descriptor_set_out=${out} --include_imports '
+                               '--include_source_info ${in}' % (
+                                   protoc, protobuf_incs), [protoc]),
                            description='PROTODESCRIPTORS ${in}')
         protoc_go_plugin = proto_config['protoc_go_plugin']
         if protoc_go_plugin:
@@ -358,11 +392,11 @@ class _NinjaFileHeaderGenerator(object):
                 classpath = .
                 javacflags =
                 '''))
+        # The classes dir is also removed on a cache hit, it is not cached
         self.generate_rule(name='javac',
-                           command='rm -fr ${classes_dir} && mkdir -p ${classes_dir} && '
-                                   '%s && sleep 0.01 && '
-                                   '%s cf ${out} -C ${classes_dir} .' % (
-                                       ' '.join(cmd), jar),
+                           command='rm -fr ${classes_dir} && ' + self._cacheable_command(
+                               'mkdir -p ${classes_dir} && %s && sleep 0.01 && '
+                               '%s cf ${out} -C ${classes_dir} .' % (' '.join(cmd), jar), [javac, jar]),
                            description='JAVAC ${out}')
 
     def generate_java_resource_rules(self):
@@ -449,10 +483,10 @@ class _NinjaFileHeaderGenerator(object):
             thrift = thrift.replace('//', self.build_dir + '/')
             thrift = thrift.replace(':', '/')
         self.generate_rule(name='thrift',
-                           command='%s --gen %s '
-                                   '-I . %s -I `dirname ${in}` '
-                                   '-out %s/`dirname ${in}` ${in}' % (
-                                       thrift, gen_params, incs, self.build_dir),
+                           command=self._cacheable_command(
+                               '%s --gen %s -I . %s -I `dirname ${in}` '
+                               '-out %s/`dirname ${in}` ${in}' % (
+                                   thrift, gen_params, incs, self.build_dir), [thrift]),
                            description='THRIFT ${in}')
 
     def generate_python_rules(self):
@@ -551,11 +585,31 @@ class _NinjaFileHeaderGenerator(object):
                   profile = %s
                   compiler = %s
                 ''') % (scm, revision, url, self.options.profile, '%s %s' % (cc, cc_version)))
+        scm_obj = scm + '.o'
+        if config.get_item('cc_config', 'hdrs_inclusion_in_compile'):
+            scm_obj += ' | %s.H' % scm_obj  # The '.H' file is an implicit output of compiling
         self._add_rule(textwrap.dedent('''\
                 build %s: cxx %s
                   cppflags = -w -O2
                   cxx_warnings =
-                ''') % (scm + '.o', scm))
+                ''') % (scm_obj, scm))
+
+    @staticmethod
+    def _compile_with_hdrs_inclusion(compile):
+        """Make the compile command also generate the '.H' file as '${out}.H'.
+
+        The inclusion stack lines ('.', '..', ...) printed by '-H' are written into
+        the '.H' file, the diagnostics are kept in the output and the trailing
+        'Multiple include guards may be useful for:' part is dropped. The '.H' file
+        is removed if the compiling fails, so an incomplete one is never verified.
+        """
+        hdrs_filter = ('awk -v H=${out}.H \'BEGIN { printf "" > H } '
+                       '/^\\.+ / { print > H; next } '
+                       '/^Multiple include guards may be useful for:/ { skip = 1 } '
+                       '!skip { print }\'')
+        return ('%s -H 2> ${out}.H.log; ret=$$?; %s ${out}.H.log; rm -f ${out}.H.log; '
+                '[ $$ret -eq 0 ] || rm -f ${out}.H; exit $$ret' % (
+                compile, hdrs_filter))
 
     def _builtin_command(self, builder, prefix='', suffix=''):
         cmd = ['PYTHONPATH=%s:$$PYTHONPATH' % self.blade_path]
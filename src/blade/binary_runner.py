@@ -15,16 +15,117 @@
 
 from __future__ import absolute_import
 
+import json
 import os
 import shutil
+import stat
 import subprocess
 import sys
 
 from blade import config
 from blade import console
+from blade import stat_cache
 from blade.blade_util import environ_add_path
 
 
+_FICLONE = 0x40049409  # The ioctl request to clone a file, from linux/fs.h
+
+
+def _reflink_file(src, dst):
+    """Make a copy-on-write clone of the file, return False if it is not supported. """
+    if not sys.platform.startswith('linux'):
+        return False
+    import fcntl  # pylint: disable=import-outside-toplevel
+    try:
+        with open(src, 'rb') as src_file:
+            with open(dst, 'wb') as dst_file:
+                fcntl.ioctl(dst_file.fileno(), _FICLONE, src_file.fileno())
+    except (IOError, OSError):
+        if os.path.exists(dst):
+            os.remove(dst)
+        return False
+    shutil.copystat(src, dst)
+    return True
+
+
+def _copy_file(src, dst, link_mode):
+    if link_mode == 'hardlink':
+        try:
+            os.link(src, dst)
+            return
+        except OSError:
+            pass  # Such as cross devices, fallback to copy
+    if not _reflink_file(src, dst):
+        shutil.copy2(src, dst)
+
+
+def _materialize(src, dst, link_mode):
+    """Make the file or directory `src` available as `dst` in the runfiles dir. """
+    if link_mode == 'symlink':
+        os.symlink(os.path.abspath(src), dst)
+        return
+    if not os.path.isdir(src):
+        _copy_file(src, dst, link_mode)
+        return
+    for root, _, files in os.walk(src, followlinks=True):
+        dst_root = os.path.normpath(os.path.join(dst, os.path.relpath(root, src)))
+        os.mkdir(dst_root)
+        for name in files:
+            _copy_file(os.path.join(root, name), os.path.join(dst_root, name), link_mode)
+
+
+def _path_signature(path, follow_links):
+    """Return a json serializable signature of a file or directory tree.
+
+    The signature changes when any file in it is added, removed or modified.
+    """
+    stat_path = os.stat if follow_links else os.lstat
+    def file_signature(path):
+        st = stat_path(path)
+        if stat.S_ISLNK(st.st_mode):
+            return ['->', os.readlink(path)]
+        if stat.S_ISDIR(st.st_mode):
+            return []
+        return [st.st_size, st.st_mtime]
+
+    try:
+        signature = file_signature(path)
+        if signature != []:
+            return signature
+        for root, dirs, files in os.walk(path, followlinks=follow_links):
+            dirs.sort()
+            for name in sorted(dirs + files):
+                file_path = os.path.join(root, name)
+                signature.append([os.path.relpath(file_path, path)] + file_signature(file_path))
+        return signature
+    except OSError:
+        return None
+
+
+def _remove_path(path):
+    if os.path.isdir(path) and not os.path.islink(path):
+        shutil.rmtree(path)
+    else:
+        os.remove(path)
+
+
+def _test_data_source_path(target, src):
+    """Return the path of the test data source relative to the workspace. """
+    if src.startswith('//'):
+        return src[2:]
+    return os.path.join(target.path, src)
+
+
+def test_data_sources(target):
+    """Return the source paths of the valid test data of the target. """
+    sources = []
+    for i in target.attr.get('testdata', []):
+        src = i[0] if isinstance(i, tuple) else i
+        if '..' not in src:
+            sources.append(_test_data_source_path(target, src))
+    return sources
+
+
 class BinaryRunner(object):
     """BinaryRunner. """
 
@@ -80,8 +181,8 @@ class BinaryRunner(object):
     def _prepare_env(self, target):
         """Prepare the test environment. """
         runfiles_dir = self._runfiles_dir(target)
-        shutil.rmtree(runfiles_dir, ignore_errors=True)
-        os.mkdir(runfiles_dir)
+        test_data = self._collect_test_data(target)
+        kept_test_data = self._reuse_runfiles(runfiles_dir, test_data)
         # Make a symbolic link of build_dir because dynamic linked binary need to load shared
         # libraries from this path
         build_dir_name = os.path.basename(self.build_dir)
@@ -102,7 +203,7 @@ class BinaryRunner(object):
                 continue
             os.symlink(src, dst)
 
-        self._prepare_test_data(target)
+        self._prepare_test_data(target, runfiles_dir, test_data, kept_test_data)
         run_env = dict(os.environ)
         environ_add_path(run_env, 'LD_LIBRARY_PATH', runfiles_dir)
         run_lib_paths = config.get_item('cc_binary_config', 'run_lib_paths')
@@ -119,12 +220,14 @@ class BinaryRunner(object):
 
         return run_env
 
-    def _prepare_test_data(self, target):
-        if 'testdata' not in target.attr:
-            return
-        runfiles_dir = self._runfiles_dir(target)
+    def _collect_test_data(self, target):
+        """Return the test data of the target as a list of (src, dest).
+
+        The dest is a normalized path relative to the runfiles dir.
+        """
+        test_data = []
         dest_list = []
-        for i in target.attr['testdata']:
+        for i in target.attr.get('testdata', []):
             if isinstance(i, tuple):
                 src, dest = i
             else:
@@ -132,48 +235,113 @@ class BinaryRunner(object):
             if '..' in src:
                 target.warning('Relative path is not allowed in testdata. Ignored %s.' % src)
                 continue
-            if src.startswith('//'):
-                src = src[2:]
-            else:
-                src = os.path.join(target.path, src)
+            src = _test_data_source_path(target, src)
             if dest.startswith('//'):
                 dest = dest[2:]
             dest = os.path.normpath(dest)
             self.__check_test_data_dest(target, dest, dest_list)
             dest_list.append(dest)
-            dest_path = os.path.join(runfiles_dir, dest)
-            if os.path.exists(dest_path):
-                target.warning('"%s" already existed, could not prepare testdata.' % dest)
-                continue
-            try:
-                os.makedirs(os.path.dirname(dest_path))
-            except OSError:
-                pass
-
-            if os.path.isfile(src):
-                shutil.copy2(src, dest_path)
-            elif os.path.isdir(src):
-                shutil.copytree(src, dest_path)
+            if stat_cache.exists(src):
+                test_data.append((src, dest))
 
-        self._prepare_extra_test_data(target)
+        test_data += self._collect_extra_test_data(target)
+        return test_data
 
-    def _prepare_extra_test_data(self, target):
-        """Prepare extra test data specified in the .testdata file if it exists. """
+    def _collect_extra_test_data(self, target):
+        """Collect extra test data specified in the .testdata file if it exists. """
+        test_data = []
         testdata = os.path.join(self.build_dir, target.path,
                                 '%s.testdata' % target.name)
         if os.path.isfile(testdata):
-            runfiles_dir = self._runfiles_dir(target)
             for line in open(testdata):
                 data = line.strip().split()
                 if len(data) == 1:
                     src, dst = data[0], ''
                 else:
                     src, dst = data[0], data[1]
-                dst = os.path.join(runfiles_dir, dst)
-                dst_dir = os.path.dirname(dst)
-                if not os.path.isdir(dst_dir):
-                    os.makedirs(dst_dir)
-                shutil.copy2(src, dst)
+                if not dst or dst.endswith('/'):
+                    dst = os.path.join(dst, os.path.basename(src))
+                test_data.append((src, os.path.normpath(dst)))
+        return test_data
+
+    def _reuse_runfiles(self, runfiles_dir, test_data):
+        """Clean the runfiles dir but keep the test data which is not changed since last run.
+
+        The sources and the prepared results of the test data are recorded in the manifest
+        file, test data is reused if neither of them is changed.
+
+        Returns:
+            dict{dest: manifest entry} of the kept test data.
+        """
+        link_mode = config.get_item('global_config', 'testdata_link_mode')
+        manifest = {}
+        try:
+            with open(runfiles_dir + '.manifest') as f:
+                manifest = json.load(f)
+        except (IOError, ValueError):
+            pass
+        kept = {}
+        if manifest.get('link_mode') == link_mode and os.path.isdir(runfiles_dir):
+            entries = manifest.get('entries', {})
+            for src, dest in test_data:
+                entry = entries.get(dest)
+                if (entry and entry[0] == src and
+                        entry[1] == _path_signature(src, follow_links=True) and
+                        entry[2] == _path_signature(os.path.join(runfiles_dir, dest),
+                                                    follow_links=False)):
+                    kept[dest] = entry
+
+        if not kept:
+            shutil.rmtree(runfiles_dir, ignore_errors=True)
+            os.mkdir(runfiles_dir)
+            return kept
+
+        # Remove all other files, include the outputs of the last run
+        parent_dirs = set()
+        for dest in kept:
+            parent = os.path.dirname(dest)
+            while parent:
+                parent_dirs.add(parent)
+                parent = os.path.dirname(parent)
+        for root, dirs, files in os.walk(runfiles_dir):
+            rel_root = os.path.relpath(root, runfiles_dir)
+            for name in dirs[:]:
+                rel_path = os.path.normpath(os.path.join(rel_root, name))
+                if rel_path in kept or rel_path not in parent_dirs:
+                    dirs.remove(name)
+                    if rel_path not in kept:
+                        _remove_path(os.path.join(root, name))
+            for name in files:
+                rel_path = os.path.normpath(os.path.join(rel_root, name))
+                if rel_path not in kept:
+                    os.remove(os.path.join(root, name))
+        return kept
+
+    def _prepare_test_data(self, target, runfiles_dir, test_data, kept_test_data):
+        """Prepare test data in the runfiles dir and save the manifest. """
+        link_mode = config.get_item('global_config', 'testdata_link_mode')
+        entries = {}
+        for src, dest in test_data:
+            if dest in kept_test_data:
+                entries[dest] = kept_test_data[dest]
+                continue
+            dest_path = os.path.join(runfiles_dir, dest)
+            if os.path.lexists(dest_path):
+                target.warning('"%s" already existed, could not prepare testdata.' % dest)
+                continue
+            try:
+                os.makedirs(os.path.dirname(dest_path))
+            except OSError:
+                pass
+            _materialize(src, dest_path, link_mode)
+            entries[dest] = [src,
+                             _path_signature(src, follow_links=True),
+                             _path_signature(dest_path, follow_links=False)]
+
+        manifest_path = runfiles_dir + '.manifest'
+        with open(manifest_path + '.tmp', 'w') as f:
+            json.dump({'link_mode': link_mode, 'entries': entries}, f)
+        os.rename(manifest_path + '.tmp', manifest_path)
 
     def _clean_target(self, target):
         """Clean the executive environment."""
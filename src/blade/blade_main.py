@@ -87,7 +87,9 @@ from blade import build_manager
 from blade import command_line
 from blade import config
 from blade import console
+from blade import stat_cache
 from blade import target
+from blade import trace
 from blade.blade_util import find_blade_root_dir, find_file_bottom_up
 from blade.blade_util import get_cwd, iteritems, to_string
 from blade.blade_util import lock_file, unlock_file
@@ -211,62 +213,99 @@ def backend_builder_options(options):
     return build_options
 
 
-def _show_slow_builds(build_start_time, show_builds_slower_than):
+# The supported versions of the .ninja_log file, they have the same format of lines
+_NINJA_LOG_VERSIONS = ('# ninja log v5', '# ninja log v6', '# ninja log v7')
+
+
+def _read_ninja_log(build_start_time):
+    """Read the edges built since build_start_time from the .ninja_log.
+
+    Returns:
+        list of (start_ms, end_ms, output), the time is relative to the start of ninja.
+    """
     build_dir = build_manager.instance.get_build_dir()
     with open(os.path.join(build_dir, '.ninja_log')) as f:
         head = f.readline()
-        if '# ninja log v5' not in head:
+        if not any(version in head for version in _NINJA_LOG_VERSIONS):
             console.warning('Unknown ninja log version: %s' % head)
-            return
-        build_times = []
+            return []
+        entries = []
         for line in f.readlines():
             start_time, end_time, timestamp, target, cmdhash = line.split()
-            cost_time = (int(end_time) - int(start_time)) / 1000.0  # ms -> s
             timestamp = int(timestamp)
-            if timestamp >= build_start_time and cost_time > show_builds_slower_than:
-                build_times.append((cost_time, target))
-        if build_times:
-            console.notice('Slow build targets:')
-            for cost_time, target in sorted(build_times):
-                console.notice('%.4gs\t%s' % (cost_time, target), prefix=False)
-
-
-def _show_progress(p, rf):
+            if timestamp > 10 ** 10:
+                # High resolution mtime in nanoseconds, recorded by newer ninja
+                timestamp /= 1e9
+            if timestamp >= build_start_time:
+                entries.append((int(start_time), int(end_time), target))
+        return entries
+
+
+def _show_slow_builds(ninja_log_entries, show_builds_slower_than):
+    build_times = []
+    for start_time, end_time, target in ninja_log_entries:
+        cost_time = (end_time - start_time) / 1000.0  # ms -> s
+        if cost_time > show_builds_slower_than:
+            build_times.append((cost_time, target))
+    if build_times:
+        console.notice('Slow build targets:')
+        for cost_time, target in sorted(build_times):
+            console.notice('%.4gs\t%s' % (cost_time, target), prefix=False)
+
+
+def _show_progress(p, wf, test_ready=None):
+    """Show the output of ninja as soon as it arrives from the pipe.
+
+    The reading blocks until a line is available, and ends when ninja exits.
+
+    Args:
+        test_ready: callable(stamp), called when the test ready stamp is built,
+            the output of the stamp is not shown. It is called in the reading loop,
+            so it should only record the stamp rather than prepare the test.
+    """
     # Convert description message such as '[1/123] CC xxx.cc' into progress bar
     progress_re = re.compile(r'^\[(\d+)/(\d+)\]\s+')
+    test_ready_re = re.compile(r'\s(\S+\.test_ready)\b')
+    quiet = console.verbosity_le('quiet')
     try:
-        while True:
-            p.poll()
-            line = rf.readline().strip()
-            if line:
-                m = progress_re.match(line)
-                if m:
-                    console.show_progress_bar(int(m.group(1)), int(m.group(2)))
-                else:
-                    console.clear_progress_bar()
-                    console.output(line)
-            elif p.returncode is not None:
-                break
-            else:
-                # Avoid cost too much cpu
-                time.sleep(0.1)
+        # Don't use `for line in p.stdout`, which reads ahead in python 2
+        for line in iter(p.stdout.readline, ''):
+            if wf:
+                wf.write(line)
+            line = line.strip()
+            if not line:
+                continue
+            m = progress_re.match(line)
+            ready = test_ready and test_ready_re.search(line)
+            if ready:
+                test_ready(ready.group(1))
+            if m and quiet:
+                console.show_progress_bar(int(m.group(1)), int(m.group(2)))
+            elif not ready:
+                console.clear_progress_bar()
+                console.output(line)
     finally:
         console.clear_progress_bar()
+        p.wait()
 
 
-def _run_ninja(cmd, options):
+def _run_ninja(cmd, options, test_ready=None):
     cmdstr = subprocess.list2cmdline(cmd)
-    if console.verbosity_compare(options.verbosity, 'quiet') > 0:
+    # The output of ninja is parsed to know which tests are ready
+    if test_ready is None and console.verbosity_compare(options.verbosity, 'quiet') > 0:
         return _run_backend_builder(cmdstr)
-    ninja_output = 'blade-bin/ninja_output.log'
-    with open(ninja_output, 'w', buffering=1) as wf, open(ninja_output, 'r', buffering=1) as rf:
-        os.environ['NINJA_STATUS'] = '[%f/%t] '  # The progress depends on this format
-        p = subprocess.Popen(cmdstr, shell=True, stdout=wf, stderr=subprocess.STDOUT)
-        _show_progress(p, rf)
+    os.environ['NINJA_STATUS'] = '[%f/%t] '  # The progress depends on this format
+    p = subprocess.Popen(cmdstr, shell=True, stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                         universal_newlines=True)
+    if options.keep_ninja_output:
+        with open('blade-bin/ninja_output.log', 'w') as wf:
+            _show_progress(p, wf, test_ready)
+    else:
+        _show_progress(p, None, test_ready)
     return p.returncode
 
 
-def _ninja_build(options):
+def _ninja_build(options, test_ready=None):
     cmd = ['ninja', '-f', build_manager.instance.build_script()]
     cmd += backend_builder_options(options)
     cmd.append('-j%s' % build_manager.instance.build_jobs_num())
@@ -275,19 +314,33 @@ def _ninja_build(options):
     if console.verbosity_compare(options.verbosity, 'verbose') >= 0:
         cmd.append('-v')
     build_start_time = time.time()
-    ret = _run_ninja(cmd, options)
-    if options.show_builds_slower_than is not None:
-        _show_slow_builds(build_start_time, options.show_builds_slower_than)
+    with trace.span('ninja'):
+        ret = _run_ninja(cmd, options, test_ready)
+    # The build outputs are changed by ninja
+    stat_cache.invalidate()
+    if options.show_builds_slower_than is not None or trace.enabled():
+        ninja_log_entries = _read_ninja_log(build_start_time)
+        if options.show_builds_slower_than is not None:
+            _show_slow_builds(ninja_log_entries, options.show_builds_slower_than)
+        trace.add_ninja_log(ninja_log_entries, build_start_time)
     return ret
 
 
-def build(options):
+def build(options, test_ready=None):
+    """Build the targets.
+
+    Args:
+        test_ready: callable(stamp), called as soon as a test is built, see `_show_progress`.
+    """
     _check_code_style(_TARGETS)
     console.info('Building...')
     console.flush()
-    returncode = _ninja_build(options)
-    if returncode == 0 and not build_manager.instance.verify():
-        returncode = 1
+    returncode = _ninja_build(options, test_ready)
+    if returncode == 0:
+        with trace.span('verify'):
+            # Tests are running in other threads in the pipelined mode, see `test`
+            if not build_manager.instance.verify(fork_workers=test_ready is None):
+                returncode = 1
     if returncode != 0:
         console.error('Build failure.')
     else:
@@ -304,11 +357,17 @@ def run(options):
 
 
 def test(options):
+    if options.pipeline and not options.no_build and not options.dry_run:
+        # Run tests while building, each test is run as soon as it is built
+        with trace.span('test'):
+            return build_manager.instance.test(
+                    build=lambda test_ready: build(options, test_ready))
     if not options.no_build:
         ret = build(options)
         if ret != 0:
             return ret
-    return build_manager.instance.test()
+    with trace.span('test'):
+        return build_manager.instance.test()
 
 
 def clean(options):
@@ -496,19 +555,22 @@ def run_subcommand(command, options, targets, blade_path, build_dir):
                              command)
 
     # Build the targets
-    build_manager.instance.load_targets()
+    with trace.span('load'):
+        build_manager.instance.load_targets()
     if _check_error_log('load'):
         return 1
     if options.stop_after == 'load':
         return 0
 
-    build_manager.instance.analyze_targets()
+    with trace.span('analyze'):
+        build_manager.instance.analyze_targets()
     if _check_error_log('analyze'):
         return 1
     if options.stop_after == 'analyze':
         return 0
 
-    build_manager.instance.generate()
+    with trace.span('generate'):
+        build_manager.instance.generate()
     if _check_error_log('generate'):
         return 1
     if options.stop_after == 'generate':
@@ -579,12 +641,24 @@ def _main(blade_path, argv):
 
     generate_scm(build_dir)
 
+    if options.trace:
+        trace.enable()
+
     lock_file_fd = lock_workspace(build_dir)
     try:
         if options.profiling:
             return run_subcommand_profile(command, options, targets, blade_path, build_dir)
         return run_subcommand(command, options, targets, blade_path, build_dir)
     finally:
+        if build_manager.instance:
+            build_manager.instance.get_build_toolchain().dump_probe_cache()
+        queries, syscalls = stat_cache.counters()
+        console.debug('Stat cache: %d queries, %d system calls saved' % (queries, queries - syscalls))
+        if options.trace:
+            trace_file = os.path.join(build_dir, 'blade.trace.json')
+            trace.dump(trace_file)
+            console.info('Trace file `%s` is generated, you can open it in chrome://tracing' %
+                         trace_file)
         unlock_workspace(lock_file_fd)
 
 
@@ -52,9 +52,11 @@ def md5sum_str(content):
 
 def md5sum_file(file_name):
     """Calculate md5sum of a file. """
+    m = md5.md5()
     with open(file_name, 'rb') as f:
-        digest = md5sum_bytes(f.read())
-    return digest
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            m.update(chunk)
+    return m.hexdigest()
 
 
 def md5sum(obj):
@@ -225,6 +227,18 @@ def cpu_count():
         return int(os.sysconf('SC_NPROCESSORS_ONLN'))
 
 
+def memory_available_mb():
+    """Return the size of available physical memory in MB, or None if it is unknown"""
+    try:
+        with open('/proc/meminfo') as f:
+            for line in f:
+                if line.startswith('MemAvailable:'):
+                    return int(line.split()[1]) // 1024
+    except (IOError, ValueError):
+        pass
+    return None
+
+
 _TRANS_TABLE = (str if _IN_PY3 else string).maketrans(',-/.+*', '______')
 
 
@@ -240,10 +254,20 @@ else:
         return d.iteritems(**kw)
 
 
+def compile_file_content(filename, content):
+    """Compile code content as filename into a code object"""
+    return compile(content, filename, 'exec')
+
+
+def exec_code(code, globals, locals):
+    """Execute a compiled code object"""
+    # pylint: disable=exec-used
+    exec(code, globals, locals)
+
+
 def exec_file_content(filename, content, globals, locals):
     """Execute code content as filename"""
-    # pylint: disable=exec-used
-    exec(compile(content, filename, 'exec'), globals, locals)
+    exec_code(compile_file_content(filename, content), globals, locals)
 
 
 def exec_file(filename, globals, locals):
@@ -253,16 +277,18 @@ def exec_file(filename, globals, locals):
         exec_file_content(filename, f.read(), globals, locals)
 
 
-def source_location(filename):
-    """Return source location of current call stack from filename"""
-    lineno = 1
-
+def source_lineno(filename):
+    """Return the line number of filename in current call stack, 1 if not found"""
     # See https://stackoverflow.com/questions/17407119/python-inspect-stack-is-slow
     frame = inspect.currentframe()
     while frame:
         if frame.f_code.co_filename.endswith(filename):
-            lineno = frame.f_lineno
-            break
+            return frame.f_lineno
         frame = frame.f_back
+    return 1
+
+
+def source_location(filename):
+    """Return source location of current call stack from filename"""
     # NOTE: The ':0:'(column) is required for VSCode problem matcher
-    return '%s:%s:0:' % (filename, lineno)
+    return '%s:%s:0:' % (filename, source_lineno(filename))
@@ -25,13 +25,15 @@ class BuildAccelerator(object):
         # ccache
         self.blade_root_dir = blade_root_dir
         self.__toolchain = toolchain
-        self.ccache_installed = self._check_ccache_install()
+        self.ccache_installed = self._check_ccache_install(toolchain)
 
         # distcc
         self.distcc_env_prepared = False
-        self.distcc_installed = self._check_distcc_install()
         self.distcc_host_list = distcc_host_list or os.environ.get('DISTCC_HOSTS', '')
-        if self.distcc_installed and self.distcc_host_list:
+        # Distcc is only checked when there are hosts to use
+        self.distcc_installed = bool(self.distcc_host_list) and toolchain.cached_probe(
+            'distcc_installed', self._check_distcc_install)
+        if self.distcc_installed:
             self.distcc_env_prepared = True
             console.info('Distcc is enabled automatically due DISTCC_HOSTS set')
             distcc_log_file = os.environ.get('DISTCC_LOG', '')
@@ -39,7 +41,7 @@ class BuildAccelerator(object):
                 console.debug('Distcc log: %s' % distcc_log_file)
 
     @staticmethod
-    def _check_ccache_install():
+    def _check_ccache_install(toolchain):
         """Check ccache is installed or not. """
         CC = os.getenv('CC')
         CXX = os.getenv('CXX')
@@ -47,7 +49,10 @@ class BuildAccelerator(object):
         if CC and os.path.basename(CC) == 'ccc-analyzer' and CXX and os.path.basename(CXX) == 'c++-analyzer':
             console.debug('Ccache is disabled for scan-build')
             return False
+        return toolchain.cached_probe('ccache_installed', BuildAccelerator._probe_ccache)
 
+    @staticmethod
+    def _probe_ccache():
         try:
             p = subprocess.Popen(
                 ['ccache', '-V'],
@@ -24,9 +24,10 @@ import time
 from blade import config
 from blade import console
 from blade import target
-from blade.binary_runner import BinaryRunner
+from blade import trace
+from blade.binary_runner import BinaryRunner, test_data_sources
 from blade.toolchain import ToolChain
-from blade.blade_util import cpu_count, md5sum_file
+from blade.blade_util import cpu_count, iteritems, md5sum_file
 from blade.build_accelerator import BuildAccelerator
 from blade.dependency_analyzer import analyze_deps
 from blade.load_build_files import load_targets
@@ -40,6 +41,16 @@ instance = None
 # Start of rule hash line in each per-target ninja file
 _NINJA_FILE_RULE_HASH_START = '#RuleHash='
 
+# The index of rule hashes of all per-target ninja files
+_RULE_HASH_INDEX_FILE = '.blade_rule_hash.json'
+
+# The dir of the sharded ninja manifests and the index of targets in them
+_NINJA_SHARDS_DIR = '.ninja_shards'
+_NINJA_SHARD_INDEX_FILE = 'index.json'
+
+# Start of the rules of each target in a sharded ninja manifest
+_NINJA_SHARD_TARGET_START = '#Target='
+
 
 class Blade(object):
     """Blade. A blade manager class. """
@@ -91,6 +102,12 @@ class Blade(object):
         # command line targets.
         self.__target_database = {}
 
+        # The reverse dependency index, it is updated when targets register their
+        # deps, so the dependents of a target or dir can be found quickly, even
+        # during loading.
+        self.__target_dependents = {}  # dict{dep_key: [target]}
+        self.__dir_dependents = {}  # dict{dep_dir: target}, the first dependent only
+
         # The targets to be build after loading the build files.
         self.__build_targets = {}
 
@@ -103,21 +120,29 @@ class Blade(object):
 
         self.__build_time = time.time()
 
-        self.__build_toolchain = ToolChain()
+        self.__build_toolchain = ToolChain(os.path.join(build_dir, '.blade_toolchain.json'))
         self.build_accelerator = BuildAccelerator(self.__root_dir, self.__build_toolchain)
         self.__build_jobs_num = 0
         self.__test_jobs_num = 0
 
         self.svn_root_dirs = []
 
-        self._verify_history_path = os.path.join(build_dir, '.blade_verify.json')
-        self._verify_history = {
-            'header_inclusion_dependencies': {},  # path(.H) -> mtime(modification time)
-        }
+        self._verify_history_path = os.path.join(build_dir, '.blade_verify.history')
+        self._verify_history = {}  # path(.H) -> mtime(modification time)
+        self._verify_history_records = 0  # Number of records in the history file
         self.__build_script = os.path.join(self.__build_dir, 'build.ninja')
 
         self.__all_rule_names = []
 
+        # dict{stamp: key}, stamps which are built as soon as the tests are built
+        self.__test_ready_stamps = {}
+
+        # dict{key: [rule hash, whether has ninja file]}, so the per-target ninja files of
+        # unchanged targets need not to be opened
+        self._rule_hash_index_path = os.path.join(build_dir, _RULE_HASH_INDEX_FILE)
+        self._rule_hash_index = {}
+        self._rule_hash_index_changed = False
+
     def load_targets(self):
         """Load the targets. """
         console.info('Loading BUILD files...')
@@ -168,41 +193,87 @@ class Blade(object):
         if self.__command != 'query':
             self.generate_build_rules()
 
-    def verify(self):
-        """Verify specific targets after build is complete. """
-        verify_history = self._load_verify_history()
-        header_inclusion_history = verify_history['header_inclusion_dependencies']
+    def verify(self, fork_workers=True):
+        """Verify specific targets after build is complete.
+
+        Args:
+            fork_workers: bool, see `parse_inclusion_files`.
+        """
+        from blade.cc_targets import parse_inclusion_files  # pylint: disable=import-outside-toplevel
+        history = self._load_verify_history()
+        old_history = dict(history)
         error = 0
         verify_details = {}
         verify_suppress = config.get_item('cc_config', 'hdr_dep_missing_suppress')
         # Sorting helps reduce jumps between BUILD files when fixng reported problems
+        verify_targets = []
         for k in sorted(self.__expanded_command_targets):
             target = self.__build_targets[k]
             if target.type.startswith('cc_') and target.srcs:
-                ok, details = target.verify_hdr_dep_missing(
-                        header_inclusion_history,
-                        verify_suppress.get(target.key, {}))
-                if not ok:
-                    error += 1
-                if details:
-                    verify_details[target.key] = details
+                verify_targets.append((target, target.collect_inclusion_files(history)))
+        # Parse all of the changed inclusion files at once, which can be done in parallel
+        inclusion_stacks = parse_inclusion_files(
+                [path for _, files in verify_targets for _, path, _ in files], self.__build_dir,
+                fork_workers)
+        for target, inclusion_files in verify_targets:
+            ok, details = target.verify_hdr_dep_missing(
+                    history,
+                    verify_suppress.get(target.key, {}),
+                    inclusion_files,
+                    inclusion_stacks)
+            if not ok:
+                error += 1
+            if details:
+                verify_details[target.key] = details
         self._dump_verify_details(verify_details)
-        self._dump_verify_history()
+        self._dump_verify_history(old_history)
         return error == 0
 
     def _load_verify_history(self):
+        """Load the verify history.
+
+        The history file is a log of records, each line is either 'mtime path' which
+        sets the mtime of the path, or '- path' which removes the path.
+        """
         if os.path.exists(self._verify_history_path):
             with open(self._verify_history_path) as f:
                 try:
-                    self._verify_history = json.load(f)
+                    for line in f:
+                        mtime, path = line.rstrip('\n').split(' ', 1)
+                        if mtime == '-':
+                            self._verify_history.pop(path, None)
+                        else:
+                            self._verify_history[path] = int(mtime)
+                        self._verify_history_records += 1
                 except Exception as e:  # pylint: disable=broad-except
                     console.warning('Error loading %s, ignored. Reason: %s' % (
                         self._verify_history_path, str(e)))
+                    self._verify_history = {}
+                    self._verify_history_records = -1  # Force rewriting
         return self._verify_history
 
-    def _dump_verify_history(self):
-        with open(self._verify_history_path, 'w') as f:
-            json.dump(self._verify_history, f, indent=4)
+    def _dump_verify_history(self, old_history):
+        """Append the changes since old_history to the history file.
+
+        The file is rewritten when there are too many obsolete records.
+        """
+        history = self._verify_history
+        records = ['%s %s\n' % (mtime, path) for path, mtime in iteritems(history)
+                   if old_history.get(path) != mtime]
+        records += ['- %s\n' % path for path in old_history if path not in history]
+        if not records:
+            return
+        if 0 <= self._verify_history_records and (
+                self._verify_history_records + len(records) <= 2 * len(history) + 1000):
+            with open(self._verify_history_path, 'a') as f:
+                f.writelines(records)
+            self._verify_history_records += len(records)
+            return
+        tmp_path = self._verify_history_path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            f.writelines('%s %s\n' % (mtime, path) for path, mtime in sorted(iteritems(history)))
+        os.rename(tmp_path, self._verify_history_path)
+        self._verify_history_records = len(history)
 
     def _dump_verify_details(self, verify_details):
         verify_details_file = os.path.join(self.__build_dir, 'blade_hdr_verify.details')
@@ -225,8 +296,13 @@ class Blade(object):
         runner = BinaryRunner(self.__options, self.__target_database, self.__build_targets)
         return runner.run_target(target)
 
-    def test(self):
-        """Run tests. """
+    def test(self, build=None):
+        """Run tests.
+
+        Args:
+            build: callable(test_ready), build the targets and call test_ready(stamp) as soon
+                as the test ready stamp is built. If it is specified, tests are run while building.
+        """
         exclude_tests = []
         if self.__options.exclude_tests:
             exclude_tests = target.normalize(self.__options.exclude_tests.split(','),
@@ -239,7 +315,12 @@ class Blade(object):
                 self.__build_targets,
                 exclude_tests,
                 self.test_jobs_num())
-        return test_runner.run()
+        if build is None:
+            return test_runner.run()
+
+        def build_tests(test_ready):
+            return build(lambda stamp: test_ready(self.__test_ready_stamps[stamp]))
+        return test_runner.run(build_tests)
 
     @staticmethod
     def _remove_paths(paths):
@@ -381,6 +462,17 @@ class Blade(object):
     def get_build_time(self):
         return self.__build_time
 
+    def get_blade_path(self):
+        """The path of the `blade` python module. """
+        return self.__blade_path
+
+    def get_action_cache_dir(self):
+        """The dir of the action cache, empty if it is disabled. """
+        cache_dir = config.get_item('global_config', 'action_cache_dir')
+        if not cache_dir:
+            return ''
+        return os.path.abspath(os.path.expanduser(cache_dir))
+
     def get_build_dir(self):
         """The current building dir. """
         return self.__build_dir
@@ -431,6 +523,22 @@ class Blade(object):
             console.fatal('Target %s is duplicate in //%s/BUILD' % (target.name, target.path))
         self.__target_database[key] = target
 
+    def register_dependency(self, target, dkey):
+        """Record that the target depends on the target with dkey."""
+        self.__target_dependents.setdefault(dkey, []).append(target)
+        self.__dir_dependents.setdefault(dkey.split(':')[0], target)
+
+    def find_dependent(self, dkey):
+        """Find a target which depends on the target with dkey directly."""
+        dependents = self.__target_dependents.get(dkey)
+        if dependents:
+            return dependents[0]
+        return None
+
+    def find_dir_dependent(self, dir):
+        """Find a target which depends on any target in the dir directly."""
+        return self.__dir_dependents.get(dir)
+
     def _is_real_target_type(self, target_type):
         """The types that shouldn't be registered into blade manager.
 
@@ -453,6 +561,44 @@ class Blade(object):
             pass
         return None
 
+    def _load_rule_hash_index(self):
+        try:
+            with open(self._rule_hash_index_path) as f:
+                self._rule_hash_index = json.load(f)
+        except (IOError, ValueError):
+            self._rule_hash_index = {}
+
+    def _save_rule_hash_index(self):
+        if not self._rule_hash_index_changed:
+            return
+        # Write to a temporary file at first to avoid a broken index when interrupted
+        temp_path = self._rule_hash_index_path + '.tmp'
+        with open(temp_path, 'w') as f:
+            json.dump(self._rule_hash_index, f)
+        os.rename(temp_path, self._rule_hash_index_path)
+        self._rule_hash_index_changed = False
+
+    def _cached_rule_hash(self, target, ninja_file):
+        """Return the cached rule hash and whether the ninja file exists.
+
+        The rule hash is looked up in the index, or read from the ninja file if it is not
+        in the index, such as the index was generated by an older version.
+        """
+        cached = self._rule_hash_index.get(target.key)
+        if cached:
+            rule_hash, has_ninja_file = cached
+            if has_ninja_file and not os.path.exists(ninja_file):
+                return None, False
+            return rule_hash, has_ninja_file
+        rule_hash = self._read_rule_hash(ninja_file)
+        return rule_hash, rule_hash is not None
+
+    def _update_rule_hash_index(self, target, rule_hash, has_ninja_file):
+        item = [rule_hash, has_ninja_file]
+        if self._rule_hash_index.get(target.key) != item:
+            self._rule_hash_index[target.key] = item
+            self._rule_hash_index_changed = True
+
     def _write_target_ninja_file(self, target, ninja_file, rules, rule_hash):
         """Generate per-target ninja file"""
         target_dir = target._target_file_path('')
@@ -462,32 +608,45 @@ class Blade(object):
             f.write('%s%s\n\n' % (_NINJA_FILE_RULE_HASH_START, rule_hash))
             f.writelines(rules)
 
-    def _find_or_generate_target_ninja_file(self, target):
+    @staticmethod
+    def _target_ninja_file(target):
         # The `.build.` infix is used to avoid the target ninja file with the
         # same name as the main build.ninja file (when target.name == 'build')
-        target_ninja = target._target_file_path('%s.build.ninja' % target.name)
+        return target._target_file_path('%s.build.ninja' % target.name)
 
-        old_rule_hash = self._read_rule_hash(target_ninja)
-        rule_hash = target.rule_hash()
-
-        if rule_hash == old_rule_hash:
-            console.debug('Using cached %s' % target_ninja)
-            # If the command is "clean", we still need to generate rules to obtain the clean list
-            if self.__command == 'clean':
-                target.get_rules()
-            return target_ninja
+    def _find_target_ninja_file(self, target, target_ninja):
+        """Find the up to date per-target ninja file.
 
-        rules = target.get_rules()
+        Returns:
+            (rule_hash, found, has_ninja_file)
+        """
+        old_rule_hash, has_ninja_file = self._cached_rule_hash(target, target_ninja)
+        with trace.span(target.fullname, 'rule_hash'):
+            rule_hash = target.rule_hash()
+
+        if rule_hash != old_rule_hash:
+            return rule_hash, False, False
+
+        console.debug('Using cached %s' % target_ninja)
+        # If the command is "clean", we still need to generate rules to obtain the clean list
+        if self.__command == 'clean':
+            target.get_rules()
+        self._update_rule_hash_index(target, rule_hash, has_ninja_file)
+        return rule_hash, True, has_ninja_file
+
+    def _generate_target_ninja_file(self, target, target_ninja, rule_hash):
+        with trace.span(target.fullname, 'get_rules'):
+            rules = target.get_rules()
+        self._update_rule_hash_index(target, rule_hash, bool(rules))
         if rules:
             console.debug('Generating %s' % target_ninja)
             self._write_target_ninja_file(target, target_ninja, rules, rule_hash)
             return target_ninja
-
         return None
 
-    def gen_targets_rules(self):
-        """Get the build rules and return to the object who queries this. """
-        rules_buf = []
+    def _targets_to_generate(self):
+        """Return targets to generate rules for, in the sorted order. """
+        targets = []
         skip_test = getattr(self.__options, 'no_test', False)
         skip_package = not getattr(self.__options, 'generate_package', False)
         for k in self.__sorted_targets_keys:
@@ -502,12 +661,279 @@ class Blade(object):
                 continue
             if skip_package and target.type == 'package' and k not in self.__direct_targets:
                 continue
+            targets.append(target)
+        return targets
+
+    def _gen_per_target_rules(self, targets):
+        """Generate rules into a ninja file per target, which are included by `include`.
+
+        Returns:
+            (rules_buf, read_rules), read_rules(key) returns the rules text of the target.
+        """
+        rules_buf = []
+        self._load_rule_hash_index()
+
+        target_ninjas = {}  # {key: target_ninja}
+        missed_targets = []
+        for target in targets:
+            target_ninja = self._target_ninja_file(target)
+            rule_hash, found, has_ninja_file = self._find_target_ninja_file(target, target_ninja)
+            if not found:
+                missed_targets.append((target, target_ninja, rule_hash))
+            elif has_ninja_file:
+                target_ninjas[target.key] = target_ninja
+
+        generated_ninjas = [self._generate_target_ninja_file(*args) for args in missed_targets]
+        for (target, _, _), target_ninja in zip(missed_targets, generated_ninjas):
+            if target_ninja:
+                target_ninjas[target.key] = target_ninja
 
-            target_ninja = self._find_or_generate_target_ninja_file(target)
+        # Include the ninja files in the sorted order, regardless of the generating order
+        for target in targets:
+            target_ninja = target_ninjas.get(target.key)
             if target_ninja:
                 target._remove_on_clean(target_ninja)
                 rules_buf += 'include %s\n' % target_ninja
 
+        self._save_rule_hash_index()
+
+        def read_rules(key):
+            target_ninja = target_ninjas.get(key)
+            if not target_ninja:
+                return ''
+            with open(target_ninja) as f:
+                return f.read()
+
+        return rules_buf, read_rules
+
+    @staticmethod
+    def _ninja_shard_name(target):
+        """Targets are sharded by their top level dirs. """
+        top_dir = target.path.split('/', 1)[0]
+        if top_dir in ('', '.'):
+            return '.root'  # Dirs starting with '.' are never loaded, so it can't conflict
+        return top_dir
+
+    def _ninja_shard_file(self, shard):
+        return os.path.join(self.__build_dir, _NINJA_SHARDS_DIR, '%s.ninja' % shard)
+
+    def _ninja_shard_cache_file(self, shard):
+        """The rules of all known targets in the shard, including those not in this build. """
+        return os.path.join(self.__build_dir, _NINJA_SHARDS_DIR, '%s.rules' % shard)
+
+    def _load_ninja_shard_index(self):
+        """Load the index, which is {shard: {key: [rule_hash, has_rules, in_shard_file]}}. """
+        try:
+            with open(os.path.join(self.__build_dir, _NINJA_SHARDS_DIR, _NINJA_SHARD_INDEX_FILE)) as f:
+                return json.load(f)
+        except (IOError, ValueError):
+            return {}
+
+    def _save_ninja_shard_index(self, index):
+        index_path = os.path.join(self.__build_dir, _NINJA_SHARDS_DIR, _NINJA_SHARD_INDEX_FILE)
+        temp_path = index_path + '.tmp'
+        with open(temp_path, 'w') as f:
+            json.dump(index, f, separators=(',', ':'))
+        os.rename(temp_path, index_path)
+
+    @staticmethod
+    def _read_ninja_shard(shard_file):
+        """Read the rules of each target in the shard, return {key: rules}. """
+        target_rules = {}
+        try:
+            with open(shard_file) as f:
+                rules = None
+                for line in f:
+                    if line.startswith(_NINJA_SHARD_TARGET_START):
+                        rules = []
+                        target_rules[line[len(_NINJA_SHARD_TARGET_START):].strip()] = rules
+                    elif rules is not None:
+                        rules.append(line)
+        except IOError:
+            pass
+        return target_rules
+
+    @staticmethod
+    def _write_ninja_shard(shard_file, keys, target_rules):
+        # Write to a temporary file at first to avoid a broken shard when interrupted
+        temp_path = shard_file + '.tmp'
+        with open(temp_path, 'w') as f:
+            for key in keys:
+                rules = target_rules.get(key)
+                if rules:
+                    f.write('%s%s\n' % (_NINJA_SHARD_TARGET_START, key))
+                    f.writelines(rules)
+        os.rename(temp_path, shard_file)
+
+    @staticmethod
+    def _generate_target_rules(target):
+        with trace.span(target.fullname, 'get_rules'):
+            return target.get_rules()
+
+    def _gen_sharded_targets_rules(self, targets):
+        """Generate rules into a ninja file per top level dir, which are included by `subninja`.
+
+        Ninja opens and blade checks much less files than a ninja file per target. Rule
+        hashes of targets are kept in the index of shards, and rules of targets are kept in
+        the cache file of each shard, including targets which are not in this build, so a
+        subset build doesn't lose them. A shard file only contains the targets in this build,
+        it is rewritten only when any of them is changed, added or removed.
+
+        Returns:
+            (rules_buf, read_rules), read_rules(key) returns the rules text of the target.
+        """
+        shards = {}  # {shard: [target]}, targets are in the sorted order
+        for target in targets:
+            shards.setdefault(self._ninja_shard_name(target), []).append(target)
+
+        shards_dir = os.path.join(self.__build_dir, _NINJA_SHARDS_DIR)
+        if not os.path.exists(shards_dir):
+            os.makedirs(shards_dir)
+        # Dirs whose BUILD files are loaded, targets which are not in them any more are dropped
+        loaded_dirs = set(key.split(':', 1)[0] for key in self.__target_database)
+        old_index = self._load_ninja_shard_index()
+        index = dict(old_index)  # Shards which are not built this time are kept for later builds
+        dirty_shards = {}  # {shard: {key: rules}}, all known targets in shards to be rewritten
+        dirty_caches = set()  # Shards whose cache files are to be rewritten
+        missed_targets = []  # [(target, shard)]
+        for shard, shard_targets in iteritems(shards):
+            old_entries = old_index.get(shard, {})
+            entries = index[shard] = {}
+            for key, entry in iteritems(old_entries):
+                if len(entry) == 3 and (key in self.__target_database or
+                                        key.split(':', 1)[0] not in loaded_dirs):
+                    entries[key] = [entry[0], entry[1], False]
+            missed_keys = set()
+            for target in shard_targets:
+                with trace.span(target.fullname, 'rule_hash'):
+                    rule_hash = target.rule_hash()
+                entry = entries.get(target.key)
+                if entry and entry[0] == rule_hash:
+                    entry[2] = True
+                    # If the command is "clean", we still need to generate rules to obtain the clean list
+                    if self.__command == 'clean':
+                        target.get_rules()
+                else:
+                    entries[target.key] = [rule_hash, False, True]
+                    missed_keys.add(target.key)
+            shard_file = self._ninja_shard_file(shard)
+            for target in shard_targets:
+                target._remove_on_clean(shard_file, self._ninja_shard_cache_file(shard))
+            if entries != old_entries or not os.path.exists(shard_file):
+                target_rules = self._read_ninja_shard(self._ninja_shard_cache_file(shard))
+                for key in list(entries):
+                    if entries[key][1] and key not in target_rules:
+                        if entries[key][2]:
+                            missed_keys.add(key)
+                        else:
+                            del entries[key]  # Not in this build and its rules are lost
+                missed_targets += [(t, shard) for t in shard_targets if t.key in missed_keys]
+                dirty_shards[shard] = target_rules
+                if missed_keys or set(entries) != set(old_entries):
+                    dirty_caches.add(shard)
+
+        generated_rules = [self._generate_target_rules(target) for target, _ in missed_targets]
+        for (target, shard), rules in zip(missed_targets, generated_rules):
+            dirty_shards[shard][target.key] = rules
+            index[shard][target.key][1] = bool(rules)
+
+        rules_buf = []
+        for shard in sorted(shards):
+            shard_file = self._ninja_shard_file(shard)
+            target_rules = dirty_shards.get(shard)
+            if target_rules is not None:
+                console.debug('Generating %s' % shard_file)
+                if shard in dirty_caches:
+                    self._write_ninja_shard(self._ninja_shard_cache_file(shard),
+                                            sorted(index[shard]), target_rules)
+                self._write_ninja_shard(shard_file, [t.key for t in shards[shard]], target_rules)
+            else:
+                console.debug('Using cached %s' % shard_file)
+            rules_buf.append('subninja %s\n' % shard_file)
+
+        if index != old_index:
+            self._save_ninja_shard_index(index)
+
+        target_shards = dict((t.key, shard) for shard, ts in iteritems(shards) for t in ts)
+
+        def read_rules(key):
+            shard = target_shards.get(key)
+            if shard is None:
+                return ''
+            if shard not in dirty_shards:
+                dirty_shards[shard] = self._read_ninja_shard(self._ninja_shard_file(shard))
+            return ''.join(dirty_shards[shard].get(key, []))
+
+        return rules_buf, read_rules
+
+    def gen_targets_rules(self):
+        """Get the build rules and return to the object who queries this. """
+        targets = self._targets_to_generate()
+        if config.get_item('global_config', 'ninja_manifest_mode') == 'sharded':
+            rules_buf, read_rules = self._gen_sharded_targets_rules(targets)
+        else:
+            rules_buf, read_rules = self._gen_per_target_rules(targets)
+        if getattr(self.__options, 'pipeline', False):
+            rules_buf += self._gen_test_ready_rules(targets, read_rules)
+        return rules_buf
+
+    @staticmethod
+    def _parse_ninja_outputs(rules):
+        """Parse the explicit outputs of build statements in the ninja rules text. """
+        outputs = []
+        for line in rules.splitlines():
+            if not line.startswith('build '):
+                continue
+            outs = line[len('build '):].split(':', 1)[0].split()
+            if '|' in outs:
+                outs = outs[:outs.index('|')]
+            outputs += outs
+        return outputs
+
+    def _gen_test_ready_rules(self, targets, read_rules):
+        """Generate a stamp for each test which is built as soon as the test can be run.
+
+        A stamp depends on everything the test runner prepares for the test: the outputs of
+        the test and all of its dependencies, such as the shared libraries and the generated
+        data, and the testdata which is generated by other targets in this build. It also
+        depends on an always dirty phony target, so it is reported by ninja in each build,
+        and the test can be run while building others.
+        """
+        target_outputs = {}  # {key: [output]}
+
+        def outputs_of(key):
+            outputs = target_outputs.get(key)
+            if outputs is None:
+                outputs = target_outputs[key] = self._parse_ninja_outputs(read_rules(key))
+            return outputs
+
+        all_outputs = []  # [set(output)], only collected when any testdata is generated
+
+        def generated_test_data(target):
+            sources = [os.path.normpath(src) for src in test_data_sources(target)]
+            sources = [src for src in sources if src.startswith(self.__build_dir + os.sep)]
+            if sources and not all_outputs:
+                all_outputs.append(set(o for t in targets for o in outputs_of(t.key)))
+            return [src for src in sources if src in all_outputs[0]]
+
+        always_dirty = os.path.join(self.__build_dir, '.test_ready.phony')
+        rules_buf = ['build %s: phony\n\n' % always_dirty]
+        for target in targets:
+            if not target.type.endswith('_test'):
+                continue
+            outputs = outputs_of(target.key)
+            if not outputs:
+                continue
+            inputs = set(outputs)
+            for dkey in target.expanded_deps:
+                inputs.update(outputs_of(dkey))
+            inputs.update(generated_test_data(target))
+            outputs = sorted(inputs)
+            stamp = target._target_file_path(target.name + '.test_ready')
+            target._remove_on_clean(stamp)
+            self.__test_ready_stamps[stamp] = target.key
+            rules_buf.append('build %s: testready %s | %s\n\n' % (
+                stamp, ' '.join(outputs), always_dirty))
         return rules_buf
 
     def get_build_toolchain(self):
@@ -552,10 +978,12 @@ class Blade(object):
         # by local cpu mumber.
         # WE limit the test_jobs_num to be half of build job number because test
         # may be heavier than build (may be not, perhaps).
+        # Heavy tests are further limited by the resources (cpu, memory_mb) they
+        # declare, see TestScheduler.
         build_jobs_num = self.build_jobs_num()
         cpu_core_num = cpu_count()
-        jobs_num = max(min(build_jobs_num, cpu_core_num) / 2, 1)
-        console.info('Adjust build jobs number(-j N) to be %d' % jobs_num)
+        jobs_num = max(min(build_jobs_num, cpu_core_num) // 2, 1)
+        console.info('Adjust test jobs number(-t N) to be %d' % jobs_num)
         return jobs_num
 
     def get_all_rule_names(self):
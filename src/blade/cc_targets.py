@@ -15,6 +15,7 @@ from __future__ import absolute_import
 from __future__ import print_function
 
 import collections
+import multiprocessing
 import os
 import subprocess
 from string import Template
@@ -23,7 +24,8 @@ from blade import build_manager
 from blade import config
 from blade import console
 from blade import build_rules
-from blade.blade_util import stable_unique, var_to_list, var_to_list_or_none
+from blade import stat_cache
+from blade.blade_util import cpu_count, iteritems, stable_unique, var_to_list, var_to_list_or_none
 from blade.constants import HEAP_CHECK_VALUES
 from blade.target import Target
 
@@ -80,6 +82,127 @@ def _find_libs_by_header(hdr):
             return None
 
 
+def _parse_hdr_level_line(line):
+    """Parse a normal line of a header stack file
+
+    Example:
+      . ./common/rpc/rpc_client.h
+    """
+    pos = line.find(' ')
+    if pos == -1:
+        return -1, ''
+    level, hdr = line[:pos].count('.'), line[pos + 1:]
+    if hdr.startswith('./'):
+        hdr = hdr[2:]
+    return level, hdr
+
+
+def _parse_inclusion_stacks(path, build_dir):
+    """Parae headers inclusion stacks from file.
+
+    Given the following inclusions found in the app/example/foo.cc.H:
+
+        . ./app/example/foo.h
+        .. build64_release/app/example/proto/foo.pb.h
+        ... build64_release/common/rpc/rpc_service.pb.h
+        . build64_release/app/example/proto/bar.pb.h
+        . ./common/rpc/rpc_client.h
+        .. build64_release/common/rpc/rpc_options.pb.h
+
+    Return a list with each item being a list representing where the header
+    is included from in the current translation unit.
+
+    Note that we will STOP tracking at the first generated header (if any)
+    while other headers included from the header directly or indirectly are
+    ignored since that part of dependency is ensured by the generator, such
+    as proto_library.
+
+    As shown in the example above, it returns the following stacks:
+
+        [
+            ['app/example/foo.h', 'build64_release/app/example/proto/foo.pb.h'],
+            ['build64_release/app/example/proto/bar.pb.h'],
+            ['common/rpc/rpc_client.h', 'build64_release/common/rpc/rpc_options.pb.h'],
+        ]
+    """
+    direct_hdrs = []  # The directly included header files
+    stacks, hdrs_stack = [], []
+
+    def _process_hdr(level, hdr, current_level):
+        if hdr.startswith('/'):
+            skip_level = level
+        elif hdr.startswith(build_dir):
+            skip_level = level
+            stacks.append(hdrs_stack + [hdr])
+        else:
+            current_level = level
+            hdrs_stack.append(hdr)
+            skip_level = -1
+        return current_level, skip_level
+
+    current_level = 0
+    skip_level = -1
+    with open(path) as f:
+        for line in f:
+            line = line.rstrip()  # Strip `\n`
+            if not line.startswith('.'):
+                # The remaining lines are useless for us
+                break
+            level, hdr = _parse_hdr_level_line(line)
+            if level == -1:
+                console.log('%s: Unrecognized line %s' % (path, line))
+                break
+            if level == 1 and not hdr.startswith('/'):
+                direct_hdrs.append(hdr)
+            if level > current_level:
+                if skip_level != -1 and level > skip_level:
+                    continue
+                assert level == current_level + 1
+                current_level, skip_level = _process_hdr(level, hdr, current_level)
+            else:
+                while current_level >= level:
+                    current_level -= 1
+                    hdrs_stack.pop()
+                current_level, skip_level = _process_hdr(level, hdr, current_level)
+
+    return direct_hdrs, stacks
+
+
+def _parse_inclusion_file(args):
+    """Parse an inclusion file in the worker process"""
+    path, build_dir = args
+    return _parse_inclusion_stacks(path, build_dir)
+
+
+# Below this number of inclusion files, dispatching them to worker processes
+# costs more than parsing them directly.
+_PARALLEL_PARSE_THRESHOLD = 64
+
+
+def parse_inclusion_files(paths, build_dir, fork_workers=True):
+    """Parse inclusion files, in parallel when there are many of them.
+
+    Args:
+        fork_workers: bool, whether worker processes can be forked, forking is unsafe
+            when other threads are running.
+
+    Returns:
+        A dict{path: (direct_hdrs, stacks)}, see _parse_inclusion_stacks.
+    """
+    args = [(path, build_dir) for path in paths]
+    jobs = cpu_count() if fork_workers else 1
+    if jobs <= 1 or len(args) < _PARALLEL_PARSE_THRESHOLD:
+        return dict(zip(paths, map(_parse_inclusion_file, args)))
+    console.debug('Spawn %d processes to parse inclusion files' % jobs)
+    pool = multiprocessing.Pool(jobs)
+    try:
+        chunksize = max(len(args) // (jobs * 4), 1)
+        return dict(zip(paths, pool.map(_parse_inclusion_file, args, chunksize)))
+    finally:
+        pool.close()
+        pool.join()
+
+
 class CcTarget(Target):
     """
     This class is derived from Target and it is the base class
@@ -370,6 +493,8 @@ class CcTarget(Target):
         """Generate header inclusion stack files"""
         if not self._need_verify_generate_hdrs():
             return
+        if config.get_item('cc_config', 'hdrs_inclusion_in_compile'):
+            return  # Generated by the compile step
 
         for key in ('c_warnings', 'cxx_warnings'):
             if key in vars:
@@ -430,22 +555,25 @@ class CcTarget(Target):
         implicit_deps += self._cc_compile_deps()
         objs_dir = self._target_file_path(self.name + '.objs')
         objs, hdrs_inclusion_srcs = [], []
+        hdrs_inclusion_in_compile = config.get_item('cc_config', 'hdrs_inclusion_in_compile')
         for src in sources:
             obj = '%s.o' % os.path.join(objs_dir, src)
             rule = self._get_rule_from_suffix(src)
+            implicit_outputs = [obj + '.H'] if hdrs_inclusion_in_compile else None
             if generated:
                 input = self._target_file_path(src)
                 if generated_headers and len(generated_headers) > 1:
                     implicit_deps += generated_headers
             else:
                 path = self._source_file_path(src)
-                if os.path.exists(path):
+                if stat_cache.exists(path):
                     input = path
                     hdrs_inclusion_srcs.append((path, obj, rule))
                 else:
                     input = self._target_file_path(src)
             self.ninja_build(rule, obj, inputs=input,
                              implicit_deps=implicit_deps,
+                             implicit_outputs=implicit_outputs,
                              variables=vars, clean=[])
             objs.append(obj)
 
@@ -492,21 +620,6 @@ class CcTarget(Target):
                 return False
         return True
 
-    @staticmethod
-    def _parse_hdr_level_line(line):
-        """Parse a normal line of a header stack file
-
-        Example:
-          . ./common/rpc/rpc_client.h
-        """
-        pos = line.find(' ')
-        if pos == -1:
-            return -1, ''
-        level, hdr = line[:pos].count('.'), line[pos + 1:]
-        if hdr.startswith('./'):
-            hdr = hdr[2:]
-        return level, hdr
-
     def _find_inclusion_file(self, src):
         """Find the '.H' file for the given src.
 
@@ -515,92 +628,30 @@ class CcTarget(Target):
         for details.
         """
         objs_dir = self._target_file_path(self.name + '.objs')
-        path = '%s.H' % os.path.join(objs_dir, src)
-        if not os.path.exists(path):
+        if config.get_item('cc_config', 'hdrs_inclusion_in_compile'):
+            path = '%s.o.H' % os.path.join(objs_dir, src)
+        else:
+            path = '%s.H' % os.path.join(objs_dir, src)
+        if not stat_cache.exists(path):
             return ''
         return path
 
-    def _parse_inclusion_stacks(self, path):
-        """Parae headers inclusion stacks from file.
-
-        Given the following inclusions found in the app/example/foo.cc.H:
-
-            . ./app/example/foo.h
-            .. build64_release/app/example/proto/foo.pb.h
-            ... build64_release/common/rpc/rpc_service.pb.h
-            . build64_release/app/example/proto/bar.pb.h
-            . ./common/rpc/rpc_client.h
-            .. build64_release/common/rpc/rpc_options.pb.h
-
-        Return a list with each item being a list representing where the header
-        is included from in the current translation unit.
-
-        Note that we will STOP tracking at the first generated header (if any)
-        while other headers included from the header directly or indirectly are
-        ignored since that part of dependency is ensured by the generator, such
-        as proto_library.
-
-        As shown in the example above, it returns the following stacks:
-
-            [
-                ['app/example/foo.h', 'build64_release/app/example/proto/foo.pb.h'],
-                ['build64_release/app/example/proto/bar.pb.h'],
-                ['common/rpc/rpc_client.h', 'build64_release/common/rpc/rpc_options.pb.h'],
-            ]
-        """
-        build_dir = self.build_dir
-        direct_hdrs = []  # The directly included header files
-        stacks, hdrs_stack = [], []
-
-        def _process_hdr(level, hdr, current_level):
-            if hdr.startswith('/'):
-                skip_level = level
-            elif hdr.startswith(build_dir):
-                skip_level = level
-                stacks.append(hdrs_stack + [hdr])
-            else:
-                current_level = level
-                hdrs_stack.append(hdr)
-                skip_level = -1
-            return current_level, skip_level
-
-        current_level = 0
-        skip_level = -1
-        with open(path) as f:
-            for line in f:
-                line = line.rstrip()  # Strip `\n`
-                if not line.startswith('.'):
-                    # The remaining lines are useless for us
-                    break
-                level, hdr = self._parse_hdr_level_line(line)
-                if level == -1:
-                    console.log('%s: Unrecognized line %s' % (path, line))
-                    break
-                if level == 1 and not hdr.startswith('/'):
-                    direct_hdrs.append(hdr)
-                if level > current_level:
-                    if skip_level != -1 and level > skip_level:
-                        continue
-                    assert level == current_level + 1
-                    current_level, skip_level = _process_hdr(level, hdr, current_level)
-                else:
-                    while current_level >= level:
-                        current_level -= 1
-                        hdrs_stack.pop()
-                    current_level, skip_level = _process_hdr(level, hdr, current_level)
-
-        return direct_hdrs, stacks
-
     @staticmethod
     def _hdr_is_declared(hdr, declared_hdrs, declared_incs):
+        """Check whether the hdr is declared.
+
+        Args:
+            declared_incs: dict{length: set(inc)}, the declared include dirs grouped by
+                length, so a prefix is looked up by a hash for each distinct length.
+        """
         if hdr in declared_hdrs:
             return True
-        for dir in declared_incs:
-            if hdr.startswith(dir):
+        for length, incs in iteritems(declared_incs):
+            if hdr[:length] in incs:
                 return True
         return False
 
-    def _verify_direct_headers(self, src, direct_hdrs, suppressd_hdrs):
+    def _verify_direct_headers(self, src, direct_hdrs, deps, suppressd_hdrs):
         verified_hdrs = set()
         problematic_hdrs = set()
         msg = []
@@ -608,7 +659,6 @@ class CcTarget(Target):
             libs = _find_libs_by_header(hdr)
             if not libs:
                 continue
-            deps = set(self.deps + [self.key])  # Don't forget self
             if not (libs & deps):  # pylint: disable=superfluous-parens
                 # NOTE:
                 # We just don't report a suppressd hdr, but still need to record it as a failure.
@@ -669,44 +719,66 @@ class CcTarget(Target):
             except OSError:
                 pass
 
-    def verify_hdr_dep_missing(self, history, suppress):
+    def collect_inclusion_files(self, history):
+        """Collect the inclusion files which are changed since the last verification.
+
+        Returns:
+            A list of (src, path, mtime).
+        """
+        if not self._need_verify_generate_hdrs():
+            return []
+        inclusion_files = []
+        for src in self.srcs:
+            path = self._find_inclusion_file(src)
+            if not path:
+                continue
+            mtime = int(stat_cache.getmtime(path))
+            if history.get(path) != mtime:
+                inclusion_files.append((src, path, mtime))
+        return inclusion_files
+
+    def verify_hdr_dep_missing(self, history, suppress, inclusion_files, inclusion_stacks):
         """
         Verify whether included header files is declared in "deps" correctly.
 
+        Args:
+            inclusion_files: list, returned by collect_inclusion_files.
+            inclusion_stacks: dict, returned by parse_inclusion_files.
+
         Returns:
             Whether nothing is wrong.
         """
         # pylint: disable=too-many-locals
-        if not self._need_verify_generate_hdrs():
+        if not inclusion_files:
             return True, {}
 
         # Collect header/include declarations
         declared_hdrs = set()
-        declared_incs = set()
+        declared_incs = collections.defaultdict(set)
 
         build_targets = self.blade.get_build_targets()
         for key in self.expanded_deps:
             dep = build_targets[key]
             declared_hdrs.update(dep.attr.get('generated_hdrs', []))
-            declared_incs.update(dep.attr.get('generated_incs', []))
+            for inc in dep.attr.get('generated_incs', []):
+                declared_incs[len(inc)].add(inc)
+
+        deps = set(self.deps)
+        deps.add(self.key)  # Don't forget self
 
         # Verify
         details = {}  # {src: list(hdrs)}
-        preprocess_paths, failed_preprocess_paths = set(), set()
+        preprocess_paths, failed_preprocess_paths = {}, set()
 
         direct_verify_msg = []
         generated_verify_msg = []
 
-        for src in self.srcs:
-            path = self._find_inclusion_file(src)
-            if not path or (path in history and int(os.path.getmtime(path)) == history[path]):
-                continue
-
-            direct_hdrs, stacks = self._parse_inclusion_stacks(path)
-            preprocess_paths.add(path)
+        for src, path, mtime in inclusion_files:
+            direct_hdrs, stacks = inclusion_stacks[path]
+            preprocess_paths[path] = mtime
 
             verified_hdrs, problematic_hdrs, msg = self._verify_direct_headers(
-                    src, direct_hdrs, suppress.get(src, []))
+                    src, direct_hdrs, deps, suppress.get(src, []))
             if problematic_hdrs:
                 details[src] = list(problematic_hdrs)
                 failed_preprocess_paths.add(path)
@@ -736,8 +808,9 @@ class CcTarget(Target):
         for preprocess in failed_preprocess_paths:
             if preprocess in history:
                 del history[preprocess]
-        for preprocess in preprocess_paths - failed_preprocess_paths:
-            history[preprocess] = int(os.path.getmtime(preprocess))
+        for preprocess, mtime in iteritems(preprocess_paths):
+            if preprocess not in failed_preprocess_paths:
+                history[preprocess] = mtime
 
         failed = (direct_verify_msg or generated_verify_msg) and severity == 'error'
         if failed:
@@ -1292,7 +1365,8 @@ class CcBinary(CcTarget):
                       implicit_deps=implicit_deps,
                       order_only_deps=order_only_deps)
         self._add_default_target_file('bin', output)
-        self._remove_on_clean(self._target_file_path(self.name + '.runfiles'))
+        self._remove_on_clean(self._target_file_path(self.name + '.runfiles'),
+                              self._target_file_path(self.name + '.runfiles.manifest'))
 
     def ninja_rules(self):
         """Generate ninja build rules for cc binary/test. """
@@ -1487,6 +1561,10 @@ class CcTest(CcBinary):
             export_dynamic,
             always_run,
             exclusive,
+            shard_count,
+            cpu,
+            memory_mb,
+            retries,
             heap_check,
             heap_check_debug,
             kwargs):
@@ -1515,6 +1593,9 @@ class CcTest(CcBinary):
         self.attr['testdata'] = var_to_list(testdata)
         self.attr['always_run'] = always_run
         self.attr['exclusive'] = exclusive
+        self._set_shard_count(shard_count)
+        self._set_test_resources(cpu, memory_mb)
+        self._set_test_retries(retries)
 
         gtest_lib = var_to_list(cc_test_config['gtest_libs'])
         gtest_main_lib = var_to_list(cc_test_config['gtest_main_libs'])
@@ -1559,6 +1640,10 @@ def cc_test(name=None,
             export_dynamic=False,
             always_run=False,
             exclusive=False,
+            shard_count=0,
+            cpu=None,
+            memory_mb=None,
+            retries=None,
             heap_check=None,
             heap_check_debug=False,
             **kwargs):
@@ -1581,6 +1666,10 @@ def cc_test(name=None,
             export_dynamic=export_dynamic,
             always_run=always_run,
             exclusive=exclusive,
+            shard_count=shard_count,
+            cpu=cpu,
+            memory_mb=memory_mb,
+            retries=retries,
             heap_check=heap_check,
             heap_check_debug=heap_check_debug,
             kwargs=kwargs)
@@ -75,6 +75,18 @@ class ParsedCommandLine(object):
 
     def _check_test_options(self):
         """check that test command options."""
+        if self.options.shard:
+            try:
+                index, count = [int(n) for n in self.options.shard.split('/')]
+                if not 0 <= index < count:
+                    raise ValueError
+            except ValueError:
+                console.fatal('Invalid --shard=%s, should be INDEX/COUNT and 0 <= INDEX < COUNT' %
+                              self.options.shard)
+            self.options.shard = (index, count)
+        if self.options.fail_fast < 0:
+            console.fatal('Invalid --fail-fast=%s, should be a non-negative number, '
+                          '0 means disabled' % self.options.fail_fast)
 
     def _check_plat_and_profile_options(self):
         """check platform and profile options. """
@@ -229,6 +241,10 @@ class ParsedCommandLine(object):
             '--show-builds-slower-than', dest='show_builds_slower_than', metavar='SECONDS', type=float,
             help='Show build commands which are slower than specified seconds')
 
+        parser.add_argument(
+            '--keep-ninja-output', dest='keep_ninja_output', action='store_true', default=False,
+            help='Keep the raw output of ninja in blade-bin/ninja_output.log')
+
     def __add_coverage_arguments(self, parser):
         """Add coverage arguments. """
         parser.add_argument(
@@ -309,6 +325,19 @@ class ParsedCommandLine(object):
             '--run-unrepaired-tests', dest='run_unrepaired_tests', action='store_true',
             help='Whether run unrepaired(no changw after previous failure) tests during incremental test')
 
+        parser.add_argument(
+            '--shard', dest='shard', metavar='INDEX/COUNT',
+            help='Only run the tests in the INDEX-th (0 based) of COUNT shards, '
+                 'to split the tests across machines')
+
+        parser.add_argument(
+            '--fail-fast', dest='fail_fast', type=int, nargs='?', const=1, default=0, metavar='N',
+            help='Stop running tests after N (default 1) tests failed')
+
+        parser.add_argument(
+            '--pipeline', dest='pipeline', action='store_true', default=False,
+            help='Run each test as soon as it is built, while building other targets')
+
     def _add_run_arguments(self, parser):
         """Add run command arguments. """
 
@@ -325,6 +354,9 @@ class ParsedCommandLine(object):
             parser.add_argument(
                 '--profiling', dest='profiling', action='store_true',
                 help='Blade performance profiling, for blade developing')
+            parser.add_argument(
+                '--trace', dest='trace', action='store_true',
+                help='Record the time of build phases into a chrome trace file in the build dir')
             parser.add_argument(
                 '--stop-after', dest='stop_after', type=str,
                 choices=['load', 'analyze', 'generate', 'build', 'all'], default='all',
@@ -65,6 +65,33 @@ class BladeConfig(object):
                 'build_jobs__doc__': 'The number of build jobs (commands) to run simultaneously',
                 'test_jobs': 0,
                 'test_jobs__doc__': 'The number of test jobs to run simultaneously',
+                'load_jobs': 0,
+                'load_jobs__doc__': 'The number of processes to evaluate BUILD files simultaneously',
+                'test_content_hash': False,
+                'test_content_hash__doc__':
+                    'Whether decide to run tests during incremental test by the content rather '
+                    'than the modification time of test binaries and testdata',
+                'test_retries': 0,
+                'test_retries__doc__': 'The max number of times to rerun a failed test in the same run',
+                'test_retry_exclusive': False,
+                'test_retry_exclusive__doc__': 'Whether rerun failed tests one by one after other tests',
+                'flaky_test_threshold': 0,
+                'flaky_test_threshold__doc__':
+                    'Quarantine tests which passed after retries in more than this ratio (0~1) of '
+                    'recent runs, their failures do not fail the test command. 0 means disabled',
+                'action_cache_dir': '',
+                'action_cache_dir__doc__':
+                    'The dir to cache the outputs of link, javac, protoc, thrift and gen_rule '
+                    'actions, which can be shared by workspaces and machines. Empty means disabled',
+                'ninja_manifest_mode': 'per_target',
+                'ninja_manifest_mode__doc__':
+                    "How to write the ninja manifests of targets, can be 'per_target', 'sharded'. "
+                    "'sharded' writes a manifest per top level dir, which is faster to load for "
+                    "large builds",
+                'testdata_link_mode': 'copy',
+                'testdata_link_mode__doc__':
+                    "How to prepare testdata in the runfiles dir, can be 'copy', 'hardlink', "
+                    "'symlink'. 'copy' makes copy-on-write clones if the filesystem supports it",
                 'run_unrepaired_tests': False,
                 'run_unrepaired_tests__doc__':
                     'Whether run unrepaired(no changw after previous failure) tests during incremental test',
@@ -98,6 +125,9 @@ class BladeConfig(object):
                     'library to which the header file belongs, can be "info", "warning", "error"',
                 'hdr_dep_missing_suppress': {},
                 'hdr_dep_missing_suppress__doc__': 'header deps missing suppress control, see docs for details',
+                'hdrs_inclusion_in_compile': False,
+                'hdrs_inclusion_in_compile__doc__': 'Generate the header inclusion stack files as a '
+                    'side output of the compile step rather than an extra preprocessing step',
             },
 
             'cc_library_config': {
@@ -385,6 +415,8 @@ def _check_test_related_envs(kwargs):
 
 
 _DUPLICATED_SOURCE_ACTION_VALUES = set(['warning', 'error', 'none', None])
+_TESTDATA_LINK_MODE_VALUES = set(['copy', 'hardlink', 'symlink'])
+_NINJA_MANIFEST_MODE_VALUES = set(['per_target', 'sharded'])
 
 
 @config_rule
@@ -402,6 +434,8 @@ def global_config(append=None, **kwargs):
     debug_info_levels = _blade_config.get_section('cc_config')['debug_info_levels'].keys()
     _check_kwarg_enum_value(kwargs, 'debug_info_level', debug_info_levels)
     _check_test_related_envs(kwargs)
+    _check_kwarg_enum_value(kwargs, 'testdata_link_mode', _TESTDATA_LINK_MODE_VALUES)
+    _check_kwarg_enum_value(kwargs, 'ninja_manifest_mode', _NINJA_MANIFEST_MODE_VALUES)
     _blade_config.update_config('global_config', append, kwargs)
 
 
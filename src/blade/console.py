@@ -221,12 +221,33 @@ def _print(msg, verbosity):
         _do_print(msg)
 
 
-def output(msg):
+def output(msg, file=sys.stdout):
     """Output message without any decoration"""
-    _do_print(msg)
+    _do_print(msg, file=file)
     log(msg)
 
 
+_COPY_CHUNK_SIZE = 64 * 1024
+
+
+def copy_output(stream, file=sys.stdout, visible=True):
+    """Copy the content of a binary file object to the output and the log in chunks"""
+    clear_progress_bar()
+    # Write bytes to the underlying binary buffers directly under python 3
+    outputs = []
+    for f in ([file] if visible else []) + ([_log] if _log else []):
+        f.flush()
+        outputs.append(getattr(f, 'buffer', f))
+    while True:
+        data = stream.read(_COPY_CHUNK_SIZE)
+        if not data:
+            break
+        for out in outputs:
+            out.write(data)
+    for out in outputs:
+        out.flush()
+
+
 # Global Error Counter
 _error_count = 0
 
@@ -78,50 +78,64 @@ def _check_dep_visibility(target_id, dep_id, targets):
         dep.info('which is declared here')
 
 
-def _unique_deps(new_deps_list):
-    # Append new_deps_piece to new_deps_list, be aware of de-duplication
+def _merge_expanded_deps(target, targets):
+    """Merge the expanded deps of all direct deps of the target.
+
+    The result is the same as concatenating [dep] + dep.expanded_deps for each dep
+    and keeping the last occurrence of each duplicated key, so the deps always
+    come after their dependents, which is required by the link order. The reversed
+    iteration avoids building the concatenated list. The result is a plain list of
+    keys, which are the same string objects shared by all targets.
+    """
     result = []
-    deps = set()
-    for dep in reversed(new_deps_list):
-        if dep not in deps:
-            result.append(dep)
-            deps.add(dep)
-    return list(reversed(result))
-
-
-def _expand_target_deps(target_id, targets, root_targets=None):
+    seen = set()
+    for dkey in reversed(target.deps):
+        for key in reversed(targets[dkey].expanded_deps):
+            if key not in seen:
+                seen.add(key)
+                result.append(key)
+        if dkey not in seen:
+            seen.add(dkey)
+            result.append(dkey)
+    result.reverse()
+    return result
+
+
+def _expand_target_deps(target_id, targets):
     """_expand_target_deps.
 
     Return all targets depended by target_id directly and/or indirectly.
-    We need the parameter root_target_id to check loopy dependency.
+    The dependency graph is traversed in post order with an explicit stack, to
+    avoid the recursion limit on deep graphs. The targets on the stack are used
+    to check loopy dependency.
 
     """
     target = targets[target_id]
     if target.expanded_deps is not None:
         return target.expanded_deps
 
-    if root_targets is None:
-        root_targets = set()
-
-    root_targets.add(target_id)
-    new_deps_list = []
-
-    for d in target.deps:
-        # loop dependency
-        if d in root_targets:
-            err_msg = ''
-            for t in root_targets:
-                err_msg += '//%s --> ' % t
-            console.fatal('Loop dependency found: //%s --> [%s]' % (d, err_msg))
-        _check_dep_visibility(target_id, d, targets)
-        new_deps_list.append(d)
-        new_deps_list += _expand_target_deps(d, targets, root_targets)
-
-    new_deps_list = _unique_deps(new_deps_list)
-    target.expanded_deps = new_deps_list
-    root_targets.remove(target_id)
-
-    return new_deps_list
+    # Each frame is (target_id, iterator of its unvisited deps)
+    stack = [(target_id, iter(target.deps))]
+    stack_targets = set([target_id])
+    while stack:
+        key, deps_iter = stack[-1]
+        for d in deps_iter:
+            # loop dependency
+            if d in stack_targets:
+                err_msg = ''.join(['//%s --> ' % t for t, _ in stack])
+                console.fatal('Loop dependency found: //%s --> [%s]' % (d, err_msg))
+            _check_dep_visibility(key, d, targets)
+            dep = targets[d]
+            if dep.expanded_deps is None:
+                stack.append((d, iter(dep.deps)))
+                stack_targets.add(d)
+                break
+        else:
+            stack.pop()
+            stack_targets.remove(key)
+            targets[key].expanded_deps = _merge_expanded_deps(targets[key], targets)
+
+    return target.expanded_deps
 
 
 def _topological_sort(related_targets):
@@ -133,18 +147,12 @@ def _topological_sort(related_targets):
     """
     numpreds = {}  # elt -> # of predecessors
     for target_key, target in related_targets.items():
-        if target_key not in numpreds:
-            numpreds[target_key] = 0
+        # since every depkey < target_key, target_key gains a pred for each of
+        # them, the expanded deps are unique.
+        numpreds[target_key] = len(target.expanded_deps)
         for depkey in target.deps:
             related_targets[depkey].dependents.add(target_key)
         for depkey in target.expanded_deps:
-            # make sure every elt is a key in numpreds
-            if depkey not in numpreds:
-                numpreds[depkey] = 0
-
-            # since depkey < target_key, target_key gains a pred ...
-            numpreds[target_key] = numpreds[target_key] + 1
-
             # ... and depkey gains a succ
             related_targets[depkey].expanded_dependents.add(target_key)
 
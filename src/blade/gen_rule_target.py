@@ -13,10 +13,12 @@ from __future__ import absolute_import
 
 import os
 
+from blade import action_cache
 from blade import build_manager
 from blade import build_rules
 from blade import cc_targets
 from blade import console
+from blade import stat_cache
 from blade.blade_util import regular_variable_name
 from blade.blade_util import var_to_list
 from blade.target import Target, LOCATION_RE
@@ -38,6 +40,7 @@ class GenRuleTarget(Target):
                  export_incs,
                  cleans,
                  heavy,
+                 cacheable,
                  kwargs):
         """Init method.
         Init the gen rule target.
@@ -63,6 +66,7 @@ class GenRuleTarget(Target):
         self.attr['cmd'] = LOCATION_RE.sub(self._process_location_reference, cmd)
         self.attr['cmd_name'] = cmd_name
         self.attr['heavy'] = heavy
+        self.attr['cacheable'] = cacheable
         self.cleans = var_to_list(cleans)
         for clean in self.cleans:
             self._remove_on_clean(self._target_file_path(clean))
@@ -138,7 +142,7 @@ class GenRuleTarget(Target):
         result = []
         for s in self.srcs:
             src = self._source_file_path(s)
-            if os.path.exists(src):
+            if stat_cache.exists(src):
                 result.append(src)
             else:
                 result.append(self._target_file_path(s))
@@ -147,6 +151,10 @@ class GenRuleTarget(Target):
     def ninja_rules(self):
         rule = '%s__rule__' % regular_variable_name(self._source_file_path(self.name))
         cmd = self._expand_command()
+        cacheable = self.attr['cacheable']
+        action_cache_dir = self.blade.get_action_cache_dir()
+        if cacheable and action_cache_dir:
+            cmd = action_cache.wrap_command(cmd, action_cache_dir, self.blade.get_blade_path())
         description = console.colored('%s %s' % (self.attr['cmd_name'], self.fullname), 'dimpurple')
         self._write_rule('''rule %s
   command = %s && cd %s && ls ${out} > /dev/null
@@ -162,7 +170,7 @@ class GenRuleTarget(Target):
         if self.attr['heavy']:
             vars['pool'] = 'heavy_pool'
         self.ninja_build(rule, outputs, inputs=inputs, implicit_deps=self.implicit_dependencies(),
-                         variables=vars)
+                         variables=vars, cacheable=cacheable)
         for i, out in enumerate(outputs):
             self._add_target_file(str(i), out)
 
@@ -180,6 +188,7 @@ def gen_rule(
         export_incs=[],
         cleans=[],
         heavy=False,
+        cacheable=False,
         **kwargs):
     """General Build Rule
     Args:
@@ -195,6 +204,9 @@ def gen_rule(
             directory.
         heavy: bool, Whether this target is a heavy target, which means to build it will cost many
             cpu/memory.
+        cacheable: bool, Whether the outputs can be cached in the action cache. Only set it to
+            True if the command is hermetic, that is, its outputs only depend on its inputs, but
+            not anything else, such as the time, the network or the tools in $PATH.
     """
     gen_rule_target = GenRuleTarget(
             name=name,
@@ -209,6 +221,7 @@ def gen_rule(
             export_incs=export_incs,
             cleans=cleans,
             heavy=heavy,
+            cacheable=cacheable,
             kwargs=kwargs)
     build_manager.instance.register_target(gen_rule_target)
 
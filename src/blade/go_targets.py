@@ -20,6 +20,7 @@ from blade import build_manager
 from blade import build_rules
 from blade import config
 from blade import console
+from blade import stat_cache
 from blade.blade_util import var_to_list
 from blade.target import Target
 
@@ -244,10 +245,10 @@ def go_test(
 
 def find_go_srcs(path):
     srcs, tests = [], []
-    for name in os.listdir(path):
+    for name in stat_cache.listdir(path):
         if name.startswith('.') or not name.endswith('.go'):
             continue
-        if os.path.isfile(os.path.join(path, name)):
+        if stat_cache.isfile(os.path.join(path, name)):
             if name.endswith('_test.go'):
                 tests.append(name)
             else:
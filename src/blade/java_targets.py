@@ -21,6 +21,7 @@ from blade import build_manager
 from blade import build_rules
 from blade import config
 from blade import maven
+from blade import stat_cache
 from blade.blade_util import var_to_list
 from blade.blade_util import iteritems
 from blade.target import Target, LOCATION_RE
@@ -617,7 +618,7 @@ class JavaTarget(Target, JavaTargetMixIn):
         for s in self.srcs:
             sp = self._source_file_path(s)
             # If it doesn't exist, consider it as a generated file in target dir
-            srcs.append(sp if os.path.exists(sp) else self._target_file_path(s))
+            srcs.append(sp if stat_cache.exists(sp) else self._target_file_path(s))
         return srcs
 
     def _generate_jar(self):
@@ -800,6 +801,9 @@ class JavaTest(JavaBinary):
             exclusions,
             testdata,
             target_under_test,
+            cpu,
+            memory_mb,
+            retries,
             kwargs):
         super(JavaTest, self).__init__(
                 name=name,
@@ -816,6 +820,8 @@ class JavaTest(JavaBinary):
             self.warning('"target_under_test" is deprecated, you can remove it safely')
         self.type = 'java_test'
         self.attr['testdata'] = var_to_list(testdata)
+        self._set_test_resources(cpu, memory_mb)
+        self._set_test_retries(retries)
 
     def _java_test_vars(self):
         vars = {
@@ -912,6 +918,9 @@ def java_test(name=None,
               exclusions=[],
               testdata=[],
               target_under_test=None,
+              cpu=None,
+              memory_mb=None,
+              retries=None,
               **kwargs):
     """Build a java test target"""
     target = JavaTest(
@@ -926,6 +935,9 @@ def java_test(name=None,
             exclusions=exclusions,
             testdata=testdata,
             target_under_test=target_under_test,
+            cpu=cpu,
+            memory_mb=memory_mb,
+            retries=retries,
             kwargs=kwargs)
     build_manager.instance.register_target(target)
 
@@ -17,14 +17,19 @@
 
 from __future__ import absolute_import
 
+import multiprocessing
 import os
+import pickle
 import traceback
 
 from blade import build_attributes
 from blade import build_rules
 from blade import config
 from blade import console
-from blade.blade_util import var_to_list, exec_file, source_location
+from blade import stat_cache
+from blade import trace
+from blade.blade_util import var_to_list, exec_code, exec_file, source_location
+from blade.blade_util import cpu_count, source_lineno
 from blade.pathlib import Path
 
 
@@ -51,24 +56,29 @@ def _load_build_rules():
     import blade.fbthrift_library
 
 
-def _find_dir_dependent(dir, blade):
-    """Find which target depends on the dir. """
-    target_database = blade.get_target_database()
-    for key in target_database:
-        target = target_database[key]
-        for dkey in target.expanded_deps:
-            if dkey.split(':')[0] == dir:
-                return target
-    return None
-
-
 def _report_not_exist(kind, path, source_dir, blade):
     """Report dir or BUILD file does not exist. """
     msg = '%s "//%s" does not exist' % (kind, path)
-    dependent = _find_dir_dependent(source_dir, blade)
+    dependent = blade.find_dir_dependent(source_dir)
     (dependent or console).fatal(msg)
 
 
+# The records of evaluating a BUILD file in a worker process, None in the main process
+__build_file_records = None
+
+
+def _report(severity, msg):
+    """Report a diagnostic of a BUILD file.
+
+    It is recorded in a worker process and will be reported in the main process in
+    the order of loading, so the diagnostics are the same as serial loading.
+    """
+    if __build_file_records is not None:
+        __build_file_records.append(('report', severity, msg))
+    else:
+        getattr(console, severity)(msg, prefix=False)
+
+
 def enable_if(cond, true_value, false_value=None):
     """A global function can be called in BUILD to filter srcs/deps by target"""
     if cond:
@@ -95,10 +105,9 @@ def glob(include, exclude=None, excludes=None, allow_empty=False):
     source_loc = source_location(os.path.join(str(source_dir), 'BUILD'))
     include = var_to_list(include)
     severity = config.get_item('global_config', 'glob_error_severity')
-    output = getattr(console, severity)
     if excludes:
-        output('%s %s: "excludes" is deprecated, use "exclude" instead' % (source_loc, severity),
-               prefix=False)
+        _report(severity, '%s %s: "excludes" is deprecated, use "exclude" instead' % (
+                source_loc, severity))
     exclude = var_to_list(exclude) + var_to_list(excludes)
 
     def includes_iterator():
@@ -135,9 +144,8 @@ def glob(include, exclude=None, excludes=None, allow_empty=False):
         args = repr(include)
         if exclude:
             args += ', exclude=%s' % repr(exclude)
-        output('%s %s: "glob(%s)" got an empty result. If it is the expected behavior, '
-               'specify "allow_empty=True" to eliminate this message' % (source_loc, severity, args),
-               prefix=False)
+        _report(severity, '%s %s: "glob(%s)" got an empty result. If it is the expected behavior, '
+                'specify "allow_empty=True" to eliminate this message' % (source_loc, severity, args))
 
     return result
 
@@ -145,6 +153,9 @@ def glob(include, exclude=None, excludes=None, allow_empty=False):
 # Each include in a BUILD file can only affect itself
 __current_globles = None
 
+# The evaluator of BUILD files in worker processes during loading
+__build_file_evaluator = None
+
 
 # Include a defination file in a BUILD file
 def include(name):
@@ -162,6 +173,149 @@ build_rules.register_function(glob)
 build_rules.register_function(include)
 
 
+# Below this number of BUILD files, dispatching them to worker processes costs
+# more than evaluating them directly.
+_PARALLEL_LOAD_THRESHOLD = 16
+
+# Functions which are run when evaluating BUILD files in worker processes, calls
+# of all other functions are build rules, which are recorded and replayed.
+_EVALUATED_FUNCTIONS = frozenset(['enable_if', 'glob', 'include'])
+
+
+class _BuildFileError(Exception):
+    """The error of evaluating a BUILD file in a worker process"""
+
+
+def _rule_recorder(name):
+    """Return a function which records the calls of the build rule"""
+    def record(*args, **kwargs):
+        from blade import build_manager  # pylint: disable=import-outside-toplevel
+        build_file = os.path.join(build_manager.instance.get_current_source_path(), 'BUILD')
+        __build_file_records.append(('call', name, source_lineno(build_file), args, kwargs))
+    return record
+
+
+def _recording_globals():
+    """The globals of BUILD files in which the calls of build rules are recorded"""
+    globals = build_rules.get_all()
+    for name, value in list(globals.items()):
+        if callable(value) and name not in _EVALUATED_FUNCTIONS:
+            globals[name] = _rule_recorder(name)
+    return globals
+
+
+def _evaluate_build_file(source_dir):
+    """Evaluate the BUILD file in the worker process.
+
+    Returns the pickled records, or None if they can't be pickled, such as a function
+    is passed to a build rule, then the BUILD file will be executed in the main process.
+    """
+    from blade import build_manager  # pylint: disable=import-outside-toplevel
+    global __build_file_records, __current_globles
+    build_file = os.path.join(source_dir, 'BUILD')
+    records = []
+    __build_file_records = records
+    build_manager.instance.set_current_source_path(source_dir)
+    try:
+        __current_globles = _recording_globals()
+        exec_file(build_file, __current_globles, None)
+    except SystemExit:
+        records.append(('fatal', '%s: Fatal error' % build_file))
+    except:  # pylint: disable=bare-except
+        records.append(('fatal', 'Parse error in %s\n%s' % (build_file, traceback.format_exc())))
+    finally:
+        __build_file_records = None
+    try:
+        return pickle.dumps(records, pickle.HIGHEST_PROTOCOL)
+    except Exception:  # pylint: disable=broad-except
+        return None
+
+
+def _replay_call(build_file, lineno, rule, args, kwargs):
+    """Call the build rule as if it is called at the line of the BUILD file.
+
+    Targets find their source locations from the call stack, see `source_location`.
+    """
+    code = compile('\n' * (lineno - 1) + '__rule(*__args, **__kwargs)', build_file, 'exec')
+    exec_code(code, {'__rule': rule, '__args': args, '__kwargs': kwargs}, None)
+
+
+def _replay_build_file(build_file, records, globals):
+    """Replay the records of evaluating the BUILD file in the main process"""
+    for record in records:
+        if record[0] == 'call':
+            _, name, lineno, args, kwargs = record
+            _replay_call(build_file, lineno, globals[name], args, kwargs)
+        elif record[0] == 'report':
+            _report(record[1], record[2])
+        else:
+            raise _BuildFileError(record[1])
+
+
+def _fork_pool(jobs):
+    """The worker processes must be forked to inherit the loaded config and build rules"""
+    if hasattr(multiprocessing, 'get_context'):
+        return multiprocessing.get_context('fork').Pool(jobs)
+    return multiprocessing.Pool(jobs)
+
+
+class _BuildFileEvaluator(object):
+    """Evaluate BUILD files in a pool of worker processes.
+
+    Registering targets checks duplicated targets and source files against all of
+    the loaded targets, so it must be done in the main process in a deterministic
+    order. BUILD files are evaluated ahead in worker processes, in which the calls
+    of build rules are recorded rather than run. When a BUILD file is loaded, its
+    records are replayed in the main process, which constructs and registers the
+    targets and reports the diagnostics in the same order as executing it.
+    """
+
+    def __init__(self, jobs):
+        self.__jobs = jobs
+        self.__pool = None
+        self.__records = {}  # dict{source_dir: pickled records}
+
+    def prefetch(self, source_dirs):
+        """Evaluate BUILD files in source_dirs in parallel"""
+        if self.__jobs <= 1:
+            return
+        # Use the same dirs as `_load_build_file` to get the records
+        source_dirs = sorted(set(os.path.normpath(d) for d in source_dirs))
+        source_dirs = [d for d in source_dirs if d not in self.__records and
+                       os.path.isfile(os.path.join(d, 'BUILD'))]
+        if len(source_dirs) < _PARALLEL_LOAD_THRESHOLD:
+            return
+        if self.__pool is None:
+            console.debug('Spawn %d processes to evaluate BUILD files' % self.__jobs)
+            self.__pool = _fork_pool(self.__jobs)
+        chunksize = max(len(source_dirs) // (self.__jobs * 4), 1)
+        results = self.__pool.map(_evaluate_build_file, source_dirs, chunksize)
+        for source_dir, records in zip(source_dirs, results):
+            if records is not None:
+                self.__records[source_dir] = records
+
+    def pop(self, source_dir):
+        """Return the records of the BUILD file in source_dir, or None if it is not evaluated"""
+        records = self.__records.pop(source_dir, None)
+        if records is None:
+            return None
+        return pickle.loads(records)
+
+    def close(self):
+        if self.__pool is not None:
+            self.__pool.close()
+            self.__pool.join()
+            self.__pool = None
+
+
+def _load_jobs_num():
+    """The number of processes to evaluate BUILD files"""
+    jobs_num = config.get_item('global_config', 'load_jobs')
+    if jobs_num > 0:
+        return jobs_num
+    return cpu_count()
+
+
 def _load_build_file(source_dir, processed_source_dirs, blade):
     """Load the BUILD and place the targets into database.
 
@@ -194,9 +348,16 @@ def _load_build_file(source_dir, processed_source_dirs, blade):
                 # which can be loaded and executed by execfile().
                 global __current_globles
                 __current_globles = build_rules.get_all()
-                exec_file(build_file, __current_globles, None)
+                records = __build_file_evaluator.pop(source_dir)
+                with trace.span(build_file, 'build_file'):
+                    if records is None:
+                        exec_file(build_file, __current_globles, None)
+                    else:
+                        _replay_build_file(build_file, records, __current_globles)
             except SystemExit:
                 console.fatal('%s: Fatal error' % build_file)
+            except _BuildFileError as e:
+                console.fatal(str(e))
             except:  # pylint: disable=bare-except
                 console.fatal('Parse error in %s\n%s' % (
                     build_file, traceback.format_exc()))
@@ -206,16 +367,6 @@ def _load_build_file(source_dir, processed_source_dirs, blade):
         blade.set_current_source_path(old_current_source_path)
 
 
-def _find_dependent(dkey, blade):
-    """Find which target depends on the target with dkey. """
-    target_database = blade.get_target_database()
-    for key in target_database:
-        target = target_database[key]
-        if dkey in target.expanded_deps:
-            return target
-    return None
-
-
 # File names should be skipped
 _SKIP_FILES = ['BLADE_ROOT', '.bladeskip']
 
@@ -237,7 +388,7 @@ def _is_load_excluded(root, d):
 
     # Exclude directories containing special files
     for skip_file in _SKIP_FILES:
-        if os.path.exists(os.path.join(root, d, skip_file)):
+        if stat_cache.exists(os.path.join(root, d, skip_file)):
             console.info('Skip "%s" due to "%s" file' % (os.path.join(root, d), skip_file))
             return True
 
@@ -291,42 +442,59 @@ def load_targets(target_ids, blade_root_dir, blade):
 
     direct_targets = list(cited_targets)
 
-    # Load BUILD files in paths, and add all loaded targets into
-    # cited_targets.  Together with above step, we can ensure that all
-    # targets mentioned in the command line are now in cited_targets.
-    for source_dir in source_dirs:
-        _load_build_file(source_dir,
-                         processed_source_dirs,
-                         blade)
-
-    for key in target_database:
-        cited_targets.add(key)
-    all_command_targets = list(cited_targets)
-
-    # Starting from targets specified in command line, breath-first
-    # propagate to load BUILD files containing directly and indirectly
-    # dependent targets.  All these targets form related_targets,
-    # which is a subset of target_database created by loading  BUILD files.
-    while cited_targets:
-        target_id = cited_targets.pop()
-        source_dir, target_name = target_id.split(':')
-        if target_id in related_targets:
-            continue
-
-        _load_build_file(source_dir,
-                         processed_source_dirs,
-                         blade)
-
-        if target_id not in target_database:
-            msg = 'Target "//%s" does not exist' % target_id
-            dependent = _find_dependent(target_id, blade)
-            (dependent or console).error(msg)
-            continue
-
-        related_targets[target_id] = target_database[target_id]
-        for key in related_targets[target_id].deps:
-            if key not in related_targets:
-                cited_targets.add(key)
+    # BUILD files are always executed in sorted order, so the diagnostics such
+    # as duplicated targets and source files are stable between runs.
+    source_dirs.sort()
+    global __build_file_evaluator
+    evaluator = _BuildFileEvaluator(_load_jobs_num())
+    __build_file_evaluator = evaluator
+    try:
+        # Load BUILD files in paths, and add all loaded targets into
+        # cited_targets.  Together with above step, we can ensure that all
+        # targets mentioned in the command line are now in cited_targets.
+        evaluator.prefetch(source_dirs)
+        for source_dir in source_dirs:
+            _load_build_file(source_dir,
+                             processed_source_dirs,
+                             blade)
+
+        for key in target_database:
+            cited_targets.add(key)
+        all_command_targets = list(cited_targets)
+
+        # Starting from targets specified in command line, breath-first
+        # propagate to load BUILD files containing directly and indirectly
+        # dependent targets.  All these targets form related_targets,
+        # which is a subset of target_database created by loading  BUILD files.
+        # Targets are processed level by level, so that the BUILD files of each
+        # level can be evaluated in parallel.
+        while cited_targets:
+            level_targets = sorted(cited_targets)
+            cited_targets = set()
+            level_dirs = set(os.path.normpath(t.split(':')[0]) for t in level_targets)
+            evaluator.prefetch(level_dirs - processed_source_dirs - set(['#']))
+            for target_id in level_targets:
+                source_dir, target_name = target_id.split(':')
+                if target_id in related_targets:
+                    continue
+
+                _load_build_file(source_dir,
+                                 processed_source_dirs,
+                                 blade)
+
+                if target_id not in target_database:
+                    msg = 'Target "//%s" does not exist' % target_id
+                    dependent = blade.find_dependent(target_id)
+                    (dependent or console).error(msg)
+                    continue
+
+                related_targets[target_id] = target_database[target_id]
+                for key in related_targets[target_id].deps:
+                    if key not in related_targets:
+                        cited_targets.add(key)
+    finally:
+        evaluator.close()
+        __build_file_evaluator = None
 
     # Iterating to get svn root dirs
     for target_id in related_targets:  # pylint: disable=dict-iter-missing-items
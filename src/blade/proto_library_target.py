@@ -188,8 +188,7 @@ class ProtoLibrary(CcTarget, java_targets.JavaTargetMixIn):
             protoc_plugins.append(p)
             for language, v in iteritems(p.code_generation):
                 for key in v['deps']:
-                    if key not in self.deps:
-                        self.deps.append(key)
+                    self._add_dep(key)
                     protoc_plugin_deps.add(key)
                     if language == 'java':
                         protoc_plugin_java_deps.add(key)
@@ -277,6 +276,15 @@ class ProtoLibrary(CcTarget, java_targets.JavaTargetMixIn):
         java_name = '%s.java' % class_name
         return package_dir, java_name
 
+    def _action_cache_inputs(self):
+        # The generated code also depends on the imported proto files
+        inputs = [self._source_file_path(s) for s in self.srcs]
+        for key in self.expanded_deps:
+            dep = self.target_database[key]
+            if dep.type == 'proto_library':
+                inputs += [dep._source_file_path(s) for s in dep.srcs]
+        return inputs
+
     def protoc_direct_dependencies(self):
         protos = self.attr.get('public_protos')[:]
         for key in self.deps:
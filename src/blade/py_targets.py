@@ -266,6 +266,9 @@ class PythonTest(PythonBinary):
                  main,
                  base,
                  testdata,
+                 cpu,
+                 memory_mb,
+                 retries,
                  kwargs):
         """Init method. """
         super(PythonTest, self).__init__(
@@ -279,6 +282,8 @@ class PythonTest(PythonBinary):
                 kwargs=kwargs)
         self.type = 'py_test'
         self.attr['testdata'] = testdata
+        self._set_test_resources(cpu, memory_mb)
+        self._set_test_retries(retries)
 
 
 def py_test(name=None,
@@ -288,6 +293,9 @@ def py_test(name=None,
             main=None,
             base=None,
             testdata=[],
+            cpu=None,
+            memory_mb=None,
+            retries=None,
             **kwargs):
     """python test. """
     target = PythonTest(
@@ -298,6 +306,9 @@ def py_test(name=None,
             main=main,
             base=base,
             testdata=testdata,
+            cpu=cpu,
+            memory_mb=memory_mb,
+            retries=retries,
             kwargs=kwargs)
     build_manager.instance.register_target(target)
 
@@ -0,0 +1,110 @@
+# Copyright (c) 2026 Tencent Inc.
+# All rights reserved.
+#
+# Date:   October 17, 2026
+
+
+"""
+ A process-wide cache of file system queries.
+
+ Blade queries the same source paths over and over when loading BUILD files,
+ generating rules and preparing tests, and each query is slow on network file
+ systems. The results are cached until `invalidate` is called, which must be done
+ after the file system is changed by blade itself, such as after running ninja.
+
+ Only query paths which are not changed by blade in the middle, such as source
+ files, or build outputs which are queried after the build.
+"""
+
+from __future__ import absolute_import
+
+import errno
+import os
+import threading
+from stat import S_ISDIR, S_ISREG
+
+
+_stats = {}  # {path: os.stat_result or None if not exists}
+_listdirs = {}  # {path: [name]}
+
+# The number of queries and the number of the real system calls
+_queries = 0
+_syscalls = 0
+_counter_lock = threading.Lock()
+
+
+def _count(syscall):
+    global _queries, _syscalls
+    with _counter_lock:
+        _queries += 1
+        if syscall:
+            _syscalls += 1
+
+
+def _stat(path):
+    try:
+        st = _stats[path]
+        _count(False)
+        return st
+    except KeyError:
+        pass
+    try:
+        st = os.stat(path)
+    except OSError:
+        st = None
+    _stats[path] = st
+    _count(True)
+    return st
+
+
+def stat(path):
+    """Cached `os.stat`, return None if the path doesn't exist. """
+    return _stat(path)
+
+
+def exists(path):
+    """Cached `os.path.exists`. """
+    return _stat(path) is not None
+
+
+def isfile(path):
+    """Cached `os.path.isfile`. """
+    st = _stat(path)
+    return st is not None and S_ISREG(st.st_mode)
+
+
+def isdir(path):
+    """Cached `os.path.isdir`. """
+    st = _stat(path)
+    return st is not None and S_ISDIR(st.st_mode)
+
+
+def getmtime(path):
+    """Cached `os.path.getmtime`. """
+    st = _stat(path)
+    if st is None:
+        raise OSError(errno.ENOENT, os.strerror(errno.ENOENT), path)
+    return st.st_mtime
+
+
+def listdir(path):
+    """Cached `os.listdir`, failures are not cached. """
+    names = _listdirs.get(path)
+    if names is not None:
+        _count(False)
+    else:
+        names = os.listdir(path)
+        _listdirs[path] = names
+        _count(True)
+    return list(names)  # The caller may change it
+
+
+def invalidate():
+    """Drop all cached results, call it after the file system is changed. """
+    _stats.clear()
+    _listdirs.clear()
+
+
+def counters():
+    """Return (queries, syscalls). """
+    return _queries, _syscalls
@@ -11,9 +11,11 @@
 
 from __future__ import absolute_import
 
+import json
 import os
 import re
 
+from blade import action_cache
 from blade import config
 from blade import console
 from blade.blade_util import var_to_list, iteritems, source_location, md5sum
@@ -23,6 +25,19 @@ from blade.blade_util import var_to_list, iteritems, source_location, md5sum
 LOCATION_RE = re.compile(r'\$\(location\s+(\S*:\S+)(\s+\w*)?\)')
 
 
+def _entropy_default(obj):
+    """Serialize the objects which are not supported by json in the rule hash entropy. """
+    if isinstance(obj, (set, frozenset)):
+        # The iteration order of sets is unstable across processes
+        return sorted(obj, key=str)
+    return repr(obj)
+
+
+# A stable structured serializer for the rule hash entropy, it is much faster than the
+# pure python encoder with `sort_keys` in python 2, so the entropy items are sorted by caller.
+_ENTROPY_ENCODER = json.JSONEncoder(separators=(',', ':'), default=_entropy_default)
+
+
 def _normalize_one(target, working_dir):
     """Normalize target from command line form into canonical form.
 
@@ -187,7 +202,7 @@ class Target(object):
             entropy.update(self._rule_hash_entropy())
 
             # Sort to make the result stable
-            entropy_str = str(sorted(entropy.items()))
+            entropy_str = _ENTROPY_ENCODER.encode(sorted(entropy.items()))
 
             # Entropy dict can't cantains normal object, because it's default repr contains address,
             # which is changed in different build, so it should not be used as stable hash entropy.
@@ -291,8 +306,7 @@ class Target(object):
             dkey = self._unify_dep(dep)
             if dkey[0] == '#':
                 self._add_system_library(dkey, dep)
-            if dkey not in self.deps:
-                self.deps.append(dkey)
+            self._add_dep(dkey)
             self._implicit_deps.add(dkey)
 
     def _add_system_library(self, key, name):
@@ -345,8 +359,7 @@ class Target(object):
             type = ''
         type = type.strip()
         key = self._unify_dep(key)
-        if key not in self.deps:
-            self.deps.append(key)
+        self._add_dep(key)
         return key, type
 
     def _unify_dep(self, dep):
@@ -391,8 +404,13 @@ class Target(object):
         """
         for d in deps:
             dkey = self._unify_dep(d)
-            if dkey not in self.deps:
-                self.deps.append(dkey)
+            self._add_dep(dkey)
+
+    def _add_dep(self, dkey):
+        """Add a dep key into the deps list and the reverse dependency index."""
+        if dkey not in self.deps:
+            self.deps.append(dkey)
+            self.blade.register_dependency(self, dkey)
 
     def _check_format(self, t):
         """
@@ -460,6 +478,33 @@ class Target(object):
             if key not in self.visibility:
                 self.visibility.append(key)
 
+    def _set_shard_count(self, shard_count):
+        """Set the number of shards to run this test in parallel. """
+        if not isinstance(shard_count, int) or shard_count < 0:
+            self.error('"shard_count" must be a non-negative integer, got %r' % (shard_count,))
+            return
+        if shard_count > 1:
+            self.attr['shard_count'] = shard_count
+
+    def _set_test_retries(self, retries):
+        """Set the max number of times to rerun this test if it failed, see TestScheduler. """
+        if retries is None:
+            return
+        if not isinstance(retries, int) or retries < 0:
+            self.error('"retries" must be a non-negative integer, got %r' % (retries,))
+            return
+        self.attr['test_retries'] = retries
+
+    def _set_test_resources(self, cpu, memory_mb):
+        """Set the resources required to run this test, used to schedule tests. """
+        for name, value in (('cpu', cpu), ('memory_mb', memory_mb)):
+            if value is None:
+                continue
+            if not isinstance(value, (int, float)) or value <= 0:
+                self.error('"%s" must be a positive number, got %r' % (name, value))
+                continue
+            self.attr[name] = value
+
     def _check_deprecated_deps(self):
         """check that whether it depends upon deprecated target.
         It should be overridden in subclass.
@@ -596,18 +641,41 @@ class Target(object):
         """Generate ninja rules for specific target. """
         raise NotImplementedError(self.fullname)
 
+    def _action_cache_inputs(self):
+        """Files which affect the outputs of cacheable actions but are not their inputs.
+
+        Can be override in sub classes, such as the imported files of the generated code.
+        """
+        return []
+
+    def _action_cache_variables(self, outputs, inputs, implicit_deps, variables):
+        """Variables to cache the action in the action cache. """
+        action_inputs = var_to_list(implicit_deps) + self._action_cache_inputs()
+        cache_vars = {'action_key': action_cache.action_key(
+            outputs, var_to_list(inputs) + action_inputs, variables or {})}
+        if action_inputs:
+            cache_vars['action_inputs'] = ' '.join(action_inputs)
+        return cache_vars
+
     def ninja_build(self, rule, outputs, inputs=None,
                     implicit_deps=None, order_only_deps=None,
-                    variables=None, implicit_outputs=None, clean=None):
+                    variables=None, implicit_outputs=None, clean=None, cacheable=False):
         """Generate a ninja build statement with specified parameters.
         Args:
             clean:list[str], files to be removed on clean, defaults to outputs + implicit_outputs,
                 you can pass a empty list to prevent cleaning. (For example, if you want to  remove
                 the entire outer dir instead of single files)
+            cacheable:bool, whether the outputs can be cached in the action cache, the rules in
+                `action_cache.CACHEABLE_RULES` are always cacheable.
             See ninja documents for description for other args.
         """
         outputs = var_to_list(outputs)
         implicit_outputs = var_to_list(implicit_outputs)
+        if ((cacheable or rule in action_cache.CACHEABLE_RULES) and
+                self.blade.get_action_cache_dir()):
+            cache_vars = self._action_cache_variables(outputs, inputs, implicit_deps, variables)
+            cache_vars.update(variables or {})
+            variables = cache_vars
         outs = outputs[:]
         if implicit_outputs:
             outs.append('|')
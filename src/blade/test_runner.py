@@ -20,6 +20,8 @@ import datetime
 import json
 import os
 import re
+import stat
+import threading
 import time
 from collections import namedtuple
 
@@ -27,15 +29,16 @@ from blade import binary_runner
 from blade import config
 from blade import console
 from blade import coverage
-from blade.blade_util import md5sum, iteritems
-from blade.test_scheduler import TestScheduler
-# pylint: disable=unused-import
-from blade.test_scheduler import TestRunResult  # Used by eval
+from blade import stat_cache
+from blade.blade_util import cpu_count, iteritems, md5sum, md5sum_file, memory_available_mb
+from blade.test_scheduler import TestRunResult, TestScheduler
 
 
-# Used by eval when loading test history
-_TEST_HISTORY_FILE = '.blade.test.stamp'
+_TEST_HISTORY_FILE = '.blade.test.history'
+_TEST_HISTORY_RUNS = 10  # Max number of recent runs of each test kept in history
 _TEST_EXPIRE_TIME = 86400  # 1 day
+_TEST_DIGESTS_FILE = '.blade.test.digests'
+_FLAKY_TEST_MIN_RUNS = 5  # Min number of recent runs to decide whether a test is flaky
 
 
 TestJob = namedtuple('TestJob',
@@ -91,32 +94,84 @@ class TestRunner(binary_runner.BinaryRunner):
 
         self.exclude_tests = exclude_tests  # Tests to be excluded
         self.excluded_tests = [] # Tests been excluded
+        self.other_shard_tests = []  # Tests belong to other shards of --shard
         self.unchanged_tests = []
         self.unrepaired_tests = []
         self.repaired_tests = []
         self.new_failed_tests = []
+        self.retried_tests = {}  # dict{key: number of failed attempts} in this run
+        self.flaky_tests = []  # Tests passed after retries in this run
+        self.quarantined_tests = []  # Flaky tests whose failures don't fail the test command
+        self.quarantined_failures = []
 
         # Test history is the key to implement incremental test.
         # It will be loaded from file before test, compared with test jobs,
         # and be updated and saved to file back after test.
         self.test_history_file = os.path.join(self.build_dir, _TEST_HISTORY_FILE)
         self.test_history = {}  # {key, dict{}}
+        self._test_history_records = 0  # Number of records in the history file
+        self._new_test_history_records = []  # Records to be appended to the history file
+
+        # The digests of test related files, shared by all tests.
+        self._dir_digests = {}  # {path: digest}
+        self._content_hash = config.get_item('global_config', 'test_content_hash')
+        self._test_digests_file = os.path.join(self.build_dir, _TEST_DIGESTS_FILE)
+        self._test_digests = {}  # {path: [inode, mtime, size, digest]}
+        self._test_digests_changed = False
 
         self._load_test_history()
         self._update_test_history()
+        if self._content_hash:
+            self._load_test_digests()
 
     def _load_test_history(self):
-        if os.path.exists(self.test_history_file):
-            with open(self.test_history_file) as f:
-                try:
-                    # pylint: disable=eval-used
-                    self.test_history = eval(f.read())
-                except (SyntaxError, NameError, TypeError) as e:
-                    console.debug('Exception when loading test history: %s' % e)
-                    console.warning('Error loading incremental test history, will run full test')
-
-        if 'items' not in self.test_history:
-            self.test_history['items'] = {}
+        """Load the test history.
+
+        The history file is a log of json records, one per line. Each record is either
+        {'env': {...}} for the test related environments, or a test history item with
+        its 'key'. The latest item of a test is its current history, and at most
+        _TEST_HISTORY_RUNS recent items of each test are kept in 'runs'.
+        """
+        self.test_history = {'env': {}, 'items': {}, 'runs': {}}
+        if not os.path.exists(self.test_history_file):
+            return
+        with open(self.test_history_file) as f:
+            try:
+                for line in f:
+                    record = json.loads(line)
+                    if 'env' in record:
+                        self.test_history['env'] = record['env']
+                    else:
+                        self._add_test_history_record(record)
+                    self._test_history_records += 1
+            except (ValueError, KeyError, TypeError) as e:
+                console.debug('Exception when loading test history: %s' % e)
+                console.warning('Error loading incremental test history, will run full test')
+                self.test_history = {'env': {}, 'items': {}, 'runs': {}}
+                self._test_history_records = -1  # Force rewriting
+
+    def _add_test_history_record(self, record):
+        key = record['key']
+        runs = self.test_history['runs'].setdefault(key, [])
+        runs.append(record)
+        del runs[:-_TEST_HISTORY_RUNS]
+        self.test_history['items'][key] = TestHistoryItem(
+                job=TestJob(**record['job']),
+                first_fail_time=record['first_fail_time'],
+                fail_count=record['fail_count'],
+                result=TestRunResult(**record['result']))
+
+    def _update_test_history_item(self, key, item):
+        record = {
+            'key': key,
+            'job': item.job._asdict(),
+            'first_fail_time': item.first_fail_time,
+            'fail_count': item.fail_count,
+            'result': item.result._asdict(),
+            'retries': self.retried_tests.get(key, 0),
+        }
+        self._add_test_history_record(record)
+        self._new_test_history_records.append(record)
 
     def _update_test_history(self):
         old_env = self.test_history.get('env', {})
@@ -130,15 +185,37 @@ class TestRunner(binary_runner.BinaryRunner):
             if old:
                 console.notice('Old environments: %s' % old)
 
+        if new_env != old_env or self._test_history_records == 0:
+            self._new_test_history_records.append({'env': new_env})
         self.test_history['env'] = new_env
         self.env_md5 = md5sum(str(sorted(iteritems(new_env))))
 
     def _save_test_history(self, passed_run_results, failed_run_results):
-        """update test history and save it to file. """
+        """Update test history and append the new records to the history file.
+
+        The file is compacted when there are too many stale records in it.
+        """
         self._merge_passed_run_results_to_history(passed_run_results)
         self._merge_failed_run_results_to_history(failed_run_results)
-        with open(self.test_history_file, 'w') as f:
-            print(str(self.test_history), file=f)
+        records = self._new_test_history_records
+        self._new_test_history_records = []
+        runs = self.test_history['runs']
+        live_records = 1 + sum(len(items) for items in runs.values())
+        if 0 <= self._test_history_records and (
+                self._test_history_records + len(records) <= 2 * live_records + 1000):
+            with open(self.test_history_file, 'a') as f:
+                for record in records:
+                    print(json.dumps(record), file=f)
+            self._test_history_records += len(records)
+            return
+        tmp_path = self.test_history_file + '.tmp'
+        with open(tmp_path, 'w') as f:
+            print(json.dumps({'env': self.test_history['env']}), file=f)
+            for key in sorted(runs):
+                for record in runs[key]:
+                    print(json.dumps(record), file=f)
+        os.rename(tmp_path, self.test_history_file)
+        self._test_history_records = live_records
 
     def _save_test_summary(self, passed_run_results, failed_run_results):
         with open('blade-bin/.blade-test-summary.json', 'w') as f:
@@ -162,6 +239,8 @@ class TestRunner(binary_runner.BinaryRunner):
             summary['failed'] = expand(failed_run_results)
             summary['unrepaired'] = expand(self.unrepaired_tests)
             summary['repaired'] = self.repaired_tests
+            summary['flaky'] = self.flaky_tests
+            summary['quarantined'] = self.quarantined_failures
             summary['unchanged'] = self.unchanged_tests
             summary['excluded'] = self.excluded_tests
             json.dump(summary, f, indent=4)
@@ -172,11 +251,11 @@ class TestRunner(binary_runner.BinaryRunner):
             old = history_items.get(key)
             if old and old.result.exit_code != 0:
                 self.repaired_tests.append(key)
-            history_items[key] = TestHistoryItem(
+            self._update_test_history_item(key, TestHistoryItem(
                     self.test_jobs[key],
                     first_fail_time=0,
                     fail_count=0,
-                    result=run_result)
+                    result=run_result))
 
     def _merge_failed_run_results_to_history(self, run_results):
         history_items = self.test_history['items']
@@ -191,20 +270,82 @@ class TestRunner(binary_runner.BinaryRunner):
             if not old or old.result.exit_code == 0:
                 self.new_failed_tests.append(key)
 
-            history_items[key] = TestHistoryItem(
+            self._update_test_history_item(key, TestHistoryItem(
                     self.test_jobs[key],
                     first_fail_time=first_fail_time,
                     fail_count=fail_count,
-                    result=run_result)
+                    result=run_result))
+
+    def _load_test_digests(self):
+        """Load the cached content digests of test files, see _file_digest."""
+        if os.path.exists(self._test_digests_file):
+            try:
+                with open(self._test_digests_file) as f:
+                    self._test_digests = json.load(f)
+            except ValueError as e:
+                console.debug('Exception when loading test digests: %s' % e)
+
+    def _save_test_digests(self):
+        if not self._test_digests_changed:
+            return
+        tmp_path = self._test_digests_file + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(self._test_digests, f)
+        os.rename(tmp_path, self._test_digests_file)
+        self._test_digests_changed = False
+
+    def _file_digest(self, path, st):
+        """Return the md5 of the content of a file.
+
+        The digest is cached by the (inode, mtime, size) of the file, so the file
+        is read only when it is changed.
+        """
+        key = [st.st_ino, st.st_mtime, st.st_size]
+        cached = self._test_digests.get(path)
+        if cached and cached[:3] == key:
+            return str(cached[3])  # Loaded as unicode under python 2
+        digest = md5sum_file(path)
+        self._test_digests[path] = key + [digest]
+        self._test_digests_changed = True
+        return digest
+
+    def _dir_digest(self, path):
+        """Return the md5 of the names and contents of all files under a directory."""
+        digest = self._dir_digests.get(path)
+        if digest is not None:
+            return digest
+        entries = []
+        for root, dirs, files in os.walk(path):
+            dirs.sort()
+            for name in sorted(files):
+                file_path = os.path.join(root, name)
+                st = stat_cache.stat(file_path)
+                if st and stat.S_ISREG(st.st_mode):
+                    entries.append('%s %s' % (os.path.relpath(file_path, path),
+                                              self._file_digest(file_path, st)))
+        digest = md5sum('\n'.join(entries))
+        self._dir_digests[path] = digest
+        return digest
+
+    def _file_signature(self, path, st):
+        """Return a string which changes when the file is changed."""
+        if not self._content_hash:
+            return str(st.st_mtime) + str(st.st_ctime)
+        if stat.S_ISDIR(st.st_mode):
+            return self._dir_digest(path)
+        return self._file_digest(path, st)
 
     def _get_test_target_md5sum(self, target):
-        """Get test target md5sum. """
-        # pylint: disable=too-many-locals
+        """Get test target md5sum.
+
+        By default, the md5 is calculated from the modification time of the related
+        files, or from their content if `global_config.test_content_hash` is enabled,
+        so that a byte-identical relinking or a touch doesn't trigger the test to rerun.
+        """
         related_file_list = []
         related_file_data_list = []
         test_file_name = os.path.abspath(self._executable(target))
-        if os.path.exists(test_file_name):
-            related_file_list.append(test_file_name)
+        related_file_list.append(test_file_name)
 
         if target.attr.get('dynamic_link'):
             for dep in self._build_targets[target.key].expanded_deps:
@@ -214,9 +355,7 @@ class TestRunner(binary_runner.BinaryRunner):
                     lib_path = os.path.join(self.build_dir,
                                             dep_target.path,
                                             lib_name)
-                    abs_lib_path = os.path.abspath(lib_path)
-                    if os.path.exists(abs_lib_path):
-                        related_file_list.append(abs_lib_path)
+                    related_file_list.append(os.path.abspath(lib_path))
 
         for i in target.attr['testdata']:
             if isinstance(i, tuple):
@@ -231,22 +370,17 @@ class TestRunner(binary_runner.BinaryRunner):
             else:
                 data_target_path = os.path.abspath('%s/%s' % (
                                                    target.path, data_target))
-            if os.path.exists(data_target_path):
-                related_file_data_list.append(data_target_path)
-
-        related_file_list.sort()
-        related_file_data_list.sort()
+            related_file_data_list.append(data_target_path)
 
-        test_target = []
-        test_target_data = []
-        for f in related_file_list:
-            test_target.append(str(os.path.getmtime(f)))
-            test_target.append(str(os.path.getctime(f)))
+        def signature(files):
+            result = []
+            for f in sorted(files):
+                st = stat_cache.stat(f)
+                if st is not None:
+                    result.append(self._file_signature(f, st))
+            return md5sum(''.join(result))
 
-        for f in related_file_data_list:
-            test_target_data.append(str(os.path.getmtime(f)))
-            test_target_data.append(str(os.path.getctime(f)))
-        return md5sum(''.join(test_target)), md5sum(''.join(test_target_data))
+        return signature(related_file_list), signature(related_file_data_list)
 
     def _exclude_test(self, target):
         """Whether exclude this test"""
@@ -263,6 +397,14 @@ class TestRunner(binary_runner.BinaryRunner):
                 return True
         return False
 
+    def _in_shard(self, target):
+        """Whether the test belongs to the shard specified by --shard"""
+        if not self.options.shard:
+            return True
+        index, count = self.options.shard
+        # Use a hash rather than the position, so the shards are stable when tests are added
+        return int(md5sum(target.key), 16) % count == index
+
     def _run_reason(self, target, history, binary_md5, testdata_md5):
         """Return run reason for a given test"""
 
@@ -299,33 +441,102 @@ class TestRunner(binary_runner.BinaryRunner):
 
         return None
 
+    def _flaky_rate(self, key):
+        """The ratio of recent runs in which the test passed after retries. """
+        runs = self.test_history['runs'].get(key, [])
+        if len(runs) < _FLAKY_TEST_MIN_RUNS:
+            return 0
+        flaky_runs = [r for r in runs if r['result']['exit_code'] == 0 and r.get('retries')]
+        return float(len(flaky_runs)) / len(runs)
+
+    def _is_quarantined(self, key):
+        threshold = config.get_item('global_config', 'flaky_test_threshold')
+        return threshold > 0 and self._flaky_rate(key) > threshold
+
+    def _test_targets(self):
+        return [target for target in self._build_targets.values()
+                if target.type.endswith('_test')]
+
+    def _collect_test_job(self, target):
+        """Decide whether to run the test incrementally, return True if it should be run. """
+        if self._exclude_test(target):
+            target.info('is skipped due to --exclude-test')
+            self.excluded_tests.append(target.key)
+            return False
+        if not self._in_shard(target):
+            self.other_shard_tests.append(target.key)
+            return False
+
+        binary_md5, testdata_md5 = self._get_test_target_md5sum(target)
+        history = self.test_history['items'].get(target.key)
+        reason = self._run_reason(target, history, binary_md5, testdata_md5)
+        if self._is_quarantined(target.key):
+            self.quarantined_tests.append(target.key)
+        if reason:
+            self.test_jobs[target.key] = TestJob(
+                    reason=reason,
+                    binary_md5=binary_md5,
+                    testdata_md5=testdata_md5,
+                    env_md5=self.env_md5,
+                    args=self.options.args)
+            return True
+        if history.result.exit_code == 0:
+            self.unchanged_tests.append(target.key)
+        else:
+            self.unrepaired_tests.append(target.key)
+        return False
+
     def _collect_test_jobs(self):
         """Get incremental test run list. """
-        for target in self._build_targets.values():
-            if not target.type.endswith('_test'):
-                continue
-            if self._exclude_test(target):
-                target.info('is skipped due to --exclude-test')
-                self.excluded_tests.append(target.key)
-                continue
+        for target in self._test_targets():
+            self._collect_test_job(target)
+        self._finish_collecting_test_jobs()
 
-            binary_md5, testdata_md5 = self._get_test_target_md5sum(target)
-            history = self.test_history['items'].get(target.key)
-            reason = self._run_reason(target, history, binary_md5, testdata_md5)
-            if reason:
-                self.test_jobs[target.key] = TestJob(
-                        reason=reason,
-                        binary_md5=binary_md5,
-                        testdata_md5=testdata_md5,
-                        env_md5=self.env_md5,
-                        args=self.options.args)
-            else:
-                if history.result.exit_code == 0:
-                    self.unchanged_tests.append(target.key)
-                else:
-                    self.unrepaired_tests.append(target.key)
+    def _finish_collecting_test_jobs(self):
         self.unrepaired_tests.sort(key=lambda x: self.test_history['items'][x].first_fail_time,
                                    reverse=True)
+        if self.other_shard_tests:
+            console.info('Skip %d tests of other shards' % len(self.other_shard_tests))
+
+    def _expected_costs(self, keys):
+        """Return a dict{key: expected cost time} of the tests.
+
+        The cost time of a test without history is estimated as the average of others.
+        """
+        history_items = self.test_history['items']
+        expected_costs = {}
+        for key in keys:
+            history = history_items.get(key)
+            if history:
+                expected_costs[key] = history.result.cost_time
+        if expected_costs:
+            default_cost = sum(expected_costs.values()) / len(expected_costs)
+        else:
+            default_cost = 0
+        for key in keys:
+            expected_costs.setdefault(key, default_cost)
+        return expected_costs
+
+    def _test_priority(self, key, expected_costs):
+        """The priority of a test to be scheduled, smaller is higher.
+
+        Tests failed last time are run first for fast feedback, others are run in the
+        longest-processing-time-first order, according to the cost time in history.
+        """
+        history = self.test_history['items'].get(key)
+        failed = history is not None and history.result.exit_code != 0
+        shard_count = self.target_database[key].attr.get('shard_count', 1)
+        return not failed, -expected_costs[key] / shard_count, key
+
+    def _sort_test_jobs(self):
+        """Sort test jobs in the order to be scheduled, see `_test_priority`.
+
+        Returns:
+            The sorted keys of test jobs and a dict{key: expected cost time}.
+        """
+        expected_costs = self._expected_costs(self.test_jobs)
+        test_keys = sorted(self.test_jobs, key=lambda key: self._test_priority(key, expected_costs))
+        return test_keys, expected_costs
 
     def _generate_coverage_report(self):
         reporter = coverage.JacocoReporter(self.build_dir,
@@ -339,7 +550,8 @@ class TestRunner(binary_runner.BinaryRunner):
         console.notice('{0} {1} {0}'.format('=' * pads, text), prefix=False)
 
     def _is_full_success(self, passed_run_results):
-        return len(passed_run_results) == len(self.test_jobs) + len(self.unrepaired_tests)
+        return (len(passed_run_results) + len(self.quarantined_failures) ==
+                len(self.test_jobs) + len(self.unrepaired_tests))
 
     def _show_tests_list(self, tests, kind, level='info'):
         """Show tests list. """
@@ -421,6 +633,10 @@ class TestRunner(binary_runner.BinaryRunner):
             msg.append('%d cancelled' % cancelled_tests)
         if self.unrepaired_tests:
             msg.append('%d unrepaired' % len(self.unrepaired_tests))
+        if self.flaky_tests:
+            msg.append('%d flaky' % len(self.flaky_tests))
+        if self.quarantined_failures:
+            msg.append('%d quarantined' % len(self.quarantined_failures))
         console.notice(', '.join(msg) + '.')
 
         msg = []
@@ -443,40 +659,74 @@ class TestRunner(binary_runner.BinaryRunner):
                 self._show_run_results(passed_run_results)
         if self.options.show_tests_slower_than is not None:
             self._show_slow_tests(passed_run_results, failed_run_results)
-        if failed_run_results:  # Always show details of failed tests
+        error_run_results = dict((key, result) for key, result in iteritems(failed_run_results)
+                                 if key not in self.quarantined_failures)
+        if error_run_results:  # Always show details of failed tests
             console.error('Failed tests:')
-            self._show_run_results(failed_run_results, is_error=True)
+            self._show_run_results(error_run_results, is_error=True)
         self._show_tests_list(self.repaired_tests, 'repaired')
-        self._show_tests_list(self.new_failed_tests, 'new failed', 'error')
+        self._show_tests_list([key for key in self.new_failed_tests
+                               if key not in self.quarantined_failures], 'new failed', 'error')
+        self._show_tests_list(self.flaky_tests, 'flaky', 'warning')
+        self._show_tests_list(self.quarantined_failures, 'failed but quarantined', 'warning')
         self._show_unrepaired_results()
 
         self._show_tests_summary(passed_run_results, failed_run_results)
 
-    def run(self):
-        """Run all the test target programs. """
-        self._collect_test_jobs()
+    def _test_run_list(self, target):
+        """Return the jobs to run the test, one job for each shard of a sharded test. """
+        test_env = self._prepare_env(target)
+        cmd = [os.path.abspath(self._executable(target))]
+        cmd += self.options.args
+        if console.color_enabled():
+            test_env['GTEST_COLOR'] = 'yes'
+        else:
+            test_env['GTEST_COLOR'] = 'no'
+        test_env['GTEST_OUTPUT'] = 'xml'
+        test_env['HEAPCHECK'] = target.attr.get('heap_check', '')
+        pprof_path = config.get_item('cc_test_config', 'pprof_path')
+        if pprof_path:
+            test_env['PPROF_PATH'] = os.path.abspath(pprof_path)
+        if self.options.coverage:
+            test_env['BLADE_COVERAGE'] = 'true'
+        runfiles_dir = self._runfiles_dir(target)
+        shard_count = target.attr.get('shard_count')
+        if not shard_count:
+            test_env['TEST_TMPDIR'] = self._make_test_tmp_dir(runfiles_dir, 'test')
+            return [(target, runfiles_dir, test_env, cmd, None)]
         tests_run_list = []
-        for target_key in self.test_jobs:
-            target = self.target_database[target_key]
-            test_env = self._prepare_env(target)
-            cmd = [os.path.abspath(self._executable(target))]
-            cmd += self.options.args
-            if console.color_enabled():
-                test_env['GTEST_COLOR'] = 'yes'
-            else:
-                test_env['GTEST_COLOR'] = 'no'
-            test_env['GTEST_OUTPUT'] = 'xml'
-            test_env['HEAPCHECK'] = target.attr.get('heap_check', '')
-            pprof_path = config.get_item('cc_test_config', 'pprof_path')
-            if pprof_path:
-                test_env['PPROF_PATH'] = os.path.abspath(pprof_path)
-            if self.options.coverage:
-                test_env['BLADE_COVERAGE'] = 'true'
-            tests_run_list.append((target, self._runfiles_dir(target), test_env, cmd))
-
-        console.notice('%d tests to run' % len(tests_run_list))
-        console.flush()
-        scheduler = TestScheduler(tests_run_list, self.__test_jobs_num)
+        for index in range(shard_count):
+            shard_env = dict(test_env)
+            # Shards run concurrently in the same runfiles dir, each of them has its own tmp dir
+            shard_env['TEST_TMPDIR'] = self._make_test_tmp_dir(runfiles_dir, 'shard%d' % index)
+            shard_env['GTEST_TOTAL_SHARDS'] = shard_env['TEST_TOTAL_SHARDS'] = str(shard_count)
+            shard_env['GTEST_SHARD_INDEX'] = shard_env['TEST_SHARD_INDEX'] = str(index)
+            shard_env['GTEST_OUTPUT'] = 'xml:test_detail.shard%d.xml' % index
+            tests_run_list.append((target, runfiles_dir, shard_env, cmd, (index, shard_count)))
+        return tests_run_list
+
+    @staticmethod
+    def _make_test_tmp_dir(runfiles_dir, name):
+        """Make an empty tmp dir for a test run in the runfiles dir, return its absolute path.
+
+        It is removed with the other outputs of the last run when the runfiles dir is reused.
+        """
+        path = os.path.abspath(os.path.join(runfiles_dir, '.test_tmp', name))
+        os.makedirs(path)
+        return path
+
+    def _new_scheduler(self, tests_run_list, expected_costs=None, prepare=None):
+        return TestScheduler(tests_run_list, self.__test_jobs_num, expected_costs,
+                             capacity=(cpu_count(), memory_available_mb()),
+                             fail_fast=self.options.fail_fast,
+                             retries=config.get_item('global_config', 'test_retries'),
+                             retry_exclusive=config.get_item('global_config',
+                                                             'test_retry_exclusive'),
+                             quarantined_tests=self.quarantined_tests,
+                             prepare=prepare)
+
+    @staticmethod
+    def _schedule_jobs(scheduler):
         try:
             scheduler.schedule_jobs()
         except KeyboardInterrupt:
@@ -484,7 +734,84 @@ class TestRunner(binary_runner.BinaryRunner):
             console.error('KeyboardInterrupt, all tests stopped')
             console.flush()
 
+    def _run_pipelined(self, build):
+        """Run tests in a scheduler while building them in another thread.
+
+        Returns:
+            The scheduler and the returncode of the build.
+        """
+        ready_tests = set()
+        build_returncode = []
+        # Tests which are ready at the same time are scheduled in the same order as unpipelined
+        expected_costs = self._expected_costs([target.key for target in self._test_targets()])
+
+        def prepare(key):
+            # Called in the scheduling thread, the build thread only reports the ready keys
+            if key in ready_tests:
+                return
+            ready_tests.add(key)
+            target = self.target_database[key]
+            if self._collect_test_job(target):
+                if key in self.quarantined_tests:
+                    scheduler.quarantined_tests.add(key)
+                scheduler.add_jobs(self._test_run_list(target),
+                                   self._test_priority(key, expected_costs))
+
+        scheduler = self._new_scheduler([], prepare=prepare)
+
+        def build_tests():
+            try:
+                returncode = build(scheduler.test_ready)
+                if returncode == 0:
+                    # All tests are ready, include those which are not reported by the build
+                    for target in self._test_targets():
+                        scheduler.test_ready(target.key)
+                build_returncode.append(returncode)
+            finally:
+                scheduler.end_jobs()
+
+        console.notice('Run tests as soon as they are built')
+        console.flush()
+        build_thread = threading.Thread(target=build_tests)
+        build_thread.daemon = True
+        build_thread.start()
+        self._schedule_jobs(scheduler)
+        # Keep signal awareable, see TestScheduler._join_thread
+        while build_thread.is_alive():
+            build_thread.join(1)
+        self._finish_collecting_test_jobs()
+        self._save_test_digests()
+        return scheduler, build_returncode[0] if build_returncode else 1
+
+    def run(self, build=None):
+        """Run all the test target programs.
+
+        Args:
+            build: callable(test_ready), build the tests and call test_ready(key) as soon as a
+                test is built, returns the returncode of the build. If it is specified, tests
+                are run while building, rather than after it.
+        """
+        if build is not None:
+            scheduler, build_returncode = self._run_pipelined(build)
+        else:
+            build_returncode = 0
+            self._collect_test_jobs()
+            self._save_test_digests()
+            test_keys, expected_costs = self._sort_test_jobs()
+            tests_run_list = []
+            for target_key in test_keys:
+                tests_run_list += self._test_run_list(self.target_database[target_key])
+
+            console.notice('%d tests to run' % len(self.test_jobs))
+            console.flush()
+            scheduler = self._new_scheduler(tests_run_list, expected_costs)
+            self._schedule_jobs(scheduler)
+
         passed_run_results, failed_run_results = scheduler.get_results()
+        self.retried_tests = scheduler.retried_tests
+        self.flaky_tests = sorted(key for key in self.retried_tests if key in passed_run_results)
+        self.quarantined_failures = sorted(
+                key for key in self.quarantined_tests if key in failed_run_results)
         self._save_test_history(passed_run_results, failed_run_results)
         self._save_test_summary(passed_run_results, failed_run_results)
         self._show_tests_result(passed_run_results, failed_run_results)
@@ -494,4 +821,6 @@ class TestRunner(binary_runner.BinaryRunner):
             self._generate_coverage_report()
 
 
+        if build_returncode != 0:
+            return build_returncode
         return 0 if self._is_full_success(passed_run_results) else 1
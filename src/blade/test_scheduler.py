@@ -13,20 +13,19 @@
 
 from __future__ import absolute_import
 
+import bisect
+import heapq
 import signal
 import subprocess
+import sys
+import tempfile
 import threading
 import time
 import traceback
-from collections import namedtuple
+from collections import deque, namedtuple
 
-try:
-    import queue
-except ImportError:
-    import Queue as queue
-
-from blade import config
 from blade import console
+from blade.blade_util import iteritems
 
 TestRunResult = namedtuple('TestRunResult', ['exit_code', 'start_time', 'cost_time'])
 
@@ -48,19 +47,138 @@ def _signal_map():
 _SIGNAL_MAP = _signal_map()
 
 
+class JobQueue(object):
+    """A queue of test jobs which dispatches jobs by the available resources.
+
+    Each job requires some cpu and memory, a job is dispatched only when the resources
+    it requires are available. A job which requires more resources than the capacity
+    is dispatched when no other job is running.
+
+    If more jobs are expected, the queue waits for them even if it is empty, until
+    `end_jobs` is called.
+
+    Jobs are dispatched in the order they are put, unless they are put with priorities.
+    """
+
+    def __init__(self, cpu=None, memory_mb=None):
+        """Init method.
+
+        Args:
+            cpu, memory_mb: the capacity of resources, None means unlimited.
+        """
+        self.cpu = cpu
+        self.memory_mb = memory_mb
+        self.jobs = []
+        # The sort key of each job in jobs, (priority is None, priority, sequence)
+        self.orders = []
+        self.sequence = 0
+        self.closed = False
+        self.more_jobs = False
+        self.num_of_running_jobs = 0
+        self.used_cpu, self.used_memory_mb = 0, 0
+        self.cond = threading.Condition()
+
+    @staticmethod
+    def _job_resources(job):
+        target = job[0]
+        return target.attr.get('cpu', 1), target.attr.get('memory_mb', 0)
+
+    def put(self, job, priority=None):
+        """Put a job, jobs with smaller priority values are dispatched first.
+
+        A job without priority is put after all others, jobs with the same priority
+        are dispatched in the order they are put.
+        """
+        with self.cond:
+            self.sequence += 1
+            if priority is None:
+                order = (True, None, self.sequence)
+            else:
+                order = (False, priority, self.sequence)
+            index = bisect.bisect(self.orders, order)
+            self.jobs.insert(index, job)
+            self.orders.insert(index, order)
+            self.cond.notify_all()
+
+    def qsize(self):
+        return len(self.jobs)
+
+    def empty(self):
+        return not self.jobs
+
+    def _fits(self, job):
+        cpu, memory_mb = self._job_resources(job)
+        if self.cpu is not None and self.used_cpu + cpu > self.cpu:
+            return False
+        if self.memory_mb is not None and self.used_memory_mb + memory_mb > self.memory_mb:
+            return False
+        return True
+
+    def _take_job(self):
+        """Take the first job which fits into the available resources. """
+        for index, job in enumerate(self.jobs):
+            if self.num_of_running_jobs == 0 or self._fits(job):
+                del self.jobs[index]
+                del self.orders[index]
+                cpu, memory_mb = self._job_resources(job)
+                self.used_cpu += cpu
+                self.used_memory_mb += memory_mb
+                self.num_of_running_jobs += 1
+                return job
+        return None
+
+    def get(self):
+        """Wait for a job to be dispatched, return None if there is no more job. """
+        with self.cond:
+            while (self.jobs or self.more_jobs) and not self.closed:
+                job = self._take_job()
+                if job is not None:
+                    return job
+                self.cond.wait()
+            return None
+
+    def task_done(self, job):
+        """Release the resources of a finished job. """
+        with self.cond:
+            cpu, memory_mb = self._job_resources(job)
+            self.used_cpu -= cpu
+            self.used_memory_mb -= memory_mb
+            self.num_of_running_jobs -= 1
+            self.cond.notify_all()
+
+    def end_jobs(self):
+        """No more jobs will be put. """
+        with self.cond:
+            self.more_jobs = False
+            self.cond.notify_all()
+
+    def close(self):
+        """Stop dispatching jobs. """
+        with self.cond:
+            self.closed = True
+            self.cond.notify_all()
+
+
 class WorkerThread(threading.Thread):
-    def __init__(self, index, job_queue, job_handler, redirect):
-        """Init methods for this thread. """
+    def __init__(self, index, job_queue, job_handler, redirect, done_event):
+        """Init methods for this thread.
+
+        Args:
+            done_event: threading.Event, be set when this thread is finished.
+        """
         super(WorkerThread, self).__init__()
         self.index = index
         self.running = True
+        self.finished = False
         self.job_queue = job_queue
         self.job_handler = job_handler
         self.redirect = redirect
+        self.done_event = done_event
         self.job_start_time, self.job_timeout = 0, 0
         self.job_process = None
         self.job_name = ''
         self.job_is_timeout = False
+        self.job_timer = None
         self.job_lock = threading.Lock()
         console.debug('Test worker %d starts to work' % self.index)
 
@@ -75,77 +193,168 @@ class WorkerThread(threading.Thread):
 
     def cleanup_job(self):
         """Clean up job data. """
+        if self.job_timer:
+            self.job_timer.cancel()
+            self.job_timer = None
         self.job_start_time, self.job_timeout = 0, 0
         self.job_process = None
         self.job_name = ''
         self.job_is_timeout = False
 
     def set_job_data(self, p, name, timeout):
-        """Set the popen object and name if the job is run in a subprocess. """
-        self.job_process, self.job_name, self.job_timeout = p, name, timeout
-
-    def check_job_timeout(self, now):
-        """Check whether the job is timeout or not.
+        """Set the popen object and name if the job is run in a subprocess.
 
-        This method simply checks job timeout and returns immediately.
-        The caller should invoke this method repeatedly so that a job
-        which takes a very long time would be timeout sooner or later.
+        If the job has a timeout, a timer is started to terminate it when it expires.
         """
-        try:
-            self.job_lock.acquire()
-            if (not self.job_is_timeout and self.job_start_time and
-                    self.job_timeout is not None and
-                    self.job_name and self.job_process is not None):
-                if self.job_start_time + self.job_timeout < now:
-                    self.job_is_timeout = True
-                    console.error('//%s: TIMEOUT\n' % self.job_name)
-                    self.job_process.terminate()
-        finally:
-            self.job_lock.release()
+        with self.job_lock:
+            self.job_process, self.job_name, self.job_timeout = p, name, timeout
+            if timeout is not None:
+                remaining = self.job_start_time + timeout - time.time()
+                self.job_timer = threading.Timer(max(remaining, 0), self._terminate_timeout_job, [p])
+                self.job_timer.daemon = True
+                self.job_timer.start()
+
+    def _terminate_timeout_job(self, p):
+        """Called by the timer when the job is timeout. """
+        with self.job_lock:
+            if self.job_process is not p:  # The job has already finished
+                return
+            self.job_is_timeout = True
+            console.error('//%s: TIMEOUT\n' % self.job_name)
+            try:
+                p.terminate()
+            except OSError:
+                pass
 
     def run(self):
         """executes and runs here. """
         try:
             job_queue = self.job_queue
-            while not job_queue.empty() and self.running:
-                try:
-                    job = job_queue.get_nowait()
-                except queue.Empty:
-                    continue
+            while self.running:
+                job = job_queue.get()
+                if job is None:
+                    break
                 self.job_start_time = time.time()
-                self.job_handler(job, self.redirect, self)
                 try:
-                    self.job_lock.acquire()
-                    self.cleanup_job()
+                    self.job_handler(job, self.redirect, self)
                 finally:
-                    self.job_lock.release()
+                    job_queue.task_done(job)
+                    with self.job_lock:
+                        self.cleanup_job()
         except:  # pylint: disable=bare-except
             traceback.print_exc()
+        finally:
+            self.finished = True
+            self.done_event.set()
 
 
 class TestScheduler(object):
     """Schedule specified tests to be ran in multiple test threads"""
 
-    def __init__(self, tests_list, num_jobs):
-        """init method. """
-        self.tests_list = tests_list
+    def __init__(self, tests_list, num_jobs, expected_costs=None, capacity=(None, None),
+                 fail_fast=0, retries=0, retry_exclusive=False, quarantined_tests=(),
+                 prepare=None):
+        """init method.
+
+        Args:
+            tests_list: list, the tests are run in the order of this list.
+            expected_costs: dict{key: cost time}, the expected cost time of tests,
+                used to predict the makespan of the test run.
+            capacity: (cpu, memory_mb), the resources can be used by concurrent tests,
+                None means unlimited.
+            fail_fast: int, stop running tests after so many tests failed, 0 means never.
+            retries: int, the max number of times to rerun a failed test, can be
+                overridden by the `test_retries` attribute of the test.
+            retry_exclusive: bool, whether rerun failed tests one by one after other tests.
+            quarantined_tests: list, flaky tests whose failures are shown as warnings.
+            prepare: callable(key), if specified, the scheduler is pipelined, tests become
+                ready by `test_ready` while running, until `end_jobs` is called. It is called
+                in the scheduling thread to prepare each ready test and add its jobs by
+                `add_jobs`.
+        """
+        self.tests_list = list(tests_list)
+        self.prepare = prepare
+        self.pipelined = prepare is not None
+        self.ready_keys = deque()  # Ready tests to be prepared
+        self.more_ready_tests = self.pipelined
         self.num_jobs = num_jobs
-
-        self.job_queue = queue.Queue(0)
-        self.exclusive_job_queue = queue.Queue(0)
+        self.expected_costs = expected_costs or {}
+        self.fail_fast = fail_fast
+        self.aborted = False
+        self.retries = retries
+        self.retry_exclusive = retry_exclusive
+        self.quarantined_tests = set(quarantined_tests)
+        self.job_retries = {}  # dict{job name: number of retries}
+        # dict{key: number of failed attempts}, tests which are retried in this run
+        self.retried_tests = {}
+        self.workers = []
+
+        self.job_queue = JobQueue(*capacity)
+        self.job_queue.more_jobs = self.pipelined
+        self.exclusive_job_queue = JobQueue()
 
         self.run_result_lock = threading.Lock()
         # dict{key, {}}
         self.passed_run_results = {}
         self.failed_run_results = {}
+        # dict{key, list(TestRunResult)}, results of finished shards of sharded tests
+        self.shard_run_results = {}
 
         self.num_of_finished_tests = 0
         self.num_of_running_tests = 0
 
+        # Set when any worker thread is finished or any test is ready
+        self.wakeup = threading.Event()
+        self.output_lock = threading.Lock()  # Avoid interleaving outputs of tests
+
     def _get_workers_num(self):
         """get the number of thread workers. """
+        if self.pipelined:
+            return self.num_jobs
         return min(self.job_queue.qsize(), self.num_jobs)
 
+    def _put_job(self, job, priority=None):
+        if job[0].attr.get('exclusive'):
+            self.exclusive_job_queue.put(job, priority)
+        else:
+            self.job_queue.put(job, priority)
+
+    def test_ready(self, key):
+        """A test is ready in a pipelined scheduler.
+
+        It only queues the key, so it is cheap to be called in any thread, such as the
+        one reading the output of the build. The test is prepared in the scheduling thread.
+        """
+        self.ready_keys.append(key)
+        self.wakeup.set()
+
+    def add_jobs(self, jobs, priority=None):
+        """Add jobs to a pipelined scheduler, they are run once there are free workers.
+
+        Args:
+            priority: the priority of the jobs in the queue, see `JobQueue.put`.
+        """
+        with self.run_result_lock:
+            self.tests_list += jobs
+        for job in jobs:
+            self._put_job(job, priority)
+
+    def end_jobs(self):
+        """No more tests will be ready in a pipelined scheduler. """
+        self.more_ready_tests = False
+        self.wakeup.set()
+
+    def _prepare_ready_tests(self):
+        """Prepare the ready tests, called in the scheduling thread. """
+        # Read it before preparing, tests are all ready before it is cleared
+        ended = not self.more_ready_tests
+        while self.ready_keys:
+            key = self.ready_keys.popleft()
+            if not self.aborted:
+                self.prepare(key)
+        if ended:
+            self.job_queue.end_jobs()
+
     def _get_result(self, returncode):
         """translate result from returncode. """
         result = 'SUCCESS'
@@ -159,43 +368,71 @@ class TestScheduler(object):
                 self.num_of_running_tests - done, len(self.tests_list))
 
     def _show_progress(self, cmd):
-        console.info('%s Start %s' % (self._progress(), cmd))
-        if console.verbosity_le('quiet'):
-            console.show_progress_bar(self.num_of_finished_tests, len(self.tests_list))
+        with self.output_lock:
+            console.info('%s Start %s' % (self._progress(), cmd))
+            if console.verbosity_le('quiet'):
+                console.show_progress_bar(self.num_of_finished_tests, len(self.tests_list))
+
+    @staticmethod
+    def _job_name(job):
+        """The name of a job to be shown. """
+        target, shard = job[0], job[4]
+        if shard:
+            return '%s(shard %d/%d)' % (target.key, shard[0], shard[1])
+        return target.key
+
+    def _show_job_output(self, job, output, returncode):
+        """Show the output of a redirected job.
+
+        The output is copied from the file in chunks rather than being read into memory.
+        """
+        test_name = self._job_name(job)
+        msg = 'Output of //%s:' % test_name
+        end_msg = '%s Test //%s finished: %s\n' % (
+            self._progress(done=1), test_name, self._get_result(returncode))
+        output.seek(0)
+        with self.output_lock:
+            if console.verbosity_le('quiet') and returncode != 0:
+                # The failure is not an error if it will be retried or is quarantined
+                if self._can_retry(job) or job[0].key in self.quarantined_tests:
+                    console.warning(msg, prefix=False)
+                else:
+                    console.error(msg, prefix=False)
+                console.copy_output(output, file=sys.stderr)
+                console.output(end_msg, file=sys.stderr)
+            else:
+                console.info(msg)
+                console.copy_output(output, visible=console.verbosity_ge('normal'))
+                console.info(end_msg)
+                console.flush()
 
     def _run_job_redirect(self, job, job_thread):
-        """run job and redirect the output. """
-        target, run_dir, test_env, cmd = job
-        test_name = target.key
+        """run job and redirect the output to a temporary file. """
+        target, run_dir, test_env, cmd, _ = job
+        test_name = self._job_name(job)
         shell = target.attr.get('run_in_shell', False)
         if shell:
             cmd = subprocess.list2cmdline(cmd)
         timeout = target.attr.get('test_timeout')
         self._show_progress(cmd)
-        p = subprocess.Popen(cmd,
-                             env=test_env,
-                             cwd=run_dir,
-                             stdout=subprocess.PIPE,
-                             stderr=subprocess.STDOUT,
-                             close_fds=True,
-                             shell=shell)
-        job_thread.set_job_data(p, test_name, timeout)
-        stdout = p.communicate()[0]
-        result = self._get_result(p.returncode)
-        msg = 'Output of //%s:\n%s%s Test //%s finished: %s\n' % (
-            test_name, stdout, self._progress(done=1), test_name, result)
-        if console.verbosity_le('quiet') and p.returncode != 0:
-            console.error(msg, prefix=False)
-        else:
-            console.info(msg)
-            console.flush()
+        with tempfile.TemporaryFile() as output:
+            p = subprocess.Popen(cmd,
+                                 env=test_env,
+                                 cwd=run_dir,
+                                 stdout=output,
+                                 stderr=subprocess.STDOUT,
+                                 close_fds=True,
+                                 shell=shell)
+            job_thread.set_job_data(p, test_name, timeout)
+            p.wait()
+            self._show_job_output(job, output, p.returncode)
 
         return p.returncode
 
     def _run_job(self, job, job_thread):
         """run job, do not redirect the output. """
-        target, run_dir, test_env, cmd = job
-        test_name = target.key
+        target, run_dir, test_env, cmd, _ = job
+        test_name = self._job_name(job)
         shell = target.attr.get('run_in_shell', False)
         if shell:
             cmd = subprocess.list2cmdline(cmd)
@@ -212,10 +449,11 @@ class TestScheduler(object):
     def _process_job(self, job, redirect, job_thread):
         """process routine.
 
-        Each test is a tuple (target, run_dir, env, cmd)
+        Each test is a tuple (target, run_dir, env, cmd, shard), shard is None or
+        a tuple (index, count) for a shard of a sharded test.
 
         """
-        target = job[0]
+        target, shard = job[0], job[4]
         start_time = time.time()
 
         with self.run_result_lock:
@@ -236,81 +474,210 @@ class TestScheduler(object):
                                    start_time=start_time, cost_time=cost_time)
 
         with self.run_result_lock:
-            if returncode == 0:
+            # Terminated by Ctrl-C or fail fast, treat as cancelled
+            cancelled = not job_thread.running or returncode == -signal.SIGINT
+            if not cancelled and returncode != 0 and self._retry_job(job):
+                self.num_of_running_tests -= 1
+                return
+            if not cancelled and shard:
+                run_result = self._add_shard_result(target.key, shard[1], run_result)
+            if cancelled or run_result is None:  # Or not all shards are finished
+                pass
+            elif run_result.exit_code == 0:
                 self.passed_run_results[target.key] = run_result
-            elif returncode != -signal.SIGINT:  # Treat Ctrl-C ended as cancelled
+            else:
                 self.failed_run_results[target.key] = run_result
+            if not cancelled and returncode != 0:
+                self._check_fail_fast(job_thread)
             self.num_of_running_tests -= 1
             self.num_of_finished_tests += 1
 
+    def _can_retry(self, job):
+        """Whether a job can be retried if it failed. """
+        retries = job[0].attr.get('test_retries', self.retries)
+        return not self.aborted and self.job_retries.get(self._job_name(job), 0) < retries
+
+    def _retry_job(self, job):
+        """Put a failed job back to the queue if it can be retried. """
+        if not self._can_retry(job):
+            return False
+        target = job[0]
+        retries = target.attr.get('test_retries', self.retries)
+        test_name = self._job_name(job)
+        attempt = self.job_retries.get(test_name, 0) + 1
+        self.job_retries[test_name] = attempt
+        self.retried_tests[target.key] = self.retried_tests.get(target.key, 0) + 1
+        console.warning('//%s failed, retry %d/%d' % (test_name, attempt, retries))
+        env = dict(job[2])
+        # Let the test know it is retried, and shuffle gtest cases in another order
+        env['TEST_ATTEMPT'] = str(attempt)
+        env['GTEST_RANDOM_SEED'] = str(attempt)
+        retry_job = (target, job[1], env, job[3], job[4])
+        if self.retry_exclusive or target.attr.get('exclusive'):
+            self.exclusive_job_queue.put(retry_job)
+        else:
+            self.job_queue.put(retry_job)
+        return True
+
+    def _num_of_failed_tests(self):
+        """The number of failed tests, include sharded tests with failed shards. """
+        failed_tests = set(self.failed_run_results)
+        for key, shard_results in iteritems(self.shard_run_results):
+            if any(result.exit_code != 0 for result in shard_results):
+                failed_tests.add(key)
+        return len(failed_tests)
+
+    def _check_fail_fast(self, job_thread):
+        """Stop dispatching jobs and terminate running ones if too many tests failed. """
+        if not self.fail_fast or self.aborted:
+            return
+        num_of_failed_tests = self._num_of_failed_tests()
+        if num_of_failed_tests < self.fail_fast:
+            return
+        self.aborted = True
+        console.error('%d tests failed, stop running tests due to --fail-fast' %
+                      num_of_failed_tests)
+        self.job_queue.close()
+        self.exclusive_job_queue.close()
+        for t in self.workers:
+            if t is not job_thread:
+                t.terminate()
+
+    def _add_shard_result(self, key, shard_count, run_result):
+        """Add the result of a shard, return the merged result if all shards are finished.
+
+        The cost time of the merged result is the sum of all shards, which is the cost to
+        run the test unsharded.
+        """
+        shard_results = self.shard_run_results.setdefault(key, [])
+        shard_results.append(run_result)
+        if len(shard_results) < shard_count:
+            return None
+        return self._merge_shard_results(shard_results)
+
+    @staticmethod
+    def _merge_shard_results(shard_results):
+        exit_code = 0
+        for result in shard_results:
+            if result.exit_code != 0:
+                exit_code = result.exit_code
+                break
+        return TestRunResult(exit_code=exit_code,
+                             start_time=min(r.start_time for r in shard_results),
+                             cost_time=sum(r.cost_time for r in shard_results))
+
+    def _merge_failed_shards(self):
+        """Sharded tests with failed shards are failed, even if other shards are cancelled. """
+        for key, shard_results in iteritems(self.shard_run_results):
+            if key in self.passed_run_results or key in self.failed_run_results:
+                continue
+            if any(result.exit_code != 0 for result in shard_results):
+                self.failed_run_results[key] = self._merge_shard_results(shard_results)
+
     def _join_thread(self, t):
         """Join thread and keep signal awareable"""
         # The Thread.join without timeout will block signals, which makes
         # blade can't be terminated by Ctrl-C
-        while t.isAlive():
+        while t.is_alive():
             t.join(1)
 
     def _wait_worker_threads(self, threads):
-        """Wait for worker threads to complete. """
-        test_timeout = config.get_item('global_config', 'test_timeout')
+        """Wait for worker threads to complete.
+
+        Each worker sets the `wakeup` event when it is finished, so this method
+        returns as soon as the last worker is finished. The timeouts of jobs are
+        checked by timers of workers. Ready tests of a pipelined scheduler are also
+        prepared here when the event is set by `test_ready`.
+        """
         try:
             while threads:
-                time.sleep(1)  # Check every second
-                now = time.time()
-                dead_threads = []
-                for t in threads:
-                    if t.isAlive():
-                        if test_timeout is not None:
-                            t.check_job_timeout(now)
-                    else:
-                        dead_threads.append(t)
-
-                for dt in dead_threads:
-                    threads.remove(dt)
+                self.wakeup.clear()
+                if self.pipelined:
+                    self._prepare_ready_tests()
+                threads[:] = [t for t in threads if not t.finished]
+                if threads:
+                    # The wait without timeout will block signals, see _join_thread
+                    self.wakeup.wait(1)
         except KeyboardInterrupt:
             console.debug('KeyboardInterrupt: Terminate workers...')
+            self.job_queue.close()
+            self.exclusive_job_queue.close()
             for t in threads:
                 t.terminate()
             for t in threads:
                 t.join()
             raise
 
+    def _predict_makespan(self, num_of_workers):
+        """Predict the makespan by simulating the scheduling with the expected costs. """
+        def job_cost(job):
+            cost = self.expected_costs.get(job[0].key, 0)
+            shard = job[4]
+            return cost / shard[1] if shard else cost
+
+        simulator = JobQueue(self.job_queue.cpu, self.job_queue.memory_mb)
+        simulator.jobs = list(self.job_queue.jobs)
+        simulator.orders = list(self.job_queue.orders)
+        running = []  # heap of (finish time, sequence, job)
+        now, sequence = 0.0, 0
+        while simulator.jobs or running:
+            while len(running) < num_of_workers:
+                job = simulator._take_job()  # pylint: disable=protected-access
+                if job is None:
+                    break
+                heapq.heappush(running, (now + job_cost(job), sequence, job))
+                sequence += 1
+            now, _, job = heapq.heappop(running)
+            simulator.task_done(job)
+        makespan = now
+        for job in self.exclusive_job_queue.jobs:
+            makespan += job_cost(job)
+        return makespan
+
     def schedule_jobs(self):
         """scheduler. """
-        if not self.tests_list:
+        if not self.tests_list and not self.pipelined:
             return
 
         for i in self.tests_list:
-            target = i[0]
-            if target.attr.get('exclusive'):
-                self.exclusive_job_queue.put(i)
-            else:
-                self.job_queue.put(i)
+            self._put_job(i)
 
         quiet = console.verbosity_le('quiet')
 
         num_of_workers = self._get_workers_num()
-        if not self.job_queue.empty():
+        # The makespan can't be predicted if tests are added while running
+        predicted_makespan = 0 if self.pipelined else self._predict_makespan(num_of_workers)
+        start_time = time.time()
+        if self.pipelined or not self.job_queue.empty():
             console.info('Spawn %d worker thread(s) to run concurrent tests' % num_of_workers)
 
             redirect = num_of_workers > 1 or quiet
             threads = []
             try:
                 for i in range(num_of_workers):
-                    t = WorkerThread(i, self.job_queue, self._process_job, redirect)
+                    t = WorkerThread(i, self.job_queue, self._process_job, redirect,
+                                     self.wakeup)
+                    self.workers.append(t)
                     t.start()
                     threads.append(t)
             finally:
                 self._wait_worker_threads(threads)
 
-        if not self.exclusive_job_queue.empty():
+        if not self.exclusive_job_queue.empty() and not self.aborted:
             console.info('Spawn 1 worker thread to run exclusive tests')
             last_t = WorkerThread(num_of_workers, self.exclusive_job_queue,
-                                  self._process_job, quiet)
+                                  self._process_job, quiet, self.wakeup)
+            self.workers.append(last_t)
             try:
                 last_t.start()
             finally:
                 self._wait_worker_threads([last_t])
 
+        if self.aborted:
+            self._merge_failed_shards()
+        if predicted_makespan:
+            console.info('Tests makespan: predicted %.2fs, actual %.2fs' % (
+                predicted_makespan, time.time() - start_time))
+
     def get_results(self):
         return self.passed_run_results, self.failed_run_results
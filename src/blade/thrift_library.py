@@ -73,6 +73,15 @@ class ThriftLibrary(CcTarget):
             headers += [h for h in thrift_files if h.endswith('.h')]
         self.attr['generated_hdrs'] = headers
 
+    def _action_cache_inputs(self):
+        # The generated code also depends on the included thrift files
+        inputs = [self._source_file_path(s) for s in self.srcs]
+        for key in self.expanded_deps:
+            dep = self.target_database[key]
+            if dep.type == 'thrift_library':
+                inputs += [dep._source_file_path(s) for s in dep.srcs]
+        return inputs
+
     def _check_thrift_srcs_name(self, srcs):
         """Check whether the thrift file's name ends with .thrift. """
         for src in srcs:
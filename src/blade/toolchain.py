@@ -12,12 +12,13 @@
 from __future__ import absolute_import
 from __future__ import print_function
 
+import json
 import os
 import subprocess
 import tempfile
 
 from blade import console
-from blade.blade_util import var_to_list, iteritems, to_string
+from blade.blade_util import var_to_list, iteritems, md5sum, md5sum_file, to_string
 
 
 class BuildArchitecture(object):
@@ -102,18 +103,85 @@ class BuildArchitecture(object):
         return None
 
 
+# The environment variables and executables which affect the probing results
+_PROBE_ENV_VARS = ['CC', 'CXX', 'LD', 'TOOLCHAIN_DIR', 'JAVA_HOME', 'CUDA_PATH', 'NVCC']
+_PROBE_EXECUTABLES = ['php-config', 'java', 'nvcc', 'ccache', 'distcc']
+
+
+def _find_executable(name):
+    """Find the full path of an executable in PATH, return None if not found."""
+    if os.path.dirname(name):
+        return name if os.path.isfile(name) else None
+    for dir in os.environ.get('PATH', '').split(os.pathsep):
+        path = os.path.join(dir, name)
+        if os.path.isfile(path) and os.access(path, os.X_OK):
+            return path
+    return None
+
+
 class ToolChain(object):
-    """The build platform handles and gets the platform information. """
+    """The build platform handles and gets the platform information.
 
-    def __init__(self):
+    The probing results are cached in the cache_file (if given) across runs, the
+    cache is dropped when any related executable or environment variable changes.
+    Each probe is only run when its result is required.
+    """
+
+    def __init__(self, cache_file=None):
         self.cc = self._get_cc_command('CC', 'gcc')
         self.cxx = self._get_cc_command('CXX', 'g++')
         self.ld = self._get_cc_command('LD', 'g++')
-        self.cc_version = self._get_cc_version()
-        self.php_inc_list = self._get_php_include()
-        self.java_inc_list = self._get_java_include()
-        self.nvcc_version = self._get_nvcc_version()
-        self.cuda_inc_list = self._get_cuda_include()
+        self.__cache_file = cache_file
+        self.__fingerprint = self._probe_fingerprint()
+        self.__probes = self._load_probe_cache()
+        self.__probes_changed = False
+
+    def _probe_fingerprint(self):
+        """Calculate the fingerprint of the environment which the probes depend on."""
+        fingerprint = [(name, os.environ.get(name, '')) for name in _PROBE_ENV_VARS]
+        commands = [self.cc, self.cxx, self.ld, os.environ.get('NVCC', 'nvcc')]
+        for command in commands + _PROBE_EXECUTABLES:
+            path = _find_executable(command.split()[0])
+            if path:
+                path = os.path.realpath(path)
+                fingerprint.append((path, int(os.path.getmtime(path))))
+            else:
+                fingerprint.append((command, None))
+        return md5sum(str(fingerprint))
+
+    def _load_probe_cache(self):
+        if not self.__cache_file or not os.path.exists(self.__cache_file):
+            return {}
+        try:
+            with open(self.__cache_file) as f:
+                cache = json.load(f)
+            if cache['fingerprint'] == self.__fingerprint:
+                return cache['probes']
+        except Exception as e:  # pylint: disable=broad-except
+            console.warning('Error loading %s, ignored. Reason: %s' % (
+                self.__cache_file, str(e)))
+        return {}
+
+    def dump_probe_cache(self):
+        """Write the probing results into the cache file if any probe was run."""
+        if not self.__cache_file or not self.__probes_changed:
+            return
+        cache = {
+            'fingerprint': self.__fingerprint,
+            'probes': self.__probes,
+        }
+        tmp_file = self.__cache_file + '.tmp'
+        with open(tmp_file, 'w') as f:
+            json.dump(cache, f, indent=4, sort_keys=True)
+        os.rename(tmp_file, self.__cache_file)
+        self.__probes_changed = False
+
+    def cached_probe(self, name, probe, *args):
+        """Call probe(*args) only if its result for the name is not cached."""
+        if name not in self.__probes:
+            self.__probes[name] = probe(*args)
+            self.__probes_changed = True
+        return self.__probes[name]
 
     @staticmethod
     def _get_cc_command(env, default):
@@ -239,7 +307,22 @@ class ToolChain(object):
         return self.cc
 
     def get_cc_version(self):
-        return self.cc_version
+        return self.cached_probe('cc_version', self._get_cc_version)
+
+    def get_tool_digest(self, command):
+        """Return the resolved path and the digest of the executable of the command.
+
+        Return None if the executable is not found. The digest is cached by the path, size
+        and modification time of the executable.
+        """
+        path = _find_executable(command.split()[0])
+        if not path:
+            return None
+        path = os.path.realpath(path)
+        st = os.stat(path)
+        digest = self.cached_probe('tool_digest:%s:%s:%s' % (path, st.st_size, int(st.st_mtime)),
+                                   md5sum_file, path)
+        return '%s:%s' % (path, digest)
 
     def cc_is(self, vendor):
         """Is cc is used for C/C++ compilation match vendor. """
@@ -247,38 +330,43 @@ class ToolChain(object):
 
     def get_php_include(self):
         """Returns a list of php include. """
-        return self.php_inc_list
+        return self.cached_probe('php_include', self._get_php_include)
 
     def get_java_include(self):
         """Returns a list of java include. """
-        return self.java_inc_list
+        return self.cached_probe('java_include', self._get_java_include)
 
     def get_nvcc_version(self):
         """Returns nvcc version. """
-        return self.nvcc_version
+        return self.cached_probe('nvcc_version', self._get_nvcc_version)
 
     def get_cuda_include(self):
         """Returns a list of cuda include. """
-        return self.cuda_inc_list
+        return self.cached_probe('cuda_include', self._get_cuda_include)
 
-    def filter_cc_flags(self, flag_list, language='c'):
-        """Filter out the unrecognized compilation flags. """
-        valid_flags, unrecognized_flags = [], []
+    def _is_cc_flag_recognized(self, flag, language):
         # Put compilation output into test.o instead of /dev/null
         # because the command line with '--coverage' below exit
         # with status 1 which makes '--coverage' unsupported
         # echo "int main() { return 0; }" | gcc -o /dev/null -c -x c --coverage - > /dev/null 2>&1
         fd, obj = tempfile.mkstemp('.o', 'filter_cc_flags_test')
+        cmd = ('echo "int main() { return 0; }" | '
+               '%s -o %s -c -x %s -Werror %s - > /dev/null 2>&1' % (
+                   self.cc, obj, language, flag))
+        recognized = subprocess.call(cmd, shell=True) == 0
+        os.remove(obj)
+        os.close(fd)
+        return recognized
+
+    def filter_cc_flags(self, flag_list, language='c'):
+        """Filter out the unrecognized compilation flags. """
+        valid_flags, unrecognized_flags = [], []
         for flag in var_to_list(flag_list):
-            cmd = ('echo "int main() { return 0; }" | '
-                   '%s -o %s -c -x %s -Werror %s - > /dev/null 2>&1' % (
-                       self.cc, obj, language, flag))
-            if subprocess.call(cmd, shell=True) == 0:
+            if self.cached_probe('cc_flag:%s:%s' % (language, flag),
+                                 self._is_cc_flag_recognized, flag, language):
                 valid_flags.append(flag)
             else:
                 unrecognized_flags.append(flag)
-        os.remove(obj)
-        os.close(fd)
         if unrecognized_flags:
             console.warning('config: Unrecognized %s flags: %s' % (
                     language, ', '.join(unrecognized_flags)))
@@ -0,0 +1,148 @@
+# Copyright (c) 2026 Tencent Inc.
+# All rights reserved.
+#
+# Date:   October 17, 2026
+
+
+"""
+ Timing instrumentation of blade, exported as a Chrome trace_event file.
+
+ The file can be viewed by chrome://tracing or https://ui.perfetto.dev.
+ See https://docs.google.com/document/d/1CvAClvFfyA5R-PhYUmn5OOQtYMH4h6I0nSsKchNAySU
+ for the format.
+"""
+
+from __future__ import absolute_import
+from __future__ import print_function
+
+import json
+import os
+import threading
+import time
+
+
+# The process ids in the trace file
+_BLADE_PID = 1
+_NINJA_PID = 2
+
+_enabled = False
+_start_time = time.time()
+_events = []
+_main_thread = threading.current_thread()
+
+
+def enable():
+    """Enable the tracing, spans are not recorded before this call."""
+    global _enabled
+    _enabled = True
+
+
+def enabled():
+    return _enabled
+
+
+def _thread_id():
+    """The tid of the current thread, spans of worker threads are shown in their own rows."""
+    thread = threading.current_thread()
+    return 0 if thread is _main_thread else thread.ident
+
+
+def _microseconds(seconds):
+    return int(seconds * 1000000)
+
+
+def _add_event(name, category, start_time, end_time, pid=_BLADE_PID, tid=0, args=None):
+    event = {
+        'name': name,
+        'cat': category,
+        'ph': 'X',  # Complete event
+        'ts': _microseconds(start_time - _start_time),
+        'dur': _microseconds(end_time - start_time),
+        'pid': pid,
+        'tid': tid,
+    }
+    if args:
+        event['args'] = args
+    _events.append(event)
+
+
+class _Span(object):
+    """Record the time of the code in a `with` block."""
+
+    def __init__(self, name, category, args):
+        self.name = name
+        self.category = category
+        self.args = args
+        self.tid = _thread_id()
+        self.start_time = 0
+
+    def __enter__(self):
+        self.start_time = time.time()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        _add_event(self.name, self.category, self.start_time, time.time(),
+                   tid=self.tid, args=self.args)
+
+
+class _NullSpan(object):
+    """A span which records nothing, used when the tracing is disabled."""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        pass
+
+
+_NULL_SPAN = _NullSpan()
+
+
+def span(name, category='phase', args=None):
+    """Return a context manager to record the time of a code block.
+
+    Example:
+        with trace.span('load'):
+            load_targets()
+    """
+    if not _enabled:
+        return _NULL_SPAN
+    return _Span(name, category, args)
+
+
+def add_ninja_log(entries, ninja_start_time):
+    """Add the build edges from the .ninja_log.
+
+    Args:
+        entries: list of (start_ms, end_ms, output), the time is relative to the start of ninja.
+        ninja_start_time: the time when ninja is started.
+    """
+    if not _enabled:
+        return
+    # Ninja doesn't log which job slot runs an edge, allocate a lane for each
+    # edge so that overlapped edges are shown in different rows.
+    lane_end_times = []
+    for start_ms, end_ms, output in sorted(entries):
+        for tid, end_time in enumerate(lane_end_times):
+            if end_time <= start_ms:
+                break
+        else:
+            tid = len(lane_end_times)
+            lane_end_times.append(0)
+        lane_end_times[tid] = end_ms
+        _add_event(output, 'ninja',
+                   ninja_start_time + start_ms / 1000.0,
+                   ninja_start_time + end_ms / 1000.0,
+                   pid=_NINJA_PID, tid=tid)
+
+
+def dump(path):
+    """Write the trace file."""
+    metadata = [
+        {'name': 'process_name', 'ph': 'M', 'pid': _BLADE_PID, 'args': {'name': 'blade'}},
+        {'name': 'process_name', 'ph': 'M', 'pid': _NINJA_PID, 'args': {'name': 'ninja'}},
+    ]
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump({'traceEvents': metadata + _events, 'displayTimeUnit': 'ms'}, f)
+    os.rename(tmp_path, path)
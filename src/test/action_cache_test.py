@@ -0,0 +1,117 @@
+# Copyright (c) 2026 Tencent Inc.
+# All rights reserved.
+#
+# Date:   October 17, 2026
+
+
+"""
+ This is the test module for the action cache.
+
+"""
+
+
+import os
+import shutil
+import stat
+import tempfile
+
+import blade_test
+
+
+class TestActionCache(blade_test.TargetTest):
+    """Test the action cache. """
+    def setUp(self):
+        """setup method. """
+        self.cache_dir = tempfile.mkdtemp()
+        self.doSetUp('action_cache', full_targets='action_cache:upper action_cache:now',
+                     local_config="global_config(action_cache_dir='%s')\n" % self.cache_dir)
+        self.input_file = os.path.join('action_cache', 'input.txt')
+        with open(self.input_file) as f:
+            self.input_content = f.read()
+
+    def tearDown(self):
+        """tear down method. """
+        with open(os.path.join(self.cur_dir, 'testdata', self.input_file), 'w') as f:
+            f.write(self.input_content)
+        shutil.rmtree(self.cache_dir, ignore_errors=True)
+        blade_test.TargetTest.tearDown(self)
+
+    def _runs(self, name):
+        """Return how many times the command of the gen_rule was run. """
+        with open('build64_release/action_cache_runs.log') as f:
+            return f.read().split().count(name)
+
+    def _output(self, name):
+        return os.path.join('build64_release', 'action_cache', name)
+
+    def _clean(self):
+        self.command = 'clean'
+        self.assertTrue(self.runBlade())
+        self.command = 'build'
+        self.assertFalse(os.path.exists(self._output('upper.txt')))
+
+    def _cache_entries(self):
+        entries = []
+        for root, dirs, files in os.walk(self.cache_dir):
+            entries += [os.path.join(root, d) for d in dirs if root != self.cache_dir]
+        return entries
+
+    def testHitAfterCleanBuild(self):
+        """The outputs are copied from the cache after a clean build. """
+        self.assertTrue(self.runBlade())
+        self._clean()
+        self.assertTrue(self.runBlade())
+        self.assertEqual(1, self._runs('upper'))
+        with open(self._output('upper.txt')) as f:
+            self.assertEqual('HELLO\n', f.read())
+        self.assertEqual(1, os.stat(self._output('upper.txt')).st_nlink)
+
+    def testCacheIsNotShared(self):
+        """Files in the cache are read-only and not affected by the outputs. """
+        self.assertTrue(self.runBlade())
+        entries = self._cache_entries()
+        self.assertEqual(1, len(entries))
+        cached_file = os.path.join(entries[0], '0')
+        self.assertFalse(os.stat(cached_file).st_mode & stat.S_IWUSR)
+        cached_mtime = os.path.getmtime(cached_file)
+        self._clean()
+        self.assertTrue(self.runBlade())
+        self.assertEqual(cached_mtime, os.path.getmtime(cached_file))
+        with open(self._output('upper.txt'), 'w') as f:
+            f.write('modified\n')
+        with open(cached_file) as f:
+            self.assertEqual('HELLO\n', f.read())
+
+    def testNotCacheable(self):
+        """A gen_rule is not cached by default. """
+        self.assertTrue(self.runBlade())
+        self._clean()
+        self.assertTrue(self.runBlade())
+        self.assertEqual(2, self._runs('now'))
+        self.assertEqual(1, os.stat(self._output('now.txt')).st_nlink)
+
+    def testMissAfterInputChanged(self):
+        """The action is run again after its input is changed. """
+        self.assertTrue(self.runBlade())
+        with open(self.input_file, 'w') as f:
+            f.write('world\n')
+        self.assertTrue(self.runBlade())
+        self.assertEqual(2, self._runs('upper'))
+        with open(self._output('upper.txt')) as f:
+            self.assertEqual('WORLD\n', f.read())
+        self.assertEqual(2, len(self._cache_entries()))
+
+    def testNoPartialEntries(self):
+        """Outputs of failed actions are not cached. """
+        self.assertTrue(self.runBlade())
+        self.targets = 'action_cache:broken'
+        self.assertFalse(self.runBlade())
+        entries = self._cache_entries()
+        self.assertEqual(1, len(entries))
+        for entry in entries:
+            self.assertFalse(entry.endswith('.tmp'))
+            self.assertEqual(['0'], os.listdir(entry))
+
+
+if __name__ == '__main__':
+    blade_test.run(TestActionCache)
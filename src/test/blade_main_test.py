@@ -16,22 +16,33 @@ import sys
 import unittest
 
 sys.path.append('..')
+from action_cache_test import TestActionCache
 from cc_binary_test import TestCcBinary
 from cc_library_test import TestCcLibrary
 from cc_plugin_test import TestCcPlugin
 from cc_test_test import TestCcTest
+from dependency_analyzer_test import TestDependencyAnalyzer
 from gen_rule_test import TestGenRule
 from java_test import TestJava
 from lex_yacc_test import TestLexYacc
 from load_builds_test import TestLoadBuilds
+from parallel_load_test import TestParallelLoad
+from pipeline_test import TestPipeline
 from proto_library_test import TestProtoLibrary
 from prebuild_cc_library_test import TestPrebuildCcLibrary
 from query_target_test import TestQuery
 from resource_library_test import TestResourceLibrary
+from rule_hash_index_test import TestRuleHashIndex
+from sharded_ninja_test import TestShardedNinja
+from sharded_test_test import TestShardedTest
+from stat_cache_test import TestStatCache
 from swig_library_test import TestSwigLibrary
 from target_dependency_test import TestDepsAnalyzing
+from verify_history_test import TestVerifyHistory
 
 from html_test_runner import HTMLTestRunner
+from test_history_test import TestTestHistory
+from test_scheduler_test import TestTestScheduler
 from test_target_test import TestTestRunner
 
 
@@ -53,7 +64,18 @@ def _main():
         unittest.defaultTestLoader.loadTestsFromTestCase(TestDepsAnalyzing),
         unittest.defaultTestLoader.loadTestsFromTestCase(TestQuery),
         unittest.defaultTestLoader.loadTestsFromTestCase(TestTestRunner),
-        unittest.defaultTestLoader.loadTestsFromTestCase(TestPrebuildCcLibrary)
+        unittest.defaultTestLoader.loadTestsFromTestCase(TestPrebuildCcLibrary),
+        unittest.defaultTestLoader.loadTestsFromTestCase(TestParallelLoad),
+        unittest.defaultTestLoader.loadTestsFromTestCase(TestDependencyAnalyzer),
+        unittest.defaultTestLoader.loadTestsFromTestCase(TestActionCache),
+        unittest.defaultTestLoader.loadTestsFromTestCase(TestShardedNinja),
+        unittest.defaultTestLoader.loadTestsFromTestCase(TestRuleHashIndex),
+        unittest.defaultTestLoader.loadTestsFromTestCase(TestShardedTest),
+        unittest.defaultTestLoader.loadTestsFromTestCase(TestPipeline),
+        unittest.defaultTestLoader.loadTestsFromTestCase(TestTestScheduler),
+        unittest.defaultTestLoader.loadTestsFromTestCase(TestTestHistory),
+        unittest.defaultTestLoader.loadTestsFromTestCase(TestVerifyHistory),
+        unittest.defaultTestLoader.loadTestsFromTestCase(TestStatCache),
         ])
 
     generate_html = len(sys.argv) > 1 and sys.argv[1].startswith('html')
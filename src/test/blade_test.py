@@ -24,8 +24,12 @@ class TargetTest(unittest.TestCase):
     """base class Test """
 
     def doSetUp(self, path, target='...', full_targets=None,
-                command='build', generate_php=True, **kwargs):
-        """setup method. """
+                command='build', generate_php=True, local_config=None, **kwargs):
+        """setup method.
+
+        Args:
+            local_config: str, the content of BLADE_ROOT.local, which is removed in tearDown.
+        """
         self.command = command
         if full_targets:
             self.targets = full_targets
@@ -39,6 +43,9 @@ class TargetTest(unittest.TestCase):
         self.current_building_path = 'build64_release'
         self.current_source_dir = '.'
         self.build_output_file = 'build_output.txt'
+        if local_config is not None:
+            with open('BLADE_ROOT.local', 'w') as f:
+                f.write(local_config)
 
     def tearDown(self):
         """tear down method. """
@@ -47,6 +54,8 @@ class TargetTest(unittest.TestCase):
         except OSError as e:
             print(e)
             pass
+        if os.path.exists('BLADE_ROOT.local'):
+            os.remove('BLADE_ROOT.local')
 
         os.chdir(self.cur_dir)
 
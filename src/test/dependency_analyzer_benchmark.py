@@ -0,0 +1,42 @@
+# Copyright (c) 2026 Tencent Inc.
+# All rights reserved.
+#
+# Date:   October 17, 2026
+
+
+"""
+ Benchmark of the dependency analyzer over a synthetic target graph.
+
+ Usage: ./run.sh dependency_analyzer_benchmark.py [number_of_targets]
+
+"""
+
+from __future__ import print_function
+
+import sys
+import time
+import unittest
+
+sys.path.append('..')
+from blade import dependency_analyzer
+from dependency_analyzer_test import check_analyzed, generate_targets
+
+
+def main():
+    num_targets = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    targets = generate_targets(num_targets)
+    num_edges = sum(len(t.deps) for t in targets.values())
+    print('%d targets, %d edges' % (len(targets), num_edges))
+
+    start_time = time.time()
+    sorted_keys = dependency_analyzer.analyze_deps(targets)
+    cost_time = time.time() - start_time
+
+    num_expanded = sum(len(t.expanded_deps) for t in targets.values())
+    print('%d expanded deps, analyzed in %.3fs' % (num_expanded, cost_time))
+    check_analyzed(unittest.TestCase('__init__'), targets, sorted_keys)
+    print('Checked')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,139 @@
+# Copyright (c) 2026 Tencent Inc.
+# All rights reserved.
+#
+# Date:   October 17, 2026
+
+
+"""
+ Tests of the dependency analyzer over synthetic target graphs.
+"""
+
+import random
+import sys
+import unittest
+
+import blade_test
+from blade import dependency_analyzer
+
+
+class FakeTarget(object):
+    """The minimal target interface required by the dependency analyzer"""
+
+    def __init__(self, key, deps):
+        self.key = key
+        self.deps = deps
+        self.expanded_deps = None
+        self.dependents = set()
+        self.expanded_dependents = set()
+        self.visibility = 'PUBLIC'
+
+    def _expand_deps_generation(self):
+        pass
+
+
+def generate_targets(num_targets, package_size=1000, max_deps=4, chain_length=2000):
+    """Generate a graph of packages and a long dependency chain.
+
+    Targets depend on lower targets in the same package and the bases of lower
+    packages, which is similar to a real world code base. The chain is deeper
+    than the default python recursion limit.
+    """
+    rng = random.Random(0)
+    targets = {}
+    num_chain = min(chain_length, num_targets)
+    for i in range(num_chain):
+        key = 'chain:%d' % i
+        deps = ['chain:%d' % (i - 1)] if i > 0 else []
+        targets[key] = FakeTarget(key, deps)
+
+    for i in range(num_targets - num_chain):
+        package, index = divmod(i, package_size)
+        key = 'package%d:%d' % (package, index)
+        deps = set()
+        for _ in range(rng.randint(0, max_deps)):
+            if index > 0:
+                deps.add('package%d:%d' % (package, rng.randrange(index)))
+        if package > 0:
+            deps.add('package%d:0' % rng.randrange(package))
+        targets[key] = FakeTarget(key, sorted(deps))
+    return targets
+
+
+def check_analyzed(test, targets, sorted_keys):
+    """Check the invariants of the analyzed targets.
+
+    Every target is sorted after its deps, and in the expanded deps of a target,
+    the expanded deps of each dep come after it, which is required by the link order.
+    """
+    test.assertEqual(len(targets), len(sorted_keys))
+    positions = dict((key, i) for i, key in enumerate(sorted_keys))
+    for key, target in targets.items():
+        expanded_deps = target.expanded_deps
+        test.assertEqual(len(expanded_deps), len(set(expanded_deps)))
+        for dkey in expanded_deps:
+            test.assertLess(positions[dkey], positions[key])
+        dep_positions = dict((dkey, i) for i, dkey in enumerate(expanded_deps))
+        for dkey in target.deps:
+            for indirect_key in targets[dkey].expanded_deps:
+                test.assertLess(dep_positions[dkey], dep_positions[indirect_key])
+
+
+def _recursive_expand_deps(target_id, targets):
+    """The recursive expansion of deps which was used by the dependency analyzer"""
+    target = targets[target_id]
+    if target.expanded_deps is not None:
+        return target.expanded_deps
+    new_deps_list = []
+    for d in target.deps:
+        new_deps_list.append(d)
+        new_deps_list += _recursive_expand_deps(d, targets)
+    result = []
+    deps = set()
+    for dep in reversed(new_deps_list):
+        if dep not in deps:
+            result.append(dep)
+            deps.add(dep)
+    target.expanded_deps = list(reversed(result))
+    return target.expanded_deps
+
+
+class TestDependencyAnalyzer(unittest.TestCase):
+    """Test the dependency analyzer. """
+
+    def testSameAsRecursiveExpansion(self):
+        """The expanded deps are in the same order as the recursive expansion. """
+        targets = generate_targets(5000, package_size=500, chain_length=0)
+        expected_targets = generate_targets(5000, package_size=500, chain_length=0)
+        for key in expected_targets:
+            _recursive_expand_deps(key, expected_targets)
+        sorted_keys = dependency_analyzer.analyze_deps(targets)
+        for key, target in targets.items():
+            self.assertEqual(expected_targets[key].expanded_deps, target.expanded_deps)
+        check_analyzed(self, targets, sorted_keys)
+
+    def testDeepChain(self):
+        """Chains deeper than the recursion limit are expanded in the link order. """
+        length = sys.getrecursionlimit() * 2
+        targets = generate_targets(length, chain_length=length)
+        sorted_keys = dependency_analyzer.analyze_deps(targets)
+        self.assertEqual(['chain:%d' % i for i in range(length)], sorted_keys)
+        self.assertEqual(['chain:%d' % i for i in range(length - 2, -1, -1)],
+                         targets['chain:%d' % (length - 1)].expanded_deps)
+
+    def testLoopDependency(self):
+        """Loop dependency is fatal. """
+        targets = {
+            'a:a': FakeTarget('a:a', ['a:b']),
+            'a:b': FakeTarget('a:b', ['a:c']),
+            'a:c': FakeTarget('a:c', ['a:a']),
+        }
+        self.assertRaises(SystemExit, dependency_analyzer.analyze_deps, targets)
+
+    def testLargeGraph(self):
+        """A graph of packages and a deep chain is analyzed correctly. """
+        targets = generate_targets(20000)
+        check_analyzed(self, targets, dependency_analyzer.analyze_deps(targets))
+
+
+if __name__ == '__main__':
+    blade_test.run(TestDependencyAnalyzer)
@@ -0,0 +1,119 @@
+# Copyright (c) 2026 Tencent Inc.
+# All rights reserved.
+#
+# Date:   October 17, 2026
+
+
+"""
+ This is the test module for evaluating BUILD files in worker processes.
+
+"""
+
+
+import io
+import json
+import os
+import shutil
+
+import blade_test
+
+
+# More than `_PARALLEL_LOAD_THRESHOLD` BUILD files to be evaluated in parallel
+_DIRS_NUM = 20
+
+_MACROS = '''
+def empty_library(name):
+    cc_library(name=name, srcs=glob(['empty*.cpp']), hdrs=[])
+'''
+
+_BUILD = '''include('//parallel_load/macros.bld')
+
+cc_library(name='lib', srcs=glob(['*.cpp']), hdrs=[], deps=%(deps)r)
+cc_library(name='dup', srcs=['lib.cpp'], hdrs=[])
+for i in range(2):
+    cc_library(name='loop%%d' %% i, srcs=[], hdrs=[])
+empty_library('empty')
+'''
+
+
+class TestParallelLoad(blade_test.TargetTest):
+    """Test loading BUILD files in parallel. """
+    def setUp(self):
+        """setup method. """
+        self.doSetUp('parallel_load', command='dump')
+        os.mkdir('parallel_load')
+        with open('parallel_load/macros.bld', 'w') as f:
+            f.write(_MACROS)
+        for i in range(_DIRS_NUM):
+            source_dir = 'parallel_load/d%02d' % i
+            os.mkdir(source_dir)
+            with open(os.path.join(source_dir, 'lib.cpp'), 'w') as f:
+                f.write('int lib%d() { return 0; }\n' % i)
+            deps = ['//parallel_load/d%02d:lib' % (i - 1)] if i else []
+            self._write_build(source_dir, _BUILD % {'deps': deps})
+
+    def tearDown(self):
+        """tear down method. """
+        shutil.rmtree('parallel_load', ignore_errors=True)
+        for path in ('targets.json', 'stderr.txt'):
+            if os.path.exists(path):
+                os.remove(path)
+        blade_test.TargetTest.tearDown(self)
+
+    def _write_build(self, source_dir, content):
+        with open(os.path.join(source_dir, 'BUILD'), 'w') as f:
+            f.write(content)
+
+    def _load(self, jobs):
+        """Load the BUILD files, return (succeeded, targets, diagnostics). """
+        with open('BLADE_ROOT.local', 'w') as f:
+            f.write('global_config(load_jobs=%d)\n' % jobs)
+        if os.path.exists('targets.json'):
+            os.remove('targets.json')
+        ok = self.runBlade('--targets --to-file targets.json 2> stderr.txt')
+        targets = []
+        if ok:
+            with open('targets.json') as f:
+                targets = sorted(json.load(f), key=lambda t: (t['path'], t['name']))
+        with io.open('stderr.txt', encoding='utf-8') as f:
+            diagnostics = [line for line in f if line.startswith('parallel_load/')]
+        return ok, targets, diagnostics
+
+    def testSameAsSerialLoading(self):
+        """Targets and diagnostics are the same as loading serially. """
+        ok, targets, diagnostics = self._load(1)
+        self.assertTrue(ok)
+        self.assertEqual(_DIRS_NUM * 5, len(targets))
+        # The diagnostics are reported in the order of loading with the source locations
+        self.assertEqual('parallel_load/d00/BUILD:4:0: warning: dup: '
+                         '"lib.cpp" is already in srcs of "//parallel_load/d00:lib"\n',
+                         diagnostics[0])
+        self.assertEqual('parallel_load/d00/BUILD:7:0: warning: "glob([\'empty*.cpp\'])" '
+                         'got an empty result. If it is the expected behavior, specify '
+                         '"allow_empty=True" to eliminate this message\n',
+                         diagnostics[1])
+        self.assertEqual(_DIRS_NUM * 2, len(diagnostics))
+        self.assertEqual((ok, targets, diagnostics), self._load(2))
+        self.findCommand(['Spawn 2 processes to evaluate BUILD files'])
+
+    def testUnpicklableArguments(self):
+        """BUILD files which can't be evaluated in worker processes are loaded serially. """
+        self._write_build('parallel_load/d05',
+                          "cc_library(name='lib', srcs=[], hdrs=[], defs=[lambda: 0])\n")
+        ok, targets, diagnostics = self._load(1)
+        self.assertEqual((ok, targets, diagnostics), self._load(2))
+
+    def testParseError(self):
+        """The errors of BUILD files are reported in the order of loading. """
+        for source_dir in ('parallel_load/d05', 'parallel_load/d06'):
+            self._write_build(source_dir, "cc_library(name='lib', srcs=[], hdrs=[])\nerror(\n")
+        for jobs in (1, 2):
+            self.assertFalse(self._load(jobs)[0])
+            with io.open('stderr.txt', encoding='utf-8') as f:
+                errors = [line for line in f if 'Parse error in' in line]
+            self.assertEqual(1, len(errors))
+            self.assertIn('Parse error in parallel_load/d05/BUILD', errors[0])
+
+
+if __name__ == '__main__':
+    blade_test.run(TestParallelLoad)
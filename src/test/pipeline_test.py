@@ -0,0 +1,49 @@
+# Copyright (c) 2026 Tencent Inc.
+# All rights reserved.
+#
+# Date:   October 17, 2026
+
+
+"""
+ This is the test module for running tests in the pipelined mode.
+
+"""
+
+
+import blade_test
+
+
+class TestPipeline(blade_test.TargetTest):
+    """Test blade test --pipeline. """
+    def setUp(self):
+        """setup method. """
+        self.doSetUp('pipeline', command='test')
+
+    def _ready_stamp_inputs(self):
+        with open('build64_release/build.ninja') as f:
+            for line in f:
+                if line.startswith('build build64_release/pipeline/pipeline_test.test_ready:'):
+                    inputs = line.split(':', 1)[1].split('|')[0].split()
+                    self.assertEqual('testready', inputs[0])
+                    return inputs[1:]
+        self.fail('No ready stamp of pipeline_test')
+        return []
+
+    def testReadyStampInputs(self):
+        """The ready stamp depends on the runtime inputs of the test. """
+        self.assertTrue(self.runBlade('--pipeline'))
+        inputs = self._ready_stamp_inputs()
+        self.assertIn('build64_release/pipeline/pipeline_test', inputs)
+        self.assertIn('build64_release/pipeline/libanswer.so', inputs)
+        self.assertIn('build64_release/pipeline/data.txt', inputs)
+        self.findCommand(['All 1 tests passed'])
+
+    def testNoGeneratedTestdataOutsideBuild(self):
+        """Testdata which is not generated in this build is not a ready stamp input. """
+        self.targets = 'pipeline:pipeline_test'
+        self.runBlade('--pipeline')
+        self.assertNotIn('build64_release/pipeline/data.txt', self._ready_stamp_inputs())
+
+
+if __name__ == '__main__':
+    blade_test.run(TestPipeline)
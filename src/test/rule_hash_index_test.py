@@ -0,0 +1,81 @@
+# Copyright (c) 2026 Tencent Inc.
+# All rights reserved.
+#
+# Date:   October 17, 2026
+
+
+"""
+ This is the test module for the index of rule hashes of per-target ninja files.
+
+"""
+
+
+import json
+import os
+
+import blade_test
+
+
+class TestRuleHashIndex(blade_test.TargetTest):
+    """Test the rule hash index. """
+    def setUp(self):
+        """setup method. """
+        self.doSetUp('sharded_a')
+        self.index_file = 'build64_release/.blade_rule_hash.json'
+        self.ninja_files = ['build64_release/sharded_a/b.build.ninja',
+                            'build64_release/sharded_a/g.build.ninja']
+
+    def _index(self):
+        with open(self.index_file) as f:
+            return json.load(f)
+
+    def _stats(self):
+        return [(st.st_ino, st.st_mtime) for st in map(os.stat, self.ninja_files)]
+
+    def testUnchangedTargetsAreNotRead(self):
+        """Per-target ninja files are neither read nor rewritten when the index is up to date. """
+        self.assertTrue(self.runBlade('--stop-after=generate'))
+        self.findCommand(['Generating', self.ninja_files[0]])
+        index = self._index()
+        self.assertEqual(['sharded_a:b', 'sharded_a:g'], sorted(index))
+
+        # The rule hash in the ninja file is not read, so the corruption is not noticed
+        with open(self.ninja_files[0]) as f:
+            content = f.read()
+        with open(self.ninja_files[0], 'w') as f:
+            f.write(content.replace('#RuleHash=', '#RuleHash=corrupted', 1))
+        stats = self._stats()
+
+        self.assertTrue(self.runBlade('--stop-after=generate'))
+        self.findCommand(['Using cached', self.ninja_files[0]])
+        self.findCommand(['Using cached', self.ninja_files[1]])
+        self.assertEqual(stats, self._stats())
+        self.assertEqual(index, self._index())
+
+    def testDeletedNinjaFileIsRegenerated(self):
+        """A deleted per-target ninja file is regenerated. """
+        self.assertTrue(self.runBlade('--stop-after=generate'))
+        index = self._index()
+        os.remove(self.ninja_files[0])
+        self.assertTrue(self.runBlade('--stop-after=generate'))
+        self.findCommand(['Generating', self.ninja_files[0]])
+        self.findCommand(['Using cached', self.ninja_files[1]])
+        self.assertTrue(os.path.exists(self.ninja_files[0]))
+        self.assertEqual(index, self._index())
+
+    def testStaleIndexEntryIsRegenerated(self):
+        """A per-target ninja file is regenerated if its index entry is stale. """
+        self.assertTrue(self.runBlade('--stop-after=generate'))
+        index = self._index()
+        stale_index = dict(index)
+        stale_index['sharded_a:b'] = ['stale', True]
+        with open(self.index_file, 'w') as f:
+            json.dump(stale_index, f)
+        self.assertTrue(self.runBlade('--stop-after=generate'))
+        self.findCommand(['Generating', self.ninja_files[0]])
+        self.findCommand(['Using cached', self.ninja_files[1]])
+        self.assertEqual(index, self._index())
+
+
+if __name__ == '__main__':
+    blade_test.run(TestRuleHashIndex)
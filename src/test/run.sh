@@ -16,7 +16,7 @@ fi
 function cleanup() {
     # Cleanup BLADE_ROOT and BUILDs to avoid ran by 'blade build ...' on upper dirs
     find testdata -name BUILD | xargs rm
-    rm -rf testdata/BLADE_ROOT
+    rm -rf testdata/BLADE_ROOT testdata/BLADE_ROOT.local
 
     # Cleanup generated files
     rm -rf testdata/{BLADE_ROOT,blade-bin,build64_release/} build_output.txt
@@ -0,0 +1,96 @@
+# Copyright (c) 2026 Tencent Inc.
+# All rights reserved.
+#
+# Date:   October 17, 2026
+
+
+"""
+ This is the test module for the sharded ninja manifests.
+
+"""
+
+
+import json
+import os
+import shutil
+
+import blade_test
+
+
+class TestShardedNinja(blade_test.TargetTest):
+    """Test the sharded ninja manifest mode. """
+    def setUp(self):
+        """setup method. """
+        self.doSetUp('sharded_a', full_targets='sharded_a:... sharded_b:...',
+                     local_config="global_config(ninja_manifest_mode='sharded')\n")
+        self.shards_dir = os.path.join('build64_release', '.ninja_shards')
+
+    def tearDown(self):
+        """tear down method. """
+        shutil.copy('sharded_b/BUILD.TEST', 'sharded_b/BUILD')
+        blade_test.TargetTest.tearDown(self)
+
+    def _shard(self, name, ext='ninja'):
+        return os.path.join(self.shards_dir, '%s.%s' % (name, ext))
+
+    def _shard_targets(self, name, ext='ninja'):
+        with open(self._shard(name, ext)) as f:
+            return [line.split('=', 1)[1].strip() for line in f if line.startswith('#Target=')]
+
+    def _index(self):
+        with open(os.path.join(self.shards_dir, 'index.json')) as f:
+            return json.load(f)
+
+    def testOnlyDirtyShardsAreRewritten(self):
+        """Only the shards with changed targets are rewritten. """
+        self.assertTrue(self.runBlade())
+        self.findCommand(['Generating', self._shard('sharded_a')])
+        self.findCommand(['Generating', self._shard('sharded_b')])
+
+        self.assertTrue(self.runBlade())
+        self.findCommand(['Using cached', self._shard('sharded_a')])
+        self.findCommand(['Using cached', self._shard('sharded_b')])
+
+        with open('sharded_b/BUILD', 'a') as f:
+            f.write("gen_rule(name='y', outs=['y.txt'], cmd='echo y > $OUTS')\n")
+        self.assertTrue(self.runBlade())
+        self.findCommand(['Using cached', self._shard('sharded_a')])
+        self.findCommand(['Generating', self._shard('sharded_b')])
+        self.assertEqual(['sharded_b:x', 'sharded_b:y'], sorted(self._shard_targets('sharded_b')))
+        self.assertTrue(os.path.exists('build64_release/sharded_b/y.txt'))
+
+    def testSubsetBuild(self):
+        """Rules of targets which are not in a subset build are kept. """
+        self.assertTrue(self.runBlade())
+        rules_inode = os.stat(self._shard('sharded_a', 'rules')).st_ino
+
+        self.targets = 'sharded_a:b'
+        self.assertTrue(self.runBlade())
+        self.assertEqual(['sharded_a:b'], self._shard_targets('sharded_a'))
+        self.assertEqual(['sharded_a:b', 'sharded_a:g'], sorted(
+                         self._shard_targets('sharded_a', 'rules')))
+        self.assertEqual(['sharded_a:b', 'sharded_a:g'], sorted(self._index()['sharded_a']))
+        self.assertIn('sharded_b', self._index())
+
+        # Back to the full build, the rules of sharded_a:g are reused rather than regenerated
+        self.targets = 'sharded_a:... sharded_b:...'
+        self.assertTrue(self.runBlade())
+        self.findCommand(['Using cached', self._shard('sharded_b')])
+        self.assertEqual(['sharded_a:b', 'sharded_a:g'], sorted(self._shard_targets('sharded_a')))
+        self.assertEqual(rules_inode, os.stat(self._shard('sharded_a', 'rules')).st_ino)
+
+    def testClean(self):
+        """The shard files are removed by clean. """
+        self.assertTrue(self.runBlade())
+        self.command = 'clean'
+        self.assertTrue(self.runBlade())
+        self.assertFalse(os.path.exists(self._shard('sharded_a')))
+        self.assertFalse(os.path.exists(self._shard('sharded_a', 'rules')))
+        self.command = 'build'
+        self.assertTrue(self.runBlade())
+        self.findCommand(['Generating', self._shard('sharded_a')])
+        self.assertTrue(os.path.exists('build64_release/sharded_a/g.txt'))
+
+
+if __name__ == '__main__':
+    blade_test.run(TestShardedNinja)
@@ -0,0 +1,37 @@
+# Copyright (c) 2026 Tencent Inc.
+# All rights reserved.
+#
+# Date:   October 17, 2026
+
+
+"""
+ This is the test module for running sharded tests.
+
+"""
+
+
+import os
+
+import blade_test
+
+
+class TestShardedTest(blade_test.TargetTest):
+    """Test running a test with shard_count. """
+    def setUp(self):
+        """setup method. """
+        self.doSetUp('sharded_test', command='test')
+        self.tmp_dir = 'build64_release/sharded_test/sharded_test.runfiles/.test_tmp'
+
+    def testShardsHaveTheirOwnTmpDirs(self):
+        """Each shard runs with an empty TEST_TMPDIR of its own. """
+        for _ in range(2):  # The tmp dirs of the last run are cleaned
+            self.assertTrue(self.runBlade('--full-test'))
+            self.findCommand(['All 1 tests passed'])
+            self.assertEqual(['shard0', 'shard1', 'shard2'], sorted(os.listdir(self.tmp_dir)))
+            for index in range(3):
+                with open(os.path.join(self.tmp_dir, 'shard%d' % index, 'shard')) as f:
+                    self.assertEqual(str(index), f.read())
+
+
+if __name__ == '__main__':
+    blade_test.run(TestShardedTest)
@@ -0,0 +1,126 @@
+# Copyright (c) 2026 Tencent Inc.
+# All rights reserved.
+#
+# Date:   October 17, 2026
+
+
+"""
+ Tests of the cache of file system queries.
+"""
+
+import errno
+import os
+import shutil
+import tempfile
+import unittest
+
+import blade_test
+from blade import blade_main
+from blade import build_manager
+from blade import stat_cache
+
+
+class _FakeOptions(object):
+    """The options used by `_ninja_build`. """
+    dry_run = False
+    backend_builder_options = ''
+    keep_going = False
+    verbosity = 'normal'
+    show_builds_slower_than = None
+
+
+class _FakeBuildManager(object):
+    """The build manager methods used by `_ninja_build`. """
+    def build_script(self):
+        return 'build.ninja'
+
+    def build_jobs_num(self):
+        return 1
+
+
+class TestStatCache(unittest.TestCase):
+    """Test the stat_cache. """
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, 'file')
+        stat_cache.invalidate()
+
+    def tearDown(self):
+        stat_cache.invalidate()
+        shutil.rmtree(self.dir)
+
+    def _create(self, path):
+        with open(path, 'w') as f:
+            f.write('blade')
+
+    def testQueriesAreCached(self):
+        """Results are cached until invalidated. """
+        queries, syscalls = stat_cache.counters()
+        self.assertFalse(stat_cache.exists(self.path))
+        self._create(self.path)
+        self.assertFalse(stat_cache.exists(self.path))
+        self.assertFalse(stat_cache.isfile(self.path))
+        self.assertEqual((queries + 3, syscalls + 1), stat_cache.counters())
+
+        stat_cache.invalidate()
+        self.assertTrue(stat_cache.exists(self.path))
+        self.assertTrue(stat_cache.isfile(self.path))
+        self.assertFalse(stat_cache.isdir(self.path))
+        self.assertTrue(stat_cache.isdir(self.dir))
+        self.assertEqual(os.path.getmtime(self.path), stat_cache.getmtime(self.path))
+
+    def testStat(self):
+        """Stat returns the cached os.stat_result, or None if the path doesn't exist. """
+        self.assertIsNone(stat_cache.stat(self.path))
+        stat_cache.invalidate()
+        self._create(self.path)
+        queries, syscalls = stat_cache.counters()
+        st = stat_cache.stat(self.path)
+        self.assertEqual(os.stat(self.path).st_size, st.st_size)
+        self.assertIs(st, stat_cache.stat(self.path))
+        self.assertTrue(stat_cache.isfile(self.path))
+        self.assertEqual((queries + 3, syscalls + 1), stat_cache.counters())
+
+    def testGetmtimeOfMissingFile(self):
+        """getmtime raises ENOENT like os.path.getmtime. """
+        try:
+            stat_cache.getmtime(self.path)
+            self.fail('OSError is not raised')
+        except OSError as e:
+            self.assertEqual(errno.ENOENT, e.errno)
+
+    def testListdir(self):
+        """Listdir results are cached and copied, failures are not cached. """
+        self.assertEqual([], stat_cache.listdir(self.dir))
+        self._create(self.path)
+        names = stat_cache.listdir(self.dir)
+        self.assertEqual([], names)
+        names.append('changed')
+        self.assertEqual([], stat_cache.listdir(self.dir))
+        stat_cache.invalidate()
+        self.assertEqual(['file'], stat_cache.listdir(self.dir))
+
+        missing_dir = os.path.join(self.dir, 'dir')
+        self.assertRaises(OSError, stat_cache.listdir, missing_dir)
+        os.mkdir(missing_dir)
+        self.assertEqual([], stat_cache.listdir(missing_dir))
+
+    def testInvalidatedAfterNinja(self):
+        """The build outputs created by ninja are visible after the build. """
+        def run_ninja(cmd, options, test_ready):
+            self._create(self.path)
+            return 0
+        self.assertFalse(stat_cache.exists(self.path))
+        saved_run_ninja, saved_instance = blade_main._run_ninja, build_manager.instance
+        blade_main._run_ninja = run_ninja
+        build_manager.instance = _FakeBuildManager()
+        try:
+            self.assertEqual(0, blade_main._ninja_build(_FakeOptions()))
+        finally:
+            blade_main._run_ninja, build_manager.instance = saved_run_ninja, saved_instance
+        self.assertTrue(stat_cache.exists(self.path))
+
+
+if __name__ == '__main__':
+    blade_test.run(TestStatCache)
@@ -0,0 +1,62 @@
+# Copyright (c) 2026 Tencent Inc.
+# All rights reserved.
+#
+# Date:   October 17, 2026
+
+
+"""
+ This is the test module for the incremental test history.
+
+"""
+
+
+import json
+
+import blade_test
+
+
+class TestTestHistory(blade_test.TargetTest):
+    """Test the test history log. """
+    def setUp(self):
+        """setup method. """
+        self.doSetUp('pipeline', command='test')
+        self.history_file = 'build64_release/.blade.test.history'
+
+    def _records(self):
+        with open(self.history_file) as f:
+            return [json.loads(line) for line in f]
+
+    def testRecordsAreAppended(self):
+        """Each run of a test appends a record, skipped tests append nothing. """
+        self.assertTrue(self.runBlade())
+        records = self._records()
+        self.assertEqual(2, len(records))
+        self.assertIn('env', records[0])
+        self.assertEqual('pipeline:pipeline_test', records[1]['key'])
+        self.assertEqual('NO_HISTORY', records[1]['job']['reason'])
+        self.assertEqual(0, records[1]['result']['exit_code'])
+
+        self.assertTrue(self.runBlade())
+        self.assertEqual(records, self._records())
+
+        self.assertTrue(self.runBlade('--full-test'))
+        new_records = self._records()
+        self.assertEqual(records, new_records[:2])
+        self.assertEqual(3, len(new_records))
+        self.assertEqual('pipeline:pipeline_test', new_records[2]['key'])
+        self.assertEqual('FULL_TEST', new_records[2]['job']['reason'])
+
+    def testCorruptedHistoryIsRewritten(self):
+        """A corrupted history runs full test and is rewritten. """
+        self.assertTrue(self.runBlade())
+        with open(self.history_file, 'a') as f:
+            f.write('{corrupted\n')
+        self.assertTrue(self.runBlade())
+        records = self._records()
+        self.assertEqual(2, len(records))
+        self.assertIn('env', records[0])
+        self.assertEqual('NO_HISTORY', records[1]['job']['reason'])
+
+
+if __name__ == '__main__':
+    blade_test.run(TestTestHistory)
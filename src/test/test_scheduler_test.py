@@ -0,0 +1,179 @@
+# Copyright (c) 2026 Tencent Inc.
+# All rights reserved.
+#
+# Date:   October 17, 2026
+
+
+"""
+ Tests of the test scheduler, which runs real test processes.
+"""
+
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+
+import blade_test
+from blade.test_scheduler import JobQueue, TestScheduler
+
+
+class _FakeTest(object):
+    """A test target with only the attributes used by the scheduler. """
+
+    def __init__(self, name, **attr):
+        self.key = 'scheduler:%s' % name
+        self.attr = attr
+
+    def error(self, msg):
+        raise AssertionError('%s: %s' % (self.key, msg))
+
+
+class TestTestScheduler(unittest.TestCase):
+    """Test the TestScheduler. """
+
+    def setUp(self):
+        self.run_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.run_dir)
+
+    def _job(self, name, script, **attr):
+        """A test job which runs the shell script and records its run interval. """
+        script = ('echo start $(date +%%s%%N) >> %s.log; %s; ret=$?; '
+                  'echo end $(date +%%s%%N) >> %s.log; exit $ret' % (name, script, name))
+        return (_FakeTest(name, **attr), self.run_dir, dict(os.environ),
+                ['sh', '-c', script], None)
+
+    def _intervals(self, name):
+        """Return [(start, end)] of each run of the test. """
+        path = os.path.join(self.run_dir, '%s.log' % name)
+        if not os.path.exists(path):
+            return []
+        with open(path) as f:
+            times = [int(line.split()[1]) for line in f]
+        return list(zip(times[0::2], times[1::2]))
+
+    def _assertNotOverlapped(self, names):
+        intervals = sorted(i for name in names for i in self._intervals(name))
+        for (_, end), (start, _) in zip(intervals, intervals[1:]):
+            self.assertLessEqual(end, start)
+
+    def testResourceLimits(self):
+        """Tests are not run concurrently if their resources exceed the capacity. """
+        jobs = [self._job('heavy%d' % i, 'sleep 0.2', cpu=2) for i in range(3)]
+        jobs.append(self._job('huge', 'sleep 0.2', cpu=16))
+        scheduler = TestScheduler(jobs, num_jobs=4, capacity=(3, None))
+        scheduler.schedule_jobs()
+        passed, failed = scheduler.get_results()
+        self.assertEqual(4, len(passed))
+        self.assertFalse(failed)
+        self._assertNotOverlapped(['heavy0', 'heavy1', 'heavy2', 'huge'])
+
+    def testLightTestsRunConcurrently(self):
+        """Tests fitting into the capacity are run concurrently. """
+        jobs = [self._job('light%d' % i, 'sleep 0.5', cpu=1, memory_mb=100) for i in range(2)]
+        scheduler = TestScheduler(jobs, num_jobs=2, capacity=(2, 200))
+        scheduler.schedule_jobs()
+        (start0, end0), = self._intervals('light0')
+        (start1, end1), = self._intervals('light1')
+        self.assertLess(max(start0, start1), min(end0, end1))
+
+    def testFailFast(self):
+        """No more tests are run after the failure. """
+        jobs = [self._job('fail', 'false'), self._job('pass0', 'true'), self._job('pass1', 'true')]
+        scheduler = TestScheduler(jobs, num_jobs=1, fail_fast=1)
+        scheduler.schedule_jobs()
+        passed, failed = scheduler.get_results()
+        self.assertEqual(['scheduler:fail'], list(failed))
+        self.assertFalse(passed)
+        self.assertFalse(self._intervals('pass0'))
+        self.assertFalse(self._intervals('pass1'))
+
+    def testFailFastTerminatesRunningTests(self):
+        """Running tests are terminated and treated as cancelled. """
+        jobs = [self._job('slow', 'sleep 30'), self._job('fail', 'sleep 0.2; false')]
+        scheduler = TestScheduler(jobs, num_jobs=2, fail_fast=1)
+        scheduler.schedule_jobs()
+        passed, failed = scheduler.get_results()
+        self.assertEqual(['scheduler:fail'], list(failed))
+        self.assertFalse(passed)
+
+    def testRetries(self):
+        """A failed test is retried and passes in the retry. """
+        # Fails unless it is retried
+        jobs = [self._job('flaky', '[ "$TEST_ATTEMPT" = 1 ]'), self._job('fail', 'false')]
+        scheduler = TestScheduler(jobs, num_jobs=2, retries=1)
+        scheduler.schedule_jobs()
+        passed, failed = scheduler.get_results()
+        self.assertEqual(['scheduler:flaky'], list(passed))
+        self.assertEqual(['scheduler:fail'], list(failed))
+        self.assertEqual({'scheduler:flaky': 1, 'scheduler:fail': 1}, scheduler.retried_tests)
+        self.assertEqual(2, len(self._intervals('flaky')))
+        self.assertEqual(2, len(self._intervals('fail')))
+
+    def testRetriesAttribute(self):
+        """The test_retries attribute overrides the global retries. """
+        jobs = [self._job('flaky', '[ "$TEST_ATTEMPT" = 2 ]', test_retries=2)]
+        scheduler = TestScheduler(jobs, num_jobs=1)
+        scheduler.schedule_jobs()
+        passed, failed = scheduler.get_results()
+        self.assertEqual(['scheduler:flaky'], list(passed))
+        self.assertEqual(3, len(self._intervals('flaky')))
+
+    def testRetryExclusive(self):
+        """Failed tests are retried one by one after other tests. """
+        jobs = [self._job('flaky%d' % i, '[ "$TEST_ATTEMPT" = 1 ]') for i in range(2)]
+        jobs.append(self._job('slow', 'sleep 0.5'))
+        scheduler = TestScheduler(jobs, num_jobs=3, retries=1, retry_exclusive=True)
+        scheduler.schedule_jobs()
+        passed, failed = scheduler.get_results()
+        self.assertEqual(3, len(passed))
+        (_, slow_end), = self._intervals('slow')
+        retries = [self._intervals('flaky%d' % i)[1] for i in range(2)]
+        for start, _ in retries:
+            self.assertLessEqual(slow_end, start)
+        retries.sort()
+        self.assertLessEqual(retries[0][1], retries[1][0])
+
+    def testPriorities(self):
+        """Jobs are dispatched by priorities, then in the order they are put. """
+        queue = JobQueue()
+        for name, priority in [('a', None), ('b', 2), ('c', 1), ('d', None), ('e', 1), ('f', 0)]:
+            queue.put(self._job(name, 'true'), priority)
+        queue.end_jobs()
+        names = []
+        job = queue.get()
+        while job is not None:
+            names.append(job[0].key.split(':')[1])
+            queue.task_done(job)
+            job = queue.get()
+        self.assertEqual(['f', 'c', 'e', 'b', 'a', 'd'], names)
+
+    def testPipelined(self):
+        """Ready tests are prepared in the scheduling thread while running. """
+        prepare_threads = []
+
+        def prepare(key):
+            prepare_threads.append(threading.current_thread())
+            name = key.split(':')[1]
+            scheduler.add_jobs([self._job(name, 'true')])
+
+        def build():
+            for i in range(3):
+                scheduler.test_ready('scheduler:test%d' % i)
+            scheduler.end_jobs()
+
+        scheduler = TestScheduler([], num_jobs=2, prepare=prepare)
+        build_thread = threading.Thread(target=build)
+        build_thread.start()
+        scheduler.schedule_jobs()
+        build_thread.join()
+        passed, failed = scheduler.get_results()
+        self.assertEqual(3, len(passed))
+        self.assertFalse(failed)
+        self.assertEqual([threading.current_thread()] * 3, prepare_threads)
+
+
+if __name__ == '__main__':
+    blade_test.run(TestTestScheduler)
@@ -0,0 +1,3 @@
+int Answer() {
+    return 42;
+}
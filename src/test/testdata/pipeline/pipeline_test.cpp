@@ -0,0 +1,15 @@
+#include <stdio.h>
+
+int Answer();
+
+// Fails if the shared library or the generated testdata is not ready
+int main() {
+    FILE* fp = fopen("data.txt", "r");
+    if (fp == NULL) {
+        return 1;
+    }
+    int expected = 0;
+    int n = fscanf(fp, "%d", &expected);
+    fclose(fp);
+    return n == 1 && expected == Answer() ? 0 : 1;
+}
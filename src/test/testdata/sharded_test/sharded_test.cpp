@@ -0,0 +1,35 @@
+#include <dirent.h>
+#include <stdio.h>
+#include <stdlib.h>
+#include <string.h>
+
+// Fails if the tmp dir of the shard doesn't exist or is not empty
+int main() {
+    const char* tmp_dir = getenv("TEST_TMPDIR");
+    const char* shard_index = getenv("TEST_SHARD_INDEX");
+    if (tmp_dir == NULL || shard_index == NULL) {
+        return 1;
+    }
+    DIR* dir = opendir(tmp_dir);
+    if (dir == NULL) {
+        return 1;
+    }
+    struct dirent* entry;
+    while ((entry = readdir(dir)) != NULL) {
+        if (strcmp(entry->d_name, ".") != 0 && strcmp(entry->d_name, "..") != 0) {
+            closedir(dir);
+            return 1;
+        }
+    }
+    closedir(dir);
+
+    char path[4096];
+    snprintf(path, sizeof(path), "%s/shard", tmp_dir);
+    FILE* fp = fopen(path, "w");
+    if (fp == NULL) {
+        return 1;
+    }
+    fprintf(fp, "%s", shard_index);
+    fclose(fp);
+    return 0;
+}
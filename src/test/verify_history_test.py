@@ -0,0 +1,76 @@
+# Copyright (c) 2026 Tencent Inc.
+# All rights reserved.
+#
+# Date:   October 17, 2026
+
+
+"""
+ This is the test module for the header dependency verify history.
+
+"""
+
+
+import os
+import time
+
+import blade_test
+
+
+class TestVerifyHistory(blade_test.TargetTest):
+    """Test the verify history log. """
+    def setUp(self):
+        """setup method. """
+        self.doSetUp('pipeline')
+        self.history_file = 'build64_release/.blade_verify.history'
+        self.answer_inclusion = 'build64_release/pipeline/answer.objs/answer.cpp.H'
+
+    def _records(self):
+        with open(self.history_file) as f:
+            return [line.rstrip('\n').split(' ', 1) for line in f]
+
+    def _history(self):
+        history = {}
+        for mtime, path in self._records():
+            if mtime == '-':
+                history.pop(path, None)
+            else:
+                history[path] = int(mtime)
+        return history
+
+    def testHistoryIsRecorded(self):
+        """The verified inclusion files are recorded with their mtimes. """
+        self.assertTrue(self.runBlade())
+        history = self._history()
+        self.assertEqual(2, len(history))
+        for path, mtime in history.items():
+            self.assertEqual(int(os.path.getmtime(path)), mtime)
+
+    def testOnlyChangesAreAppended(self):
+        """Unchanged inclusion files append nothing, changed ones append a record. """
+        self.assertTrue(self.runBlade())
+        records = self._records()
+        self.assertTrue(self.runBlade())
+        self.assertEqual(records, self._records())
+
+        time.sleep(1)
+        os.utime(os.path.join('pipeline', 'answer.cpp'), None)
+        self.assertTrue(self.runBlade())
+        new_records = self._records()
+        self.assertEqual(records, new_records[:len(records)])
+        self.assertEqual([[str(int(os.path.getmtime(self.answer_inclusion))),
+                           self.answer_inclusion]],
+                         new_records[len(records):])
+
+    def testCorruptedHistoryIsRewritten(self):
+        """A corrupted history is ignored and rewritten. """
+        self.assertTrue(self.runBlade())
+        history = self._history()
+        with open(self.history_file, 'a') as f:
+            f.write('corrupted\n')
+        self.assertTrue(self.runBlade())
+        self.assertEqual([[str(mtime), path] for path, mtime in sorted(history.items())],
+                         self._records())
+
+
+if __name__ == '__main__':
+    blade_test.run(TestVerifyHistory)